@@ -0,0 +1,223 @@
+# archive.py
+"""
+Raw payload archive: gzip-compressed NDJSON files partitioned by UTC date, plus a manifest.
+
+Layout:
+  data/archive/dt=2025-11-13/raw_coingecko_20251113T135826Z.ndjson.gz
+  data/archive/manifest.jsonl   <- one line per archived file
+
+Each manifest line records path (relative to the archive root), record count, byte size,
+the min/max `last_updated` of the records and when the file was written. "Latest file"
+and time-range lookups read the manifest only; data directories are never listed.
+"""
+
+import os
+import json
+import gzip
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+ARCHIVE_DIR = os.path.join("data", "archive")
+MANIFEST_NAME = "manifest.jsonl"
+COMPRESS_LEVEL = int(os.getenv("RAW_ARCHIVE_COMPRESSLEVEL", "6"))
+
+_manifest_lock = threading.Lock()
+
+
+def manifest_path(root: str = ARCHIVE_DIR) -> str:
+    return os.path.join(root, MANIFEST_NAME)
+
+
+class ArchiveWriter:
+    """
+    Streams records into one archive file and appends its manifest entry on close().
+    Usable as a context manager; records can be written one page at a time. If the block
+    raises, the partial file is discarded and never reaches the manifest.
+    """
+
+    def __init__(self, root: str = ARCHIVE_DIR, prefix: str = "raw_coingecko", now: Optional[datetime] = None):
+        now = now or datetime.now(tz=timezone.utc)
+        self.root = root
+        self.written_at = now
+        partition = f"dt={now.strftime('%Y-%m-%d')}"
+        stem = f"{prefix}_{now.strftime('%Y%m%dT%H%M%SZ')}"
+        os.makedirs(os.path.join(root, partition), exist_ok=True)
+        # claim a unique file name (several writers may start within the same second)
+        for n in range(1000):
+            fname = f"{stem}.ndjson.gz" if n == 0 else f"{stem}-{n}.ndjson.gz"
+            try:
+                raw_fh = open(os.path.join(root, partition, fname), "xb")
+                break
+            except FileExistsError:
+                continue
+        else:
+            raise FileExistsError(f"Could not claim an archive file name for {stem}")
+        self.relpath = os.path.join(partition, fname)
+        self.path = os.path.join(root, self.relpath)
+        self._fh = gzip.open(raw_fh, "wt", encoding="utf-8", compresslevel=COMPRESS_LEVEL)
+        self._raw_fh = raw_fh
+        self.records = 0
+        self.min_time: Optional[str] = None
+        self.max_time: Optional[str] = None
+        self.entry: Optional[Dict[str, Any]] = None
+
+    def write(self, rec: Dict[str, Any]) -> None:
+        self._fh.write(json.dumps(rec, ensure_ascii=False))
+        self._fh.write("\n")
+        self.records += 1
+        ts = rec.get("last_updated") if isinstance(rec, dict) else None
+        if isinstance(ts, str):
+            # CoinGecko timestamps share one ISO format, so string order is time order
+            if self.min_time is None or ts < self.min_time:
+                self.min_time = ts
+            if self.max_time is None or ts > self.max_time:
+                self.max_time = ts
+
+    def write_many(self, records: Iterable[Dict[str, Any]]) -> None:
+        for rec in records:
+            self.write(rec)
+
+    def close(self) -> Dict[str, Any]:
+        if self.entry is not None:
+            return self.entry
+        self._fh.close()
+        self._raw_fh.close()
+        self.entry = {
+            "path": self.relpath,
+            "records": self.records,
+            "bytes": os.path.getsize(self.path),
+            "min_time": self.min_time,
+            "max_time": self.max_time,
+            "written_at": self.written_at.isoformat(),
+        }
+        append_manifest(self.entry, self.root)
+        return self.entry
+
+    def discard(self) -> None:
+        """Drop an unfinished file without a manifest entry (e.g. the fetch failed midway)."""
+        if self.entry is not None:
+            return
+        try:
+            self._fh.close()
+        except Exception:
+            pass
+        self._raw_fh.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.discard()
+        else:
+            self.close()
+
+
+def append_manifest(entry: Dict[str, Any], root: str = ARCHIVE_DIR) -> None:
+    os.makedirs(root, exist_ok=True)
+    line = json.dumps(entry) + "\n"
+    with _manifest_lock:
+        # single small append per file; O_APPEND keeps lines intact across processes
+        with open(manifest_path(root), "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+def write_archive(records: Iterable[Dict[str, Any]], root: str = ARCHIVE_DIR, prefix: str = "raw_coingecko") -> str:
+    """Write a full payload in one go; returns the archive file path."""
+    with ArchiveWriter(root=root, prefix=prefix) as w:
+        w.write_many(records)
+    return w.path
+
+
+def iter_manifest(root: str = ARCHIVE_DIR) -> Iterator[Dict[str, Any]]:
+    try:
+        with open(manifest_path(root), "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+    except FileNotFoundError:
+        return
+
+
+def latest_entry(root: str = ARCHIVE_DIR) -> Optional[Dict[str, Any]]:
+    """Last manifest entry, read from the tail of the manifest file."""
+    try:
+        with open(manifest_path(root), "rb") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            block = 4096
+            while True:
+                start = max(0, size - block)
+                f.seek(start)
+                lines = f.read(size - start).splitlines()
+                # the first line may be cut unless we read from the start of the file
+                complete = lines if start == 0 else lines[1:]
+                for line in reversed(complete):
+                    if line.strip():
+                        return json.loads(line)
+                if start == 0:
+                    return None
+                block *= 4
+    except FileNotFoundError:
+        return None
+
+
+def _entry_times(entry: Dict[str, Any]):
+    lo = entry.get("min_time") or entry.get("written_at")
+    hi = entry.get("max_time") or entry.get("written_at")
+    return parse_ts(lo), parse_ts(hi)
+
+
+def parse_ts(value) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        return value
+    dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def find_entries(since=None, until=None, root: str = ARCHIVE_DIR) -> List[Dict[str, Any]]:
+    """Manifest entries whose record time range overlaps [since, until] (ISO strings or datetimes)."""
+    since, until = parse_ts(since), parse_ts(until)
+    out = []
+    for entry in iter_manifest(root):
+        lo, hi = _entry_times(entry)
+        if since is not None and hi is not None and hi < since:
+            continue
+        if until is not None and lo is not None and lo > until:
+            continue
+        out.append(entry)
+    return out
+
+
+def entry_path(entry: Dict[str, Any], root: str = ARCHIVE_DIR) -> str:
+    return os.path.join(root, entry["path"])
+
+
+def iter_records(path: str) -> Iterator[Dict[str, Any]]:
+    """Stream records from an archive file (.ndjson.gz / .ndjson) or a legacy JSON array file."""
+    if path.endswith(".gz"):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    elif path.endswith(".ndjson"):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, list):
+            raise ValueError(f"Expected JSON list (array) in {path}, got {type(data)}")
+        yield from data
+
+
+def read_records(path: str) -> List[Dict[str, Any]]:
+    return list(iter_records(path))
@@ -0,0 +1,281 @@
+# backfill.py
+"""
+Backfill crypto_price_snapshots from the raw archive.
+- Finds raw files in a time range (archive manifest + legacy data/raw_coingecko_*.json)
+- Transforms them in a process pool and loads them through a bounded set of DB connections
+- Records finished files in a checkpoint file so an interrupted backfill resumes where it stopped
+- Loads are idempotent on the (symbol, snapshot_time) unique key, so replaying a file is safe
+
+--history instead pulls price history from the API (/coins/{id}/market_chart/range), for
+new coins or gaps the archive does not cover: the range is cut into windows per coin,
+fetched concurrently under the shared rate limiter, and each finished (coin, window) is
+checkpointed.
+
+Usage:
+  python backfill.py --since 2025-11-01 --until 2025-11-30 --workers 4 --db-workers 2
+  python backfill.py --history --ids bitcoin,solana --since 2025-01-01 --workers 4
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import threading
+from glob import glob
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import archive
+
+CHECKPOINT_PATH = os.path.join("data", "backfill_checkpoint.json")
+HISTORY_CHECKPOINT_PATH = os.path.join("data", "backfill_history_checkpoint.json")
+LEGACY_GLOB = os.path.join("data", "raw_coingecko_*.json")
+_LEGACY_TS = re.compile(r"raw_coingecko_(\d{8}T\d{6}Z)\.json$")
+
+
+class Checkpoint:
+    """
+    Small JSON file of finished work items (file paths, or later (coin, window) keys).
+    Writes are atomic (temp file + rename) and thread-safe.
+    """
+
+    def __init__(self, path: str = CHECKPOINT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self.done: Dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.done = json.load(f).get("done", {})
+
+    def is_done(self, key: str) -> bool:
+        return key in self.done
+
+    def mark_done(self, key: str, **info) -> None:
+        with self._lock:
+            self.done[key] = dict(info, finished_at=datetime.now(tz=timezone.utc).isoformat())
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"done": self.done}, f)
+            os.replace(tmp, self.path)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.done = {}
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+def find_raw_files(since=None, until=None, root: str = archive.ARCHIVE_DIR,
+                   legacy_glob: str = LEGACY_GLOB) -> List[str]:
+    """Raw files overlapping [since, until]: archive entries via the manifest, plus legacy flat JSON files."""
+    since_dt, until_dt = archive.parse_ts(since), archive.parse_ts(until)
+    paths = [archive.entry_path(e, root) for e in archive.find_entries(since_dt, until_dt, root)]
+    for path in sorted(glob(legacy_glob)):
+        m = _LEGACY_TS.search(path)
+        if not m:
+            continue
+        ts = datetime.strptime(m.group(1), "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc)
+        if (since_dt is None or ts >= since_dt) and (until_dt is None or ts <= until_dt):
+            paths.append(path)
+    return paths
+
+
+def _transform_file(path: str):
+    # runs in a worker process
+    from transform import transform_market_response
+    t0 = time.perf_counter()
+    records = archive.read_records(path)
+    df = transform_market_response(records) if records else None
+    return path, df, len(records), os.path.getsize(path), time.perf_counter() - t0
+
+
+def _load_frame(df, method: Optional[str], **kwargs):
+    from load import upsert_df
+    t0 = time.perf_counter()
+    counts = upsert_df(df, method=method, **kwargs) if df is not None else {"inserted": 0, "updated": 0, "skipped": 0}
+    return counts, time.perf_counter() - t0
+
+
+def backfill(paths: List[str], workers: int = 4, db_workers: int = 2, method: Optional[str] = None,
+             checkpoint: Optional[Checkpoint] = None) -> dict:
+    """
+    Transform `paths` in `workers` processes and load them on at most `db_workers` connections.
+    At most workers + db_workers files are in flight (being transformed, or transformed and
+    waiting for / in a load), so at most that many frames are held in memory at once.
+    A file that fails to transform or load is reported and left unchecked for the next run.
+    """
+    checkpoint = checkpoint or Checkpoint()
+    todo = [p for p in paths if not checkpoint.is_done(p)]
+    print(f"Backfill: {len(paths)} files in range, {len(paths) - len(todo)} already done, {len(todo)} to go.")
+    totals = {"files": 0, "failed": 0, "records": 0, "rows": 0, "inserted": 0, "updated": 0, "skipped": 0}
+    failed: List[Tuple[str, str]] = []
+    t_start = time.perf_counter()
+    pending = iter(todo)
+
+    with ProcessPoolExecutor(max_workers=workers) as tpool, ThreadPoolExecutor(max_workers=db_workers) as lpool:
+        transforms = {}
+        loads = {}
+
+        def submit_transforms():
+            # keep the transform pool busy, but never let finished frames pile up behind the loaders
+            while len(transforms) < workers and len(transforms) + len(loads) < workers + db_workers:
+                path = next(pending, None)
+                if path is None:
+                    return
+                transforms[tpool.submit(_transform_file, path)] = path
+
+        def fail(path, e):
+            totals["failed"] += 1
+            failed.append((path, f"{type(e).__name__}: {e}"))
+            print(f"  {path}: FAILED ({type(e).__name__}: {e})")
+
+        submit_transforms()
+        while transforms or loads:
+            done, _ = wait(set(transforms) | set(loads), return_when=FIRST_COMPLETED)
+            for fut in done:
+                if fut in transforms:
+                    path = transforms.pop(fut)
+                    try:
+                        path, df, n_records, n_bytes, t_transform = fut.result()
+                    except Exception as e:  # corrupt / unreadable file
+                        fail(path, e)
+                        continue
+                    rows = 0 if df is None else len(df)
+                    loads[lpool.submit(_load_frame, df, method)] = (path, n_records, n_bytes, rows, t_transform)
+                else:
+                    path, n_records, n_bytes, rows, t_transform = loads.pop(fut)
+                    try:
+                        counts, t_load = fut.result()
+                    except Exception as e:
+                        fail(path, e)
+                        continue
+                    checkpoint.mark_done(path, records=n_records, rows=rows, **counts)
+                    totals["files"] += 1
+                    totals["records"] += n_records
+                    totals["rows"] += rows
+                    for k in ("inserted", "updated", "skipped"):
+                        totals[k] += counts[k]
+                    print(f"  {path}: {n_records} records, {n_bytes / 1e6:.2f} MB, "
+                          f"transform {t_transform:.2f}s ({n_records / max(t_transform, 1e-9):,.0f} rec/s), "
+                          f"load {t_load:.2f}s ({rows / max(t_load, 1e-9):,.0f} rows/s)")
+            submit_transforms()
+
+    elapsed = time.perf_counter() - t_start
+    totals["seconds"] = round(elapsed, 3)
+    totals["rows_per_second"] = round(totals["rows"] / elapsed, 1) if elapsed > 0 else None
+    print(f"Backfill done: {totals['files']} files, {totals['rows']} rows in {elapsed:.2f}s "
+          f"({totals['rows_per_second']} rows/s); "
+          f"{totals['inserted']} inserted, {totals['updated']} updated, {totals['skipped']} skipped.")
+    if failed:
+        print(f"{len(failed)} file(s) failed and will be retried on the next run:")
+        for path, error in failed:
+            print(f"  {path}: {error}")
+    return totals
+
+
+def history_key(coin_id: str, start: datetime, end: datetime, vs_currency: str = "usd") -> str:
+    return f"history:{coin_id}:{vs_currency}:{start.isoformat()}:{end.isoformat()}"
+
+
+def backfill_history(ids: List[str], since: datetime, until: datetime, window_days: Optional[int] = None,
+                     workers: int = 4, method: Optional[str] = None, vs_currency: str = "usd",
+                     checkpoint: Optional[Checkpoint] = None) -> dict:
+    """
+    Fetch market_chart history for ids over [since, until) and load it. Windows are fetched
+    on `workers` threads while this thread transforms and loads whatever finished; a window
+    is checkpointed once its rows are committed, so a rerun only fetches what is left.
+    Failed windows are reported and left unchecked for the next run.
+    """
+    from extract_coingecko import CHART_WINDOW_DAYS, iter_history_windows, split_windows
+    from transform import transform_market_chart
+    window_days = window_days or CHART_WINDOW_DAYS
+    checkpoint = checkpoint or Checkpoint(HISTORY_CHECKPOINT_PATH)
+    windows = split_windows(since, until, window_days)
+    n_windows = len(ids) * len(windows)
+    totals = {"windows": 0, "failed": 0, "rows": 0, "inserted": 0, "updated": 0, "skipped": 0}
+    failed: List[Tuple[str, str, str]] = []
+    t_start = time.perf_counter()
+
+    def done(coin, start, end):
+        return checkpoint.is_done(history_key(coin, start, end, vs_currency))
+
+    todo = n_windows - sum(done(c, s, e) for c in ids for s, e in windows)
+    print(f"History backfill: {len(ids)} coins, {n_windows} windows of <= {window_days}d, "
+          f"{n_windows - todo} already done, {todo} to go.")
+
+    for coin, start, end, payload, error in iter_history_windows(ids, since, until, vs_currency=vs_currency,
+                                                                 window_days=window_days, workers=workers,
+                                                                 skip=done):
+        if error is not None:
+            totals["failed"] += 1
+            failed.append((coin, start.isoformat(), end.isoformat()))
+            continue
+        df = transform_market_chart(coin, payload)
+        # history points have no name/rank/24h fields: they must not reach latest_prices (the
+        # last point is usually newer than the last /coins/markets snapshot) or blank a snapshot
+        counts, t_load = _load_frame(df if len(df) else None, method, update_latest=False, partial=True)
+        checkpoint.mark_done(history_key(coin, start, end, vs_currency), rows=len(df), **counts)
+        totals["windows"] += 1
+        totals["rows"] += len(df)
+        for k in ("inserted", "updated", "skipped"):
+            totals[k] += counts[k]
+        print(f"  {coin} {start:%Y-%m-%d}..{end:%Y-%m-%d}: {len(df)} points, load {t_load:.2f}s")
+
+    elapsed = time.perf_counter() - t_start
+    totals["seconds"] = round(elapsed, 3)
+    print(f"History backfill done: {totals['windows']} windows, {totals['rows']} rows in {elapsed:.2f}s; "
+          f"{totals['inserted']} inserted, {totals['updated']} updated, {totals['skipped']} skipped.")
+    if failed:
+        print(f"{len(failed)} window(s) failed and will be retried on the next run:")
+        for coin, start, end in failed:
+            print(f"  {coin} {start} .. {end}")
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay archived raw CoinGecko payloads into Postgres.")
+    parser.add_argument("--since", help="ISO time; only files overlapping [since, until]")
+    parser.add_argument("--until", help="ISO time")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="transform processes")
+    parser.add_argument("--db-workers", type=int, default=2, help="concurrent DB connections for loading")
+    parser.add_argument("--method", choices=["values", "copy"], help="load method (default: LOAD_METHOD)")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH, help="checkpoint file for resuming")
+    parser.add_argument("--reset", action="store_true", help="forget the checkpoint and start over")
+    parser.add_argument("--history", action="store_true",
+                        help="fetch price history from the API (market_chart/range) instead of the archive")
+    parser.add_argument("--ids", help="--history: comma-separated coin ids (default: COINGECKO_IDS)")
+    parser.add_argument("--window-days", type=int, help="--history: days per request window (default 90)")
+    args = parser.parse_args(argv)
+
+    if args.history:
+        from extract_coingecko import DEFAULT_IDS
+        if not args.since:
+            parser.error("--history needs --since")
+        ids = [x.strip() for x in (args.ids.split(",") if args.ids else DEFAULT_IDS) if x.strip()]
+        checkpoint = Checkpoint(args.checkpoint if args.checkpoint != CHECKPOINT_PATH else HISTORY_CHECKPOINT_PATH)
+        if args.reset:
+            checkpoint.reset()
+        totals = backfill_history(ids, archive.parse_ts(args.since),
+                                  archive.parse_ts(args.until) or datetime.now(tz=timezone.utc),
+                                  window_days=args.window_days, workers=args.workers, method=args.method,
+                                  checkpoint=checkpoint)
+        return 1 if totals["failed"] else 0
+
+    paths = find_raw_files(args.since, args.until)
+    if not paths:
+        print("No raw files found in the requested range.")
+        return 1
+    checkpoint = Checkpoint(args.checkpoint)
+    if args.reset:
+        checkpoint.reset()
+    totals = backfill(paths, workers=args.workers, db_workers=args.db_workers, method=args.method,
+                      checkpoint=checkpoint)
+    return 1 if totals["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
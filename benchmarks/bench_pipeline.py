@@ -0,0 +1,269 @@
+# benchmarks/bench_pipeline.py
+"""
+Synthetic-load benchmarks for the extract-parse, transform, validate and load stages.
+
+Payloads are generated from a real /coins/markets record (data/raw_coingecko_*.json) at
+several sizes, with nulls, duplicate keys, missing keys and odd types mixed in. For every
+stage and size we record wall time, throughput and peak traced memory, write the results
+as JSON and optionally compare them with a baseline file.
+
+Usage:
+  python benchmarks/bench_pipeline.py                          # 1k,10k,100k,1M, no DB
+  python benchmarks/bench_pipeline.py --sizes 1000,10000 --db  # also load into Postgres
+  python benchmarks/bench_pipeline.py --baseline benchmarks/results/baseline.json --threshold 0.25
+
+--db loads into a scratch table (bench_crypto_price_snapshots, created LIKE the real one)
+using DATABASE_URL; each load method starts from an empty table.
+"""
+
+import os
+import sys
+import gc
+import json
+import time
+import random
+import platform
+import argparse
+import tracemalloc
+from glob import glob
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import pandas as pd
+from transform import transform_market_response
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+BENCH_TABLE = "bench_crypto_price_snapshots"
+# stage -> (reference stage, max time ratio at the same size): validation must stay cheap
+# next to the transform it follows
+STAGE_BUDGETS = {"validate": ("transform", 0.2)}
+
+
+# -------------------------
+# Payload generation
+# -------------------------
+def load_template():
+    files = sorted(glob(os.path.join(ROOT, "data", "raw_coingecko_*.json")))
+    if not files:
+        raise FileNotFoundError("No data/raw_coingecko_*.json template found")
+    with open(files[-1], "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def make_payload(n: int, seed: int = 42, template=None):
+    """
+    n /coins/markets-shaped records built from the template records. Roughly:
+    2% duplicates of the previous record, 1% nulls per numeric field, and a sprinkling of
+    numbers-as-strings, unparseable strings, booleans, missing keys and nested roi objects.
+    """
+    template = template or load_template()
+    rng = random.Random(seed)
+    base_time = datetime(2025, 11, 13, tzinfo=timezone.utc)
+    out = []
+    for i in range(n):
+        if i and rng.random() < 0.02:
+            out.append(dict(out[-1]))  # duplicate (symbol, snapshot_time)
+            continue
+        rec = dict(template[i % len(template)])
+        rec["id"] = f"{rec['id']}-{i}"
+        rec["symbol"] = f"{rec['symbol']}{i}"
+        rec["market_cap_rank"] = i + 1
+        rec["current_price"] = round(rng.lognormvariate(0, 3), 8)
+        rec["market_cap"] = rng.randint(0, 2 * 10**12)
+        rec["total_volume"] = rng.random() * 1e10
+        rec["price_change_24h"] = rng.gauss(0, 50)
+        rec["price_change_percentage_24h"] = rng.gauss(0, 5)
+        ts = base_time + timedelta(milliseconds=rng.randint(0, 86_400_000))
+        rec["last_updated"] = ts.strftime("%Y-%m-%dT%H:%M:%S.") + f"{ts.microsecond // 1000:03d}Z"
+        r = rng.random()
+        if r < 0.01:
+            rec["current_price"] = None
+        elif r < 0.02:
+            rec["market_cap"] = str(rec["market_cap"])       # number as string
+        elif r < 0.025:
+            rec["total_volume"] = "N/A"                       # unparseable
+        elif r < 0.03:
+            rec["market_cap_rank"] = None
+        elif r < 0.033:
+            rec["price_change_24h"] = True                    # wrong type
+        elif r < 0.036:
+            rec.pop("circulating_supply", None)               # missing key
+        elif r < 0.04:
+            rec["roi"] = {"times": rng.random(), "currency": "usd", "percentage": rng.random() * 100}
+        out.append(rec)
+    return out
+
+
+# -------------------------
+# Measurement
+# -------------------------
+def measure(fn, *args, memory: bool = True):
+    """Run fn twice: once for wall time, once under tracemalloc for peak memory."""
+    gc.collect()
+    t0 = time.perf_counter()
+    result = fn(*args)
+    seconds = time.perf_counter() - t0
+    peak_mb = None
+    if memory:
+        del result
+        gc.collect()
+        tracemalloc.start()
+        result = fn(*args)
+        peak_mb = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+    return result, seconds, peak_mb
+
+
+def _record(results, stage, size, seconds, peak_mb, n_items):
+    row = {
+        "stage": stage,
+        "size": size,
+        "seconds": round(seconds, 4),
+        "records_per_s": round(n_items / seconds, 1) if seconds > 0 else None,
+        "peak_mb": round(peak_mb, 2) if peak_mb is not None else None,
+    }
+    results.append(row)
+    print(f"  {stage:<18} {size:>9,}  {seconds:8.3f}s  {row['records_per_s'] or 0:>12,.0f} rec/s  "
+          f"peak {row['peak_mb'] if row['peak_mb'] is not None else '-':>8} MB")
+    return row
+
+
+def _prepare_bench_table(engine):
+    from sqlalchemy import text
+    with engine.begin() as conn:
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {BENCH_TABLE} (LIKE crypto_price_snapshots INCLUDING ALL)"))
+        conn.execute(text(f"TRUNCATE {BENCH_TABLE}"))
+
+
+def run_benchmarks(sizes, with_db: bool = False, memory: bool = True, methods=("values", "copy")):
+    results = []
+    template = load_template()
+    for size in sizes:
+        print(f"\nsize={size:,}")
+        payload = make_payload(size, template=template)
+        body = json.dumps(payload).encode("utf-8")
+        del payload
+
+        records, seconds, peak = measure(json.loads, body, memory=memory)
+        _record(results, "extract_parse", size, seconds, peak, size)
+        del body
+
+        df, seconds, peak = measure(transform_market_response, records, memory=memory)
+        _record(results, "transform", size, seconds, peak, size)
+        del df
+        df, seconds, peak = measure(lambda r: transform_market_response(r, engine="fast"), records, memory=memory)
+        _record(results, "transform_fast", size, seconds, peak, size)
+
+        from validate import validate_df
+        # last price = current price * 1.1 for every symbol, so price_jump does its full lookup
+        last = dict(zip(df["symbol"], df["price_usd"] * 1.1))
+        now = df["snapshot_time"].max()
+        _, seconds, peak = measure(lambda d, lp: validate_df(d, last_prices=lp, now=now, max_rank=size + 1),
+                                   df, last, memory=memory)
+        _record(results, "validate", size, seconds, peak, len(df))
+        del last, records
+
+        from load import df_to_rows
+        _, seconds, peak = measure(lambda d: list(df_to_rows(d)), df, memory=memory)
+        _record(results, "load_prepare", size, seconds, peak, len(df))
+
+        if with_db:
+            from load import get_engine, upsert_df
+            engine = get_engine()
+            for method in methods:
+                _prepare_bench_table(engine)
+                # no tracemalloc here: server time dominates and tracing skews the client side
+                _, seconds, _ = measure(lambda d: upsert_df(d, table_name=BENCH_TABLE, method=method),
+                                        df, memory=False)
+                _record(results, f"load_{method}", size, seconds, None, len(df))
+        del df
+    return results
+
+
+# -------------------------
+# Results / regression check
+# -------------------------
+def write_results(results, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    doc = {
+        "meta": {
+            "generated_at": datetime.now(tz=timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(doc, f, indent=2)
+    return path
+
+
+def compare(results, baseline_path, threshold: float):
+    """Return the (stage, size) pairs whose throughput dropped by more than threshold."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {(r["stage"], r["size"]): r for r in json.load(f)["results"]}
+    regressions = []
+    for r in results:
+        b = baseline.get((r["stage"], r["size"]))
+        if not b or not b.get("records_per_s") or not r.get("records_per_s"):
+            continue
+        change = r["records_per_s"] / b["records_per_s"] - 1
+        if change < -threshold:
+            regressions.append((r["stage"], r["size"], b["records_per_s"], r["records_per_s"], change))
+    return regressions
+
+
+def over_budget(results, budgets=STAGE_BUDGETS):
+    """(stage, size, reference stage, ratio, limit) for stages slower than their STAGE_BUDGETS share."""
+    seconds = {(r["stage"], r["size"]): r["seconds"] for r in results}
+    out = []
+    for (stage, size), s in seconds.items():
+        if stage not in budgets:
+            continue
+        ref, limit = budgets[stage]
+        ref_s = seconds.get((ref, size))
+        if ref_s and s / ref_s > limit:
+            out.append((stage, size, ref, s / ref_s, limit))
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark extract parsing, transform and load stages.")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES),
+                        help="comma-separated record counts")
+    parser.add_argument("--db", action="store_true", help="also benchmark load methods against DATABASE_URL")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc peak-memory pass")
+    parser.add_argument("--output", default=os.path.join(RESULTS_DIR, "latest.json"))
+    parser.add_argument("--baseline", help="previous results JSON to compare throughput against")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="max allowed relative throughput drop vs baseline (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    results = run_benchmarks(sizes, with_db=args.db, memory=not args.no_memory)
+    print(f"\nResults written to {write_results(results, args.output)}")
+
+    failed = False
+    for stage, size, ref, ratio, limit in over_budget(results):
+        print(f"OVER BUDGET: {stage} @ {size:,} took {ratio:.2f}x {ref} (limit {limit:.2f}x)")
+        failed = True
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.threshold)
+        if regressions:
+            print(f"\nREGRESSIONS (> {args.threshold:.0%} slower than baseline):")
+            for stage, size, before, after, change in regressions:
+                print(f"  {stage} @ {size:,}: {before:,.0f} -> {after:,.0f} rec/s ({change:+.0%})")
+            return 1
+        print(f"\nNo regressions beyond {args.threshold:.0%} against {args.baseline}.")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+# candles.py
+"""
+OHLCV candles built from crypto_price_snapshots, kept in two rollup tables:
+  crypto_candles_1h  - one row per (symbol, UTC hour)
+  crypto_candles_1d  - one row per (symbol, UTC day), built from the 1h candles
+
+open/close are the first/last non-null price in the bucket, high/low the extremes;
+volume and market_cap are the last values seen in the bucket (CoinGecko's total_volume
+is already a rolling 24h figure, so summing snapshots would double count).
+
+load.upsert_df calls update_candles() in the same transaction as the upsert, so only the
+(symbol, hour) and (symbol, day) buckets touched by the batch are recomputed. Use
+`python candles.py rebuild` after a backfill or to initialise the tables.
+
+Concurrent loads (backfill db workers, orchestrator jobs with overlapping coins, daemon +
+cron) can touch the same bucket. Under READ COMMITTED each would recompute it from its
+own uncommitted rows only, and the last commit would win with the other's samples
+missing. update_candles therefore takes transaction advisory locks on the symbols'
+stripes (LOCK_STRIPES locks at most, in key order so two loads cannot deadlock) before
+reading the snapshots: the second load waits for the first to commit and then sees its rows.
+
+Usage:
+  python candles.py rebuild [--since 2025-01-01] [--until 2025-12-31] [--slice-days 31]
+  python candles.py show bitcoin --interval 1d --limit 30
+"""
+
+import sys
+import zlib
+import argparse
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import pandas as pd
+
+SNAPSHOT_TABLE = "crypto_price_snapshots"
+INTERVALS = {"1h": "crypto_candles_1h", "1d": "crypto_candles_1d"}
+LOCK_NAMESPACE = 0x434E444C  # "CNDL"; first key of pg_advisory_xact_lock(int, int), the symbol's stripe the second
+# symbols share LOCK_STRIPES locks, so a full-universe load holds at most this many
+# (each lock is a shared lock-table slot until the transaction ends)
+LOCK_STRIPES = 64
+
+# held until the upsert transaction ends; keys taken in ascending order
+_LOCK_STRIPES = """
+SELECT count(pg_advisory_xact_lock(%(ns)s, k))
+FROM (SELECT k FROM unnest(%(keys)s::int[]) AS k ORDER BY 1) keys
+"""
+
+# 1h candle per (symbol, hour) recomputed from the snapshots in that hour. The SELECT and
+# the conflict clause are shared; only the source of the buckets differs.
+_HOURLY_SELECT = """
+INSERT INTO crypto_candles_1h (symbol, bucket_start, open, high, low, close, volume,
+                              market_cap, samples, first_time, last_time)
+SELECT s.symbol, b.bucket_start,
+       (array_agg(s.price_usd ORDER BY s.snapshot_time) FILTER (WHERE s.price_usd IS NOT NULL))[1],
+       max(s.price_usd), min(s.price_usd),
+       (array_agg(s.price_usd ORDER BY s.snapshot_time DESC) FILTER (WHERE s.price_usd IS NOT NULL))[1],
+       (array_agg(s.total_volume ORDER BY s.snapshot_time DESC) FILTER (WHERE s.total_volume IS NOT NULL))[1],
+       (array_agg(s.market_cap_usd ORDER BY s.snapshot_time DESC) FILTER (WHERE s.market_cap_usd IS NOT NULL))[1],
+       count(*), min(s.snapshot_time), max(s.snapshot_time)
+"""
+# given buckets, as two parallel arrays; each bucket is a range scan on (symbol, snapshot_time)
+_HOURLY_FROM_BUCKETS = f"""
+FROM unnest(%(symbols)s::text[], %(starts)s::timestamptz[]) AS b (symbol, bucket_start)
+JOIN {SNAPSHOT_TABLE} s
+  ON s.symbol = b.symbol
+ AND s.snapshot_time >= b.bucket_start
+ AND s.snapshot_time < b.bucket_start + interval '1 hour'
+"""
+# every bucket in a time range (rebuild)
+_HOURLY_FROM_RANGE = f"""
+FROM {SNAPSHOT_TABLE} s
+CROSS JOIN LATERAL (
+    SELECT date_trunc('hour', s.snapshot_time AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' AS bucket_start
+) b
+WHERE s.snapshot_time >= %(since)s AND s.snapshot_time < %(until)s
+"""
+_UPSERT_CANDLE = """
+GROUP BY 1, 2
+ORDER BY 1, 2
+ON CONFLICT (symbol, bucket_start) DO UPDATE SET
+    open = EXCLUDED.open, high = EXCLUDED.high, low = EXCLUDED.low, close = EXCLUDED.close,
+    volume = EXCLUDED.volume, market_cap = EXCLUDED.market_cap, samples = EXCLUDED.samples,
+    first_time = EXCLUDED.first_time, last_time = EXCLUDED.last_time, updated_at = now()
+"""
+
+# 1d candle per (symbol, day) from that day's (at most 24) hourly candles.
+# '24 hours' rather than '1 day': bucket starts are UTC and must not follow the session's DST.
+_DAILY_FROM_HOURLY = """
+INSERT INTO crypto_candles_1d (symbol, bucket_start, open, high, low, close, volume,
+                              market_cap, samples, first_time, last_time)
+SELECT h.symbol, b.bucket_start,
+       (array_agg(h.open ORDER BY h.bucket_start) FILTER (WHERE h.open IS NOT NULL))[1],
+       max(h.high), min(h.low),
+       (array_agg(h.close ORDER BY h.bucket_start DESC) FILTER (WHERE h.close IS NOT NULL))[1],
+       (array_agg(h.volume ORDER BY h.bucket_start DESC) FILTER (WHERE h.volume IS NOT NULL))[1],
+       (array_agg(h.market_cap ORDER BY h.bucket_start DESC) FILTER (WHERE h.market_cap IS NOT NULL))[1],
+       sum(h.samples), min(h.first_time), max(h.last_time)
+FROM unnest(%(symbols)s::text[], %(starts)s::timestamptz[]) AS b (symbol, bucket_start)
+JOIN crypto_candles_1h h
+  ON h.symbol = b.symbol
+ AND h.bucket_start >= b.bucket_start
+ AND h.bucket_start < b.bucket_start + interval '24 hours'
+""" + _UPSERT_CANDLE
+
+
+def touched_buckets(df: pd.DataFrame, freq: str):
+    """Distinct (symbol, UTC bucket start) pairs in df, sorted, as two parallel lists."""
+    ts = pd.to_datetime(df["snapshot_time"], utc=True)
+    keys = pd.DataFrame({"symbol": df["symbol"].to_numpy(), "start": ts.dt.floor(freq)}).dropna()
+    keys = keys.drop_duplicates().sort_values(["symbol", "start"], kind="stable")
+    return keys["symbol"].tolist(), [t.to_pydatetime() for t in keys["start"]]
+
+
+def lock_stripes(symbols) -> list:
+    """Sorted distinct stripe numbers for symbols; crc32, so every process maps a symbol alike."""
+    return sorted({zlib.crc32(s.encode("utf-8")) % LOCK_STRIPES for s in symbols})
+
+
+def update_candles(cur, df: pd.DataFrame) -> dict:
+    """
+    Recompute the 1h and 1d candles for the buckets df touches, on the caller's cursor
+    (load.upsert_df runs this inside the upsert transaction). Returns buckets recomputed.
+    """
+    if df is None or df.shape[0] == 0:
+        return {"1h": 0, "1d": 0}
+    symbols, starts = touched_buckets(df, "h")
+    if not symbols:
+        return {"1h": 0, "1d": 0}
+    cur.execute(_LOCK_STRIPES, {"ns": LOCK_NAMESPACE, "keys": lock_stripes(symbols)})
+    cur.execute(_HOURLY_SELECT + _HOURLY_FROM_BUCKETS + _UPSERT_CANDLE, {"symbols": symbols, "starts": starts})
+    day_symbols, day_starts = touched_buckets(df, "D")
+    cur.execute(_DAILY_FROM_HOURLY, {"symbols": day_symbols, "starts": day_starts})
+    return {"1h": len(starts), "1d": len(day_starts)}
+
+
+def _rebuild_slice(cur, since: datetime, until: datetime) -> None:
+    # whole slice in one pass: GROUP BY instead of the bucket list used by update_candles
+    for table in INTERVALS.values():
+        cur.execute(f"DELETE FROM {table} WHERE bucket_start >= %s AND bucket_start < %s", (since, until))
+    cur.execute(_HOURLY_SELECT + _HOURLY_FROM_RANGE + _UPSERT_CANDLE, {"since": since, "until": until})
+    cur.execute("""
+        SELECT DISTINCT symbol, date_trunc('day', bucket_start AT TIME ZONE 'UTC') AT TIME ZONE 'UTC'
+        FROM crypto_candles_1h WHERE bucket_start >= %s AND bucket_start < %s
+    """, (since, until))
+    pairs = cur.fetchall()
+    if pairs:
+        cur.execute(_DAILY_FROM_HOURLY, {"symbols": [p[0] for p in pairs], "starts": [p[1] for p in pairs]})
+
+
+def rebuild(since: Optional[datetime] = None, until: Optional[datetime] = None, slice_days: int = 31) -> int:
+    """
+    Drop and recompute candles from the snapshots between since and until (default: all
+    history), one committed slice of `slice_days` at a time so a long backfill does not
+    hold one giant transaction. Slice edges are rounded out to whole UTC days.
+    """
+    from load import get_engine
+    raw = get_engine().raw_connection()
+    try:
+        with raw.cursor() as cur:
+            if since is None or until is None:
+                cur.execute(f"SELECT min(snapshot_time), max(snapshot_time) FROM {SNAPSHOT_TABLE}")
+                lo, hi = cur.fetchone()
+                if lo is None:
+                    print("No snapshots to build candles from.")
+                    return 0
+                since = since or lo
+                until = until or hi + timedelta(microseconds=1)
+        since = since.astimezone(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        until = until.astimezone(timezone.utc)
+        if until != until.replace(hour=0, minute=0, second=0, microsecond=0):
+            until = until.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        slices = 0
+        start = since
+        while start < until:
+            end = min(start + timedelta(days=slice_days), until)
+            with raw.cursor() as cur:
+                _rebuild_slice(cur, start, end)
+            raw.commit()
+            slices += 1
+            print(f"Rebuilt candles for {start:%Y-%m-%d} .. {end:%Y-%m-%d}")
+            start = end
+        return slices
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+
+
+def get_candles(symbol: str, interval: str = "1h", since=None, until=None, limit: int = 500) -> pd.DataFrame:
+    """Candles for one symbol, oldest first (reads the rollup table only)."""
+    from sqlalchemy import text
+    from load import get_engine
+    table = INTERVALS[interval]
+    sql = f"""
+        SELECT * FROM (
+            SELECT bucket_start, open, high, low, close, volume, market_cap, samples
+            FROM {table}
+            WHERE symbol = :symbol
+              AND bucket_start >= COALESCE(CAST(:since AS timestamptz), '-infinity')
+              AND bucket_start < COALESCE(CAST(:until AS timestamptz), 'infinity')
+            ORDER BY bucket_start DESC
+            LIMIT :limit
+        ) t ORDER BY bucket_start
+    """
+    with get_engine().connect() as conn:
+        return pd.read_sql(text(sql), conn, params={"symbol": symbol, "since": since, "until": until,
+                                                    "limit": limit})
+
+
+def _parse_day(value: Optional[str]) -> Optional[datetime]:
+    if value is None:
+        return None
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="OHLCV candle rollups")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("rebuild", help="recompute candles from crypto_price_snapshots")
+    r.add_argument("--since", help="ISO date/time (default: first snapshot)")
+    r.add_argument("--until", help="ISO date/time, exclusive (default: last snapshot)")
+    r.add_argument("--slice-days", type=int, default=31, help="days per committed slice")
+    s = sub.add_parser("show", help="print candles for one symbol")
+    s.add_argument("symbol")
+    s.add_argument("--interval", choices=sorted(INTERVALS), default="1h")
+    s.add_argument("--since")
+    s.add_argument("--limit", type=int, default=48)
+    args = parser.parse_args(argv)
+
+    if args.cmd == "rebuild":
+        rebuild(_parse_day(args.since), _parse_day(args.until), args.slice_days)
+    else:
+        df = get_candles(args.symbol, args.interval, since=_parse_day(args.since), limit=args.limit)
+        print(df.to_string(index=False) if not df.empty else "No candles.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+# cli.py
+"""
+One entry point for the pipeline stages:
+
+  python cli.py extract   [--ids bitcoin,ethereum] [--vs-currency usd]
+  python cli.py transform [raw_path] [--since ...] [--engine fast]
+  python cli.py load      data/preview_coingecko_snapshot.csv [values|copy]
+  python cli.py run       [--stream] [--daemon] [--vs-currencies usd,eur] ...
+  python cli.py backfill  [--since ...] [--history --ids ...]
+  python cli.py report    [--grain day] [--days 7] [--format json]
+  python cli.py orchestrate [--loop] [--job name] [--force]
+
+This module only imports the standard library. The stage module behind a command (and
+with it pandas / SQLAlchemy / psycopg2 / requests) is imported after the command is
+chosen, and config such as DATABASE_URL is only checked once something needs it, so
+`--help` and commands that do not touch the DB stay cheap for cron and cold containers.
+Everything after the command name goes to that module's own argument parser.
+"""
+
+import sys
+import argparse
+import importlib
+
+# command -> (module, argv prefix for the module's main(), help)
+COMMANDS = {
+    "extract": ("extract_coingecko", [], "fetch /coins/markets and archive the raw payload"),
+    "transform": ("transform", [], "raw payload(s) -> data/preview_coingecko_snapshot.csv"),
+    "load": ("load", [], "upsert a snapshot CSV into Postgres"),
+    "run": ("etl", [], "extract -> transform -> validate -> load (batch, --stream or --daemon)"),
+    "backfill": ("backfill", [], "replay the raw archive, or fetch API history with --history"),
+    "report": ("monitor", ["report"], "run counts, failure rate and percentiles from the run rollups"),
+    "orchestrate": ("orchestrator", [], "run the jobs in jobs.json concurrently, one advisory lock per job"),
+}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="cli.py", description="CoinGecko ETL pipeline",
+        epilog="Run `python cli.py <command> --help` for the options of a command.")
+    sub = parser.add_subparsers(dest="command", required=True, metavar="command")
+    for name, (_, _, help_text) in COMMANDS.items():
+        # no help of our own: `<command> --help` is answered by the stage module
+        sub.add_parser(name, help=help_text, add_help=False)
+    return parser
+
+
+def main(argv=None):
+    args, rest = build_parser().parse_known_args(argv)
+    module_name, prefix, _ = COMMANDS[args.command]
+    module = importlib.import_module(module_name)
+    return module.main(prefix + rest) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -16,3 +16,55 @@ CREATE TABLE IF NOT EXISTS etl_runs (
 );
 
 CREATE INDEX IF NOT EXISTS idx_etl_runs_run_at ON etl_runs (run_at DESC);
+-- orchestrator.py: latest successful run per job (is the job due?)
+CREATE INDEX IF NOT EXISTS idx_etl_runs_job_run_at ON etl_runs (job_name, run_at DESC);
+
+-- load outcome counts (see load.upsert_df incremental mode)
+ALTER TABLE etl_runs ADD COLUMN IF NOT EXISTS rows_inserted INTEGER;
+ALTER TABLE etl_runs ADD COLUMN IF NOT EXISTS rows_updated INTEGER;
+ALTER TABLE etl_runs ADD COLUMN IF NOT EXISTS rows_skipped INTEGER;  -- unchanged rows not rewritten
+
+-- per-rule validation failure counts, e.g. {"checked": 250, "quarantined": 2, "missing_price": 1, ...}
+ALTER TABLE etl_runs ADD COLUMN IF NOT EXISTS validation JSONB;
+
+-- per-stage timings / throughput / memory / HTTP counters (see instrument.py)
+CREATE TABLE IF NOT EXISTS etl_run_stages (
+    run_id UUID NOT NULL REFERENCES etl_runs (run_id) ON DELETE CASCADE,
+    stage TEXT NOT NULL,                             -- extract | transform | load
+    started_at TIMESTAMP WITH TIME ZONE,
+    calls INTEGER,                                   -- times entered (chunks in streaming mode)
+    wall_seconds NUMERIC,
+    cpu_seconds NUMERIC,                             -- CPU time of the stage's threads (this run only)
+    records BIGINT,
+    bytes BIGINT,
+    peak_rss_bytes BIGINT,                           -- process high-water RSS at stage end
+    http_requests INTEGER,
+    http_retries INTEGER,                            -- urllib3 retries (5xx / connection errors)
+    http_throttled INTEGER,                          -- 429 responses
+    throttle_waits INTEGER,                          -- rate limiter waits
+    throttle_seconds NUMERIC,
+    PRIMARY KEY (run_id, stage)
+);
+
+CREATE INDEX IF NOT EXISTS idx_etl_run_stages_stage_started ON etl_run_stages (stage, started_at DESC);
+
+-- hourly/daily run rollups, maintained by monitor.record_run_end (see monitor.py report)
+-- *_hist hold counts per bucket of monitor.DURATION_BOUNDS / ROWS_BOUNDS plus an overflow bucket
+CREATE TABLE IF NOT EXISTS etl_run_rollups (
+    job_name TEXT NOT NULL,
+    grain TEXT NOT NULL CHECK (grain IN ('hour', 'day')),
+    bucket_start TIMESTAMP WITH TIME ZONE NOT NULL,  -- UTC hour/day the runs started in
+    runs INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0,
+    duration_sum NUMERIC NOT NULL DEFAULT 0,
+    duration_max NUMERIC,
+    rows_sum BIGINT NOT NULL DEFAULT 0,
+    rows_max BIGINT,
+    duration_hist INTEGER[] NOT NULL,
+    rows_hist INTEGER[] NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (job_name, grain, bucket_start)
+);
+
+CREATE INDEX IF NOT EXISTS idx_etl_run_rollups_grain_bucket ON etl_run_rollups (grain, bucket_start DESC);
+-- first install / bounds change: python monitor.py rebuild-rollups
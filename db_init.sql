@@ -1,4 +1,6 @@
 -- db_init.sql
+-- For the monthly-partitioned snapshot table, run db_partitioned.sql first; the snapshot
+-- table below is then left as is (IF NOT EXISTS) and everything else is created normally.
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
 
 CREATE TABLE IF NOT EXISTS crypto_price_snapshots (
@@ -29,8 +31,111 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
-DROP TRIGGER IF EXISTS trig_set_updated_at ON crypto_price_snapshots;
-CREATE TRIGGER trig_set_updated_at
-BEFORE UPDATE ON crypto_price_snapshots
-FOR EACH ROW
-EXECUTE PROCEDURE set_updated_at_column();
+-- plain table only; the partitioned layout relies on upsert_df setting updated_at
+DO $$
+BEGIN
+  IF (SELECT relkind FROM pg_class WHERE oid = 'crypto_price_snapshots'::regclass) = 'r' THEN
+    DROP TRIGGER IF EXISTS trig_set_updated_at ON crypto_price_snapshots;
+    CREATE TRIGGER trig_set_updated_at
+    BEFORE UPDATE ON crypto_price_snapshots
+    FOR EACH ROW
+    EXECUTE PROCEDURE set_updated_at_column();
+  END IF;
+END
+$$;
+
+-- OHLCV candles, maintained by load.upsert_df for the buckets each batch touches (see candles.py)
+-- full rebuild: python candles.py rebuild
+CREATE TABLE IF NOT EXISTS crypto_candles_1h (
+    symbol TEXT NOT NULL,
+    bucket_start TIMESTAMP WITH TIME ZONE NOT NULL,  -- UTC hour
+    open NUMERIC,
+    high NUMERIC,
+    low NUMERIC,
+    close NUMERIC,
+    volume NUMERIC,                                  -- last total_volume (24h) in the bucket
+    market_cap NUMERIC,                              -- last market_cap_usd in the bucket
+    samples INTEGER NOT NULL,                        -- snapshots aggregated
+    first_time TIMESTAMP WITH TIME ZONE,
+    last_time TIMESTAMP WITH TIME ZONE,
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (symbol, bucket_start)
+);
+
+CREATE TABLE IF NOT EXISTS crypto_candles_1d (LIKE crypto_candles_1h INCLUDING ALL);  -- UTC day buckets
+
+CREATE INDEX IF NOT EXISTS idx_candles_1h_bucket ON crypto_candles_1h (bucket_start);
+CREATE INDEX IF NOT EXISTS idx_candles_1d_bucket ON crypto_candles_1d (bucket_start);
+
+-- one row per (symbol, quote currency, snapshot); written by multi-currency runs
+-- (COINGECKO_VS_CURRENCIES) in the same transaction as crypto_price_snapshots
+CREATE TABLE IF NOT EXISTS crypto_price_quotes (
+    symbol TEXT NOT NULL,
+    vs_currency TEXT NOT NULL,
+    snapshot_time TIMESTAMP WITH TIME ZONE NOT NULL,
+    price NUMERIC,
+    price_change_24h NUMERIC,
+    price_change_percentage_24h NUMERIC,
+    market_cap NUMERIC,
+    market_cap_rank INTEGER,
+    total_volume NUMERIC,
+    fetched_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (symbol, vs_currency, snapshot_time)
+);
+
+CREATE INDEX IF NOT EXISTS idx_quotes_currency_time ON crypto_price_quotes (vs_currency, snapshot_time DESC);
+
+-- rows held back by the validation stage (see validate.py); same columns as the snapshot
+-- table plus the rules each row failed and the run that first produced it. The same bad row
+-- comes back on every run (e.g. inactive coins with an old last_updated in full-market runs),
+-- so it is stored once per (symbol, snapshot_time, failed_rules); see the unique index below.
+CREATE TABLE IF NOT EXISTS crypto_price_quarantine (
+    id BIGSERIAL PRIMARY KEY,
+    run_id UUID,
+    failed_rules TEXT[] NOT NULL,
+    symbol TEXT,
+    name TEXT,
+    snapshot_time TIMESTAMP WITH TIME ZONE,
+    price_usd NUMERIC,
+    price_change_24h NUMERIC,
+    price_change_percentage_24h NUMERIC,
+    market_cap_usd NUMERIC,
+    market_cap_rank INTEGER,
+    total_volume NUMERIC,
+    circulating_supply NUMERIC,
+    fetched_at TIMESTAMP WITH TIME ZONE,
+    raw_json JSONB,
+    quarantined_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_quarantine_run ON crypto_price_quarantine (run_id);
+CREATE INDEX IF NOT EXISTS idx_quarantine_time ON crypto_price_quarantine (quarantined_at DESC);
+-- one row per (symbol, snapshot, rules); NULL keys (missing_key) compare equal too.
+-- Existing duplicates are removed first, keeping the earliest row.
+DELETE FROM crypto_price_quarantine q
+USING crypto_price_quarantine o
+WHERE o.id < q.id
+  AND COALESCE(o.symbol, '') = COALESCE(q.symbol, '')
+  AND COALESCE(o.snapshot_time, '-infinity') = COALESCE(q.snapshot_time, '-infinity')
+  AND o.failed_rules = q.failed_rules
+  AND NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'uq_quarantine_row');
+CREATE UNIQUE INDEX IF NOT EXISTS uq_quarantine_row ON crypto_price_quarantine
+    (COALESCE(symbol, ''), COALESCE(snapshot_time, '-infinity'), failed_rules);
+-- price_jump baseline lookup (validate.jump_baselines)
+CREATE INDEX IF NOT EXISTS idx_quarantine_symbol_time ON crypto_price_quarantine (symbol, snapshot_time DESC);
+
+-- latest row per symbol, maintained by load.upsert_df (see prices.py); seed with: python prices.py rebuild
+CREATE TABLE IF NOT EXISTS latest_prices (
+    symbol TEXT PRIMARY KEY,
+    name TEXT,
+    snapshot_time TIMESTAMP WITH TIME ZONE NOT NULL,
+    price_usd NUMERIC,
+    price_change_24h NUMERIC,
+    price_change_percentage_24h NUMERIC,
+    market_cap_usd NUMERIC,
+    market_cap_rank INTEGER,
+    total_volume NUMERIC,
+    circulating_supply NUMERIC,
+    fetched_at TIMESTAMP WITH TIME ZONE,
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
@@ -0,0 +1,56 @@
+-- db_partitioned.sql
+-- Partitioned layout for crypto_price_snapshots: monthly RANGE partitions on snapshot_time.
+-- Fresh install: run this BEFORE db_init.sql (which then skips the snapshot table and
+-- creates the rest), then
+--   python partitions.py maintain          (creates this month + the next few)
+-- Existing single-table install: python partitions.py migrate
+--
+-- Same columns and the same (symbol, snapshot_time) unique key as db_init.sql, so
+-- load.upsert_df (ON CONFLICT (symbol, snapshot_time)) works unchanged. Differences:
+-- - the unique index is per partition, so index maintenance touches one month's B-tree
+-- - time-range scans use a small BRIN index instead of a B-tree on snapshot_time
+-- - no row trigger: upsert_df already sets updated_at = NOW() in its conflict clause
+-- - the primary key must include the partition key: (id, snapshot_time)
+CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
+
+-- a plain crypto_price_snapshots (db_init.sql ran first) cannot be converted by DDL alone
+DO $$
+BEGIN
+  IF (SELECT relkind FROM pg_class WHERE oid = to_regclass('crypto_price_snapshots')) = 'r' THEN
+    RAISE EXCEPTION 'crypto_price_snapshots is a plain table; convert it with: python partitions.py migrate';
+  END IF;
+END
+$$;
+
+CREATE TABLE IF NOT EXISTS crypto_price_snapshots (
+    id BIGSERIAL,
+    symbol TEXT NOT NULL,
+    name TEXT,
+    snapshot_time TIMESTAMP WITH TIME ZONE NOT NULL,
+    price_usd NUMERIC,
+    price_change_24h NUMERIC,
+    price_change_percentage_24h NUMERIC,
+    market_cap_usd NUMERIC,
+    market_cap_rank INTEGER,
+    total_volume NUMERIC,
+    circulating_supply NUMERIC,
+    fetched_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    raw_json JSONB,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (id, snapshot_time),
+    CONSTRAINT unique_symbol_snapshot UNIQUE (symbol, snapshot_time)
+) PARTITION BY RANGE (snapshot_time);
+
+-- snapshots arrive in time order, so block ranges stay tight
+CREATE INDEX IF NOT EXISTS brin_crypto_price_snapshots_time
+    ON crypto_price_snapshots USING brin (snapshot_time) WITH (pages_per_range = 32);
+
+-- catches rows outside the monthly partitions (late backfills, clock skew);
+-- partitions.py moves them into their month when it creates that partition
+CREATE TABLE IF NOT EXISTS crypto_price_snapshots_default
+    PARTITION OF crypto_price_snapshots DEFAULT;
+
+-- monthly partitions are named crypto_price_snapshots_pYYYYMM, e.g.:
+-- CREATE TABLE crypto_price_snapshots_p202511 PARTITION OF crypto_price_snapshots
+--     FOR VALUES FROM ('2025-11-01 00:00:00+00') TO ('2025-12-01 00:00:00+00');
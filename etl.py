@@ -50,58 +50,416 @@
 
 # etl.py (updated)
 import logging, sys, os
+import argparse
+import queue
+import signal
+import threading
+import time
+from contextlib import nullcontext
 from datetime import datetime, timezone
-from extract_coingecko import fetch_prices, save_raw
-from transform import transform_market_response
-from load import upsert_df
-from monitor import record_run_start, record_run_end   # <-- import the functions
+from instrument import RunStages
 import json
+# the stage modules (extract_coingecko, transform, load, monitor, validate) pull in requests,
+# pandas, SQLAlchemy and psycopg2; they are imported inside the functions that use them so
+# `--help` and the CLI (cli.py) start without paying for them
 
 LOGDIR = "logs"
-os.makedirs(LOGDIR, exist_ok=True)
-ts = datetime.now(tz=timezone.utc).strftime("%Y%m%dT%H%M%SZ")
-LOGFILE = os.path.join(LOGDIR, f"etl_{ts}.log")
-logging.basicConfig(level=logging.INFO,
-                    format="%(asctime)s %(levelname)s %(message)s",
-                    handlers=[logging.FileHandler(LOGFILE), logging.StreamHandler(sys.stdout)])
+LOGFILE = None  # set by setup_logging() when something actually runs
 
-JOB_NAME = "coingecko_daily_snapshot"
+def setup_logging(threads: bool = False) -> str:
+    """
+    File + stdout logging for this process; creates logs/etl_<ts>.log on first call.
+    threads: prefix lines with the thread name (orchestrator.py names its workers after the job)
+    """
+    global LOGFILE
+    if LOGFILE is None:
+        os.makedirs(LOGDIR, exist_ok=True)
+        ts = datetime.now(tz=timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        LOGFILE = os.path.join(LOGDIR, f"etl_{ts}.log")
+        fmt = "%(asctime)s %(levelname)s [%(threadName)s] %(message)s" if threads else "%(asctime)s %(levelname)s %(message)s"
+        logging.basicConfig(level=logging.INFO, format=fmt,
+                            handlers=[logging.FileHandler(LOGFILE), logging.StreamHandler(sys.stdout)])
+    return LOGFILE
 
-def run(ids=None):
+JOB_NAME = "coingecko_daily_snapshot"  # default etl_runs.job_name; orchestrator.py runs named jobs
+# do run-start row, upsert and run-end row over one pooled connection checkout
+SINGLE_CONNECTION = os.getenv("ETL_SINGLE_CONNECTION", "1").lower() not in ("0", "false", "no")
+
+# streaming mode: extract -> transform -> load fixed-size record chunks, one at a time
+STREAM = os.getenv("ETL_STREAM", "0").lower() in ("1", "true", "yes")
+CHUNK_SIZE = int(os.getenv("ETL_CHUNK_SIZE", "5000"))
+
+def _frame_bytes(df) -> int:
+    # shallow in-memory size of a frame; cheap enough to take per chunk
+    return int(df.memory_usage(index=False).sum()) if df is not None else 0
+
+def _coin_ids(ids):
+    # None -> the two default coins; ["all"] -> None, i.e. the whole /coins/markets universe
+    ids = ids or ["bitcoin", "ethereum"]
+    return None if list(ids) == ["all"] else ids
+
+def _extract(ids, vs_currencies, max_pages=None):
+    from extract_coingecko import fetch_prices_multi, save_raw
+    # {vs_currency: records}, each currency archived separately
+    payloads = fetch_prices_multi(ids=ids, vs_currencies=vs_currencies, max_pages=max_pages)
+    saved = [save_raw(recs, vs_currency=cur) for cur, recs in payloads.items()]
+    return payloads, saved
+
+def _transform(payloads: dict, engine: str):
+    from transform import transform_market_response, transform_quotes
+    # usd -> crypto_price_snapshots (df); any other currency -> crypto_price_quotes, all
+    # currencies (usd included) in one batch. A usd-only run has no quotes.
+    df = transform_market_response(payloads["usd"], engine=engine) if "usd" in payloads else None
+    quotes = transform_quotes(payloads, engine=engine) if set(payloads) != {"usd"} else None
+    return df, quotes
+
+def _rows(df, quotes=None) -> int:
+    return (len(df) if df is not None else 0) + (len(quotes) if quotes is not None else 0)
+
+def _multi_currency(vs_currencies) -> bool:
+    return bool(vs_currencies) and list(vs_currencies) != ["usd"]
+
+def _validate(df, run_id, conn, stages: RunStages, validation: dict, quotes=None):
+    """
+    Rule checks between transform and load (see validate.py). Failing rows are written to
+    the quarantine table and left out of the returned frame, and their coins out of the
+    returned quotes; counts add up in `validation`. Returns (df, quotes).
+    """
+    from validate import MAX_JUMP, drop_quarantined, jump_baselines, merge_counts, quarantine, validate_df
+    if df is None or len(df) == 0:
+        return df, quotes
+    with stages.stage("validate") as st:
+        last, recent = jump_baselines(df["symbol"], conn) if MAX_JUMP else (None, None)
+        good, bad, counts = validate_df(df, last_prices=last, recent_prices=recent)
+        if len(bad):
+            quarantine(bad, run_id, conn)
+        st.add(records=len(df), bytes=_frame_bytes(df))
+    merge_counts(validation, counts)
+    if len(bad):
+        logging.warning("Quarantined %d of %d rows: %s", len(bad), len(df),
+                        {k: v for k, v in counts.items() if v and k not in ("checked", "quarantined")})
+    return good, drop_quarantined(quotes, bad)
+
+def _resolve(vs_currencies, validate):
+    # env defaults that live in the stage modules, looked up only when a run starts
+    if vs_currencies is None:
+        from extract_coingecko import VS_CURRENCIES
+        vs_currencies = VS_CURRENCIES
+    if validate is None:
+        from validate import VALIDATE
+        validate = VALIDATE
+    return vs_currencies, validate
+
+def run(ids=None, single_connection: bool = SINGLE_CONNECTION, stream: bool = STREAM,
+        chunk_size: int = CHUNK_SIZE, raw_paths=None, engine: str | None = None,
+        vs_currencies=None, validate: bool | None = None, job_name: str = JOB_NAME,
+        max_pages: int | None = None):
+    """
+    ids: coin ids to fetch (None -> bitcoin, ethereum; ["all"] -> every coin, see max_pages)
+    stream: process the payload chunk by chunk so memory stays flat (see _run_chunks)
+    raw_paths: stream these archived raw files instead of calling the API (stream mode only)
+    engine: transform engine, "pandas" or "fast" (None -> TRANSFORM_ENGINE env)
+    vs_currencies: quote currencies fetched in this run (None -> COINGECKO_VS_CURRENCIES);
+                   all of them are loaded in one transaction and one etl_runs row
+    validate: run the validate.py rules before loading and quarantine failing rows (None -> ETL_VALIDATE)
+    job_name: etl_runs.job_name of the run (also used in alerts and metrics file names)
+    max_pages: cap on /coins/markets pages (250 coins each) when fetching the whole universe
+    """
+    from load import get_engine
+    setup_logging()
+    vs_currencies, validate = _resolve(vs_currencies, validate)
+    if stream and _multi_currency(vs_currencies):
+        raise ValueError("streaming mode only supports vs_currencies=['usd']")
+    with (get_engine().connect() if single_connection else nullcontext()) as conn:
+        return _run(ids, conn=conn, stream=stream, chunk_size=chunk_size, raw_paths=raw_paths, engine=engine,
+                    vs_currencies=vs_currencies, validate=validate, job_name=job_name, max_pages=max_pages)
+
+def _run_chunks(ids, conn, chunk_size: int, raw_paths, totals: dict, stages: RunStages,
+                engine: str | None = None, run_id=None, validation: dict | None = None, max_pages=None):
+    """
+    Streaming body of a run. Pages (or raw files) are cut into chunk_size record chunks;
+    each chunk is transformed and upserted before the next one is read, so peak memory
+    is bounded by the chunk size, not by the payload. Duplicate (symbol, snapshot_time)
+    keys are dropped across chunk boundaries. Time spent producing a chunk (fetching or
+    reading raw files, archiving) is charged to the extract stage.
+    """
+    from archive import ArchiveWriter, iter_records
+    from extract_coingecko import iter_market_pages
+    from transform import ChunkDeduplicator, iter_record_chunks, transform_market_response
+    from load import upsert_df
+    dedup = ChunkDeduplicator()
+    writer = None
+    if raw_paths:
+        records = (rec for path in raw_paths for rec in iter_records(path))
+    else:
+        writer = ArchiveWriter()
+
+        def records_from_pages():
+            for page in iter_market_pages(ids=ids, max_pages=max_pages):
+                writer.write_many(page)  # archive page by page as it streams past
+                yield from page
+        records = records_from_pages()
+
+    try:
+        for chunk in stages.timed_iter("extract", iter_record_chunks(records, chunk_size)):
+            stages.get("extract").add(records=len(chunk))
+            totals["records"] += len(chunk)
+            with stages.stage("transform") as st:
+                df = dedup.filter(transform_market_response(chunk, engine=engine))
+                st.add(records=len(chunk), bytes=_frame_bytes(df))
+            if validation is not None:
+                df, _ = _validate(df, run_id, conn, stages, validation)
+            with stages.stage("load") as st:
+                counts = upsert_df(df, conn=conn)
+                st.add(records=len(df), bytes=_frame_bytes(df))
+            totals["rows"] += len(df)
+            for k in ("inserted", "updated", "skipped"):
+                totals[k] += counts[k]
+            totals["chunks"] += 1
+            logging.info("Chunk %d: rows=%d (%s)", totals["chunks"], len(df), counts)
+    except BaseException:
+        if writer is not None:
+            writer.discard()  # a partial payload must not become the latest archive entry
+        raise
+    if writer is not None:
+        entry = writer.close()
+        logging.info("Saved raw payload to %s (records=%d)", writer.path, entry["records"])
+
+def _run(ids=None, conn=None, stream: bool = False, chunk_size: int = CHUNK_SIZE, raw_paths=None,
+         engine: str | None = None, vs_currencies=("usd",), validate: bool = False, job_name: str = JOB_NAME,
+         max_pages: int | None = None):
+    from load import upsert_df
+    from monitor import record_run_start, record_run_end
     # start monitoring
-    run_id, start_ts = record_run_start(job_name=JOB_NAME, log_path=LOGFILE)
+    run_id, start_ts = record_run_start(job_name=job_name, log_path=LOGFILE, conn=conn)
+    totals = {"records": 0, "rows": 0, "chunks": 0, "inserted": 0, "updated": 0, "skipped": 0}
+    stages = RunStages()
+    # archive replays (raw_paths) are old by definition; stale_snapshot would quarantine all of it
+    validation = {} if validate and not raw_paths else None
     try:
-        logging.info("ETL starting (run_id=%s)", run_id)
-        ids = ids or ["bitcoin", "ethereum"]
+        logging.info("ETL starting (job=%s, run_id=%s)", job_name, run_id)
+        ids = _coin_ids(ids)
 
-        # 1) Extract
-        raw = fetch_prices(ids=ids)
-        saved = save_raw(raw)
-        logging.info("Saved raw JSON to %s (records=%d)", saved, len(raw))
+        if stream:
+            logging.info("Streaming mode (chunk_size=%d)", chunk_size)
+            _run_chunks(ids, conn, chunk_size, raw_paths, totals, stages, engine, run_id, validation, max_pages)
+            counts = {k: totals[k] for k in ("inserted", "updated", "skipped")}
+            rows_loaded = totals["rows"]
+            logging.info("Streamed records=%d rows=%d in %d chunks", totals["records"], rows_loaded, totals["chunks"])
+        else:
+            # 1) Extract (bytes = response bytes downloaded); one request stream per currency
+            with stages.stage("extract") as st:
+                payloads, saved = _extract(ids, vs_currencies, max_pages)
+                n_records = sum(len(recs) for recs in payloads.values())
+                st.add(records=n_records)
+            logging.info("Saved raw JSON to %s (records=%d)", ", ".join(saved), n_records)
 
-        # 2) Transform
-        df = transform_market_response(raw)
-        logging.info("Transformed rows=%d", len(df))
+            # 2) Transform
+            with stages.stage("transform") as st:
+                df, quotes = _transform(payloads, engine)
+                st.add(records=n_records, bytes=_frame_bytes(df) + _frame_bytes(quotes))
+            logging.info("Transformed rows=%d quotes=%d", _rows(df), _rows(quotes))
+            if validation is not None:
+                df, quotes = _validate(df, run_id, conn, stages, validation, quotes)
 
-        # 3) Load
-        upsert_df(df)
-        logging.info("Load complete")
+            # 3) Load (snapshots + quotes in one transaction)
+            with stages.stage("load") as st:
+                counts = upsert_df(df, conn=conn, quotes=quotes)
+                st.add(records=_rows(df, quotes), bytes=_frame_bytes(df) + _frame_bytes(quotes))
+            logging.info("Load complete (%s)", counts)
+            rows_loaded = _rows(df, quotes)
 
         # success: update monitoring
-        record_run_end(run_id=run_id, start_ts=start_ts, status="success", rows_loaded=len(df))
+        logging.info("Stages: %s", stages.summary())
+        record_run_end(run_id=run_id, start_ts=start_ts, status="success", rows_loaded=rows_loaded, conn=conn,
+                       load_counts=counts, stages=stages, validation=validation, job_name=job_name)
         logging.info("ETL finished successfully (run_id=%s)", run_id)
         return 0
     except Exception as e:
         logging.exception("ETL failed: %s", e)
         # update monitoring row as failed (capture rows_loaded if available)
         try:
-            # try to infer rows loaded if df exists
+            # try to infer rows loaded if df exists (batch) or from the chunks already loaded (stream)
             rows = locals().get("df")
-            rows_loaded = len(rows) if rows is not None else None
+            rows_loaded = _rows(rows, locals().get("quotes")) if rows is not None else (totals["rows"] if stream else None)
         except Exception:
             rows_loaded = None
-        record_run_end(run_id=run_id, start_ts=start_ts, status="failed", rows_loaded=rows_loaded, error=e)
+        record_run_end(run_id=run_id, start_ts=start_ts, status="failed", rows_loaded=rows_loaded, error=e, conn=conn,
+                       stages=stages, validation=validation, job_name=job_name)
         return 2
 
+# -------------------------
+# Daemon mode
+# -------------------------
+DAEMON_INTERVAL = float(os.getenv("ETL_INTERVAL_SECONDS", "60"))
+DAEMON_QUEUE_SIZE = int(os.getenv("ETL_QUEUE_SIZE", "2"))  # cycles buffered between stages
+_STOP = object()  # queue sentinel
+
+def _fail_cycle(cycle: dict, e: Exception, stage: str):
+    from monitor import record_run_end
+    logging.exception("ETL cycle failed in %s (run_id=%s): %s", stage, cycle["run_id"], e)
+    try:
+        df = cycle.get("df")
+        record_run_end(run_id=cycle["run_id"], start_ts=cycle["start_ts"], status="failed",
+                       rows_loaded=_rows(df, cycle.get("quotes")) if df is not None else None, error=e,
+                       stages=cycle.get("stages"), validation=cycle.get("validation"), job_name=cycle["job_name"])
+    except Exception:
+        logging.exception("Could not record failed cycle %s", cycle["run_id"])
+
+def _transform_worker(inbox: queue.Queue, outbox: queue.Queue, engine: str | None = None):
+    while True:
+        cycle = inbox.get()
+        if cycle is _STOP:
+            outbox.put(_STOP)
+            return
+        try:
+            with cycle["stages"].stage("transform") as st:
+                payloads = cycle.pop("raw")
+                cycle["df"], cycle["quotes"] = _transform(payloads, engine)
+                st.add(records=sum(len(recs) for recs in payloads.values()),
+                       bytes=_frame_bytes(cycle["df"]) + _frame_bytes(cycle["quotes"]))
+            logging.info("Cycle %d transformed rows=%d quotes=%d", cycle["n"], _rows(cycle["df"]), _rows(cycle["quotes"]))
+        except Exception as e:
+            _fail_cycle(cycle, e, "transform")
+            continue
+        outbox.put(cycle)  # blocks while the loader is behind -> backpressure
+
+def _load_worker(inbox: queue.Queue, validate: bool = True):
+    from load import upsert_df
+    from monitor import record_run_end
+    while True:
+        cycle = inbox.get()
+        if cycle is _STOP:
+            return
+        try:
+            if validate:
+                # on the loader thread: the price_jump baseline must include the previous cycle's load
+                cycle["validation"] = {}
+                cycle["df"], cycle["quotes"] = _validate(cycle["df"], cycle["run_id"], None, cycle["stages"],
+                                                         cycle["validation"], cycle["quotes"])
+            n_rows = _rows(cycle["df"], cycle["quotes"])
+            with cycle["stages"].stage("load") as st:
+                counts = upsert_df(cycle["df"], quotes=cycle["quotes"])
+                st.add(records=n_rows, bytes=_frame_bytes(cycle["df"]) + _frame_bytes(cycle["quotes"]))
+            record_run_end(run_id=cycle["run_id"], start_ts=cycle["start_ts"], status="success",
+                           rows_loaded=n_rows, load_counts=counts, stages=cycle["stages"],
+                           validation=cycle.get("validation"), job_name=cycle["job_name"])
+            logging.info("Cycle %d loaded (run_id=%s, %s)", cycle["n"], cycle["run_id"], counts)
+        except Exception as e:
+            _fail_cycle(cycle, e, "load")
+
+def run_daemon(ids=None, interval: float = DAEMON_INTERVAL, queue_size: int = DAEMON_QUEUE_SIZE,
+               max_cycles: int | None = None, engine: str | None = None, vs_currencies=None,
+               validate: bool | None = None, job_name: str = JOB_NAME, max_pages: int | None = None):
+    """
+    Long-running scheduler. Extract runs on this thread at fixed ticks (start + k * interval,
+    so slow cycles do not accumulate drift); transform and load run on their own threads,
+    connected by bounded queues, so the next fetch overlaps the previous load.
+    - Backpressure: if the transform queue is still full at a tick, that tick is skipped
+      instead of fetching data nobody can load yet.
+    - Each cycle gets its own etl_runs row (started at extract, finished by the loader).
+      Stage CPU times and HTTP counts are per cycle (see instrument.py), even when cycles overlap.
+    - SIGTERM/SIGINT stop scheduling; cycles already in flight are drained before exit.
+    """
+    from monitor import record_run_start
+    setup_logging()
+    ids = _coin_ids(ids)
+    vs_currencies, validate = _resolve(vs_currencies, validate)
+    stop = threading.Event()
+
+    def _on_signal(signum, frame):
+        logging.info("Received signal %s, shutting down after in-flight cycles", signum)
+        stop.set()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, _on_signal)
+
+    to_transform: queue.Queue = queue.Queue(maxsize=queue_size)
+    to_load: queue.Queue = queue.Queue(maxsize=queue_size)
+    workers = [
+        threading.Thread(target=_transform_worker, args=(to_transform, to_load, engine), name="etl-transform"),
+        threading.Thread(target=_load_worker, args=(to_load, validate), name="etl-load"),
+    ]
+    for t in workers:
+        t.start()
+
+    logging.info("ETL daemon started (interval=%ss, queue_size=%d, ids=%s)", interval, queue_size, ids)
+    t0 = time.monotonic()
+    tick = 0
+    cycles = 0
+    try:
+        while not stop.is_set() and (max_cycles is None or cycles < max_cycles):
+            run_id = None
+            if to_transform.full():
+                logging.warning("Tick %d skipped: pipeline is behind (transform queue full)", tick)
+            else:
+                try:
+                    run_id, start_ts = record_run_start(job_name=job_name, log_path=LOGFILE)
+                except Exception as e:
+                    # DB restarting, pool exhausted...: lose this tick, not the daemon
+                    logging.exception("Tick %d skipped: could not record the run start: %s", tick, e)
+            if run_id is not None:
+                cycles += 1
+                cycle = {"n": cycles, "run_id": run_id, "start_ts": start_ts, "stages": RunStages(),
+                         "job_name": job_name}
+                try:
+                    with cycle["stages"].stage("extract") as st:
+                        cycle["raw"], saved = _extract(ids, vs_currencies, max_pages)
+                        n_records = sum(len(recs) for recs in cycle["raw"].values())
+                        st.add(records=n_records)
+                    logging.info("Cycle %d extracted records=%d (%s)", cycles, n_records, ", ".join(saved))
+                    to_transform.put(cycle)
+                except Exception as e:
+                    _fail_cycle(cycle, e, "extract")
+
+            # next tick on the fixed grid; ticks already missed are skipped, not bunched up
+            tick += 1
+            now = time.monotonic()
+            next_at = t0 + tick * interval
+            if now > next_at:
+                missed = int((now - next_at) // interval) + 1
+                logging.warning("Cycle overran the interval; skipping %d tick(s)", missed)
+                tick += missed
+                next_at = t0 + tick * interval
+            if max_cycles is not None and cycles >= max_cycles:
+                break
+            stop.wait(max(0.0, next_at - time.monotonic()))
+    finally:
+        to_transform.put(_STOP)
+        for t in workers:
+            t.join()
+        logging.info("ETL daemon stopped after %d cycles", cycles)
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CoinGecko ETL: extract -> transform -> load")
+    parser.add_argument("--ids", help="comma-separated coin ids, or `all` (default: bitcoin,ethereum)")
+    parser.add_argument("--max-pages", type=int, help="with --ids all: fetch at most this many pages of 250 coins")
+    parser.add_argument("--job-name", default=JOB_NAME, help="etl_runs.job_name for this run (default: %(default)s)")
+    parser.add_argument("--stream", action="store_true", default=STREAM, help="chunked streaming mode")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--daemon", action="store_true", help="run forever at a fixed interval")
+    parser.add_argument("--interval", type=float, default=DAEMON_INTERVAL, help="daemon interval in seconds")
+    parser.add_argument("--max-cycles", type=int, help="daemon: stop after this many cycles")
+    # choices mirror transform.TRANSFORM_ENGINES (not imported here, so --help stays cheap)
+    parser.add_argument("--engine", choices=("pandas", "fast"),
+                        help="transform engine: pandas (json_normalize) or fast (columnar); default TRANSFORM_ENGINE")
+    parser.add_argument("--vs-currencies",
+                        help="comma-separated quote currencies fetched per run (default: COINGECKO_VS_CURRENCIES)")
+    parser.add_argument("--no-validate", dest="validate", action="store_false", default=None,
+                        help="skip the validation/quarantine stage (default: ETL_VALIDATE)")
+    args = parser.parse_args(argv)
+    ids = [x.strip() for x in args.ids.split(",") if x.strip()] if args.ids else None
+    vs_currencies = ([c.strip().lower() for c in args.vs_currencies.split(",") if c.strip()]
+                     if args.vs_currencies else None)
+    if args.stream and vs_currencies and _multi_currency(vs_currencies):
+        parser.error("--stream only supports --vs-currencies usd")
+    if args.daemon:
+        return run_daemon(ids=ids, interval=args.interval, max_cycles=args.max_cycles, engine=args.engine,
+                          vs_currencies=vs_currencies, validate=args.validate, job_name=args.job_name,
+                          max_pages=args.max_pages)
+    return run(ids=ids, stream=args.stream, chunk_size=args.chunk_size, engine=args.engine,
+               vs_currencies=vs_currencies, validate=args.validate, job_name=args.job_name,
+               max_pages=args.max_pages)
+
 if __name__ == "__main__":
-    sys.exit(run())
+    sys.exit(main())
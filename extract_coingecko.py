@@ -11,19 +11,42 @@ import sys
 import json
 import time
 import logging
-from datetime import datetime, timezone
-from typing import List, Any, Dict
+import argparse
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from itertools import count, islice
+from typing import List, Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
 
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util import Retry
 
+import instrument
+from archive import write_archive
+from http_cache import ResponseCache, get_response_cache
+
 # CONFIG
 BASE = os.getenv("COINGECKO_API_BASE", "https://api.coingecko.com/api/v3")
 DEFAULT_IDS = os.getenv("COINGECKO_IDS", "bitcoin,ethereum").split(",")
 VS_CURRENCY = os.getenv("COINGECKO_VS_CURRENCY", "usd")
+# quote currencies fetched per ETL run (e.g. "usd,eur,btc"); usd also feeds crypto_price_snapshots
+VS_CURRENCIES = [c.strip().lower() for c in os.getenv("COINGECKO_VS_CURRENCIES", "usd").split(",") if c.strip()]
 TIMEOUT = 15  # seconds for the HTTP request
+MAX_WORKERS = int(os.getenv("COINGECKO_MAX_WORKERS", "4"))  # parallel page requests
+MARKETS_MAX_PER_PAGE = 250  # hard API cap for /coins/markets
+RATE_PER_MIN = float(os.getenv("COINGECKO_RATE_PER_MIN", "30"))  # steady-state request budget
+RATE_BURST = int(os.getenv("COINGECKO_RATE_BURST", "5"))  # requests allowed back-to-back
+MAX_RATE_LIMIT_RETRIES = int(os.getenv("COINGECKO_MAX_429_RETRIES", "5"))
+# /market_chart/range returns hourly points for ranges up to 90 days and daily points beyond,
+# so history is fetched in windows of at most this many days
+CHART_WINDOW_DAYS = int(os.getenv("COINGECKO_CHART_WINDOW_DAYS", "90"))
+# ...and ranges of a day or less come back 5-minutely, so no window is shorter than this
+CHART_MIN_WINDOW = timedelta(days=2)
 OUTPUT_DIR = "data"
+# "ndjson.gz": date-partitioned archive + manifest (see archive.py); "json": legacy flat file
+RAW_FORMAT = os.getenv("RAW_FORMAT", "ndjson.gz")
 
 # logging
 logging.basicConfig(
@@ -32,23 +55,239 @@ logging.basicConfig(
     format="%(asctime)s %(levelname)s %(message)s",
 )
 
+class RateLimiter:
+    """
+    Thread-safe token bucket shared by every request the extractor makes.
+    - rate_per_min: steady-state requests per minute
+    - burst: bucket capacity (requests that may go out back-to-back)
+    On a 429 or a Retry-After header the rate is halved (down to a floor) and the
+    bucket is closed until Retry-After has passed; every clean response afterwards
+    nudges the rate back up towards the configured value.
+    clock / sleep default to time.monotonic / time.sleep (tests pass fakes).
+    """
+
+    def __init__(self, rate_per_min: float = RATE_PER_MIN, burst: int = RATE_BURST,
+                 min_rate_per_min: Optional[float] = None, recovery: float = 0.05,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.max_rate = max(rate_per_min, 0.001) / 60.0
+        self.min_rate = (min_rate_per_min if min_rate_per_min else max(rate_per_min / 16, 0.5)) / 60.0
+        self.rate = self.max_rate
+        self.burst = max(1, int(burst))
+        self.recovery = recovery
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(self.burst)
+        self._updated = clock()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+        # counters (read them via stats())
+        self.acquired = 0
+        self.delayed = 0            # acquires that had to wait
+        self.throttled_seconds = 0.0
+        self.rejected = 0           # 429 responses seen
+        self.backoffs = 0           # rate reductions (429 or Retry-After)
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self) -> float:
+        """Block until a request may be sent. Returns the seconds spent waiting."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._refill(now)
+                wait = self._blocked_until - now
+                if wait <= 0:
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        self.acquired += 1
+                        if waited:
+                            self.delayed += 1
+                            self.throttled_seconds += waited
+                        return waited
+                    wait = (1 - self._tokens) / self.rate
+            self._sleep(wait)
+            waited += wait
+
+    def backoff(self, retry_after: Optional[float] = None, rejected: bool = True) -> None:
+        """Slow down after a 429 / Retry-After. Shared by all threads using this limiter."""
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            if rejected:
+                self.rejected += 1
+            self.backoffs += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = min(self._tokens, 0.0)
+            pause = retry_after if retry_after is not None else 1 / self.rate
+            self._blocked_until = max(self._blocked_until, now + pause)
+
+    def on_success(self) -> None:
+        """Additive recovery towards the configured rate after clean responses."""
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * self.recovery)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "acquired": self.acquired,
+                "delayed": self.delayed,
+                "throttled_seconds": round(self.throttled_seconds, 3),
+                "rejected": self.rejected,
+                "backoffs": self.backoffs,
+                "current_rate_per_min": round(self.rate * 60, 3),
+            }
+
+_rate_limiter: Optional[RateLimiter] = None
+_rate_limiter_lock = threading.Lock()
+
+def get_rate_limiter() -> RateLimiter:
+    """Process-wide limiter, created lazily from COINGECKO_RATE_PER_MIN / COINGECKO_RATE_BURST."""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter(RATE_PER_MIN, RATE_BURST)
+        return _rate_limiter
+
+def configure_rate_limiter(rate_per_min: float, burst: int = RATE_BURST) -> RateLimiter:
+    """Replace the shared limiter (e.g. for a paid API plan with a higher quota)."""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        _rate_limiter = RateLimiter(rate_per_min, burst)
+        return _rate_limiter
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    # Retry-After is either delay-seconds or an HTTP-date
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(tz=timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+# process-wide HTTP counters (read them via http_stats()); the running stage of the calling
+# run gets the same numbers through instrument.count()
+_http_counters = {"requests": 0, "bytes": 0, "retries": 0}
+_http_counters_lock = threading.Lock()
+
+def _count_http(name: str, n: int = 1) -> None:
+    with _http_counters_lock:
+        _http_counters[name] += n
+    instrument.count(name, n)
+
+class CountingRetry(Retry):
+    """urllib3 Retry that tallies every retry (5xx / connection errors) into http_stats()."""
+
+    def increment(self, *args, **kwargs):
+        _count_http("retries")
+        return super().increment(*args, **kwargs)
+
+def http_stats() -> Dict[str, Any]:
+    """
+    Cumulative HTTP counters for this process: requests sent, response bytes, urllib3
+    retries, plus the shared rate limiter's throttle/429 counters. These are totals over
+    every run in the process; per-stage numbers are collected by instrument.RunStages.
+    """
+    with _http_counters_lock:
+        stats: Dict[str, Any] = dict(_http_counters)
+    limiter = get_rate_limiter().stats()
+    stats["throttled"] = limiter["rejected"]  # 429 responses
+    stats["throttle_waits"] = limiter["delayed"]
+    stats["throttle_seconds"] = limiter["throttled_seconds"]
+    return stats
+
 def requests_session_with_retries(
     total_retries: int = 5,
     backoff_factor: float = 0.5,
-    status_forcelist = (429, 500, 502, 503, 504)
+    # 429 is left to RateLimiter so every worker backs off together instead of
+    # urllib3 sleeping privately inside one thread
+    status_forcelist = (500, 502, 503, 504),
+    pool_maxsize: int = 10,
 ) -> requests.Session:
     session = requests.Session()
-    retries = Retry(
+    retries = CountingRetry(
         total=total_retries,
         backoff_factor=backoff_factor,
         status_forcelist=status_forcelist,
         allowed_methods=frozenset(["GET", "POST"]),
+        respect_retry_after_header=False,  # Retry-After is handled by RateLimiter
     )
-    adapter = HTTPAdapter(max_retries=retries)
+    # pool_maxsize bounds keep-alive connections per host; size it to the number of
+    # worker threads sharing this session so parallel pages reuse sockets.
+    adapter = HTTPAdapter(max_retries=retries, pool_maxsize=pool_maxsize)
     session.mount("https://", adapter)
     session.mount("http://", adapter)
     return session
 
+def _get_json(session: requests.Session, endpoint: str, params: Dict[str, Any],
+              limiter: Optional[RateLimiter] = None, cache: Optional[ResponseCache] = None) -> Any:
+    limiter = limiter or get_rate_limiter()
+    cache = cache or get_response_cache()
+    entry = None
+    headers: Dict[str, str] = {}
+    if cache is not None:
+        key = cache.make_key(endpoint, params)
+        entry = cache.get(key)
+        if entry is not None and entry.is_fresh:
+            cache.record("hits")
+            return json.loads(entry.body)
+        if entry is not None:
+            # stale: ask the API whether it changed (ETag / Last-Modified)
+            headers = entry.conditional_headers()
+
+    for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+        waited = limiter.acquire()
+        if waited:
+            instrument.count("throttle_waits")
+            instrument.count("throttle_seconds", waited)
+        resp = session.get(endpoint, params=params, headers=headers, timeout=TIMEOUT)
+        _count_http("requests")
+        _count_http("bytes", len(resp.content))
+        retry_after = _parse_retry_after(resp.headers.get("Retry-After"))
+        if resp.status_code == 429:
+            # Respect HTTP 429 (rate-limited): slow the shared limiter down and go round again
+            limiter.backoff(retry_after, rejected=True)
+            instrument.count("throttled")
+            logging.warning("Rate limited (429), attempt %d/%d. Retry-After=%s, limiter now %.1f req/min.",
+                            attempt + 1, MAX_RATE_LIMIT_RETRIES + 1, retry_after, limiter.rate * 60)
+            continue
+        if retry_after is not None:
+            limiter.backoff(retry_after, rejected=False)
+        else:
+            limiter.on_success()
+        break
+
+    if cache is not None:
+        if resp.status_code == 304 and entry is not None:
+            cache.record("revalidated")
+            cache.refresh(entry, resp.headers)
+            return json.loads(entry.body)
+        cache.record("misses")
+    resp.raise_for_status()
+    if cache is not None:
+        cache.put(key, resp.content, resp.headers, endpoint=endpoint)
+    return resp.json()
+
+def _markets_params(vs_currency: str, per_page: int, page: int, ids: Optional[List[str]] = None) -> Dict[str, Any]:
+    params = {
+        "vs_currency": vs_currency,
+        "order": "market_cap_desc",
+        "per_page": per_page,
+        "page": page,
+        "sparkline": "false",
+        "price_change_percentage": "24h"
+    }
+    if ids is not None:
+        params["ids"] = ",".join(ids)
+    return params
+
 def fetch_prices(ids: List[str], vs_currency: str = "usd", per_page: int = 250) -> List[Dict[str, Any]]:
     """
     Call CoinGecko /coins/markets endpoint.
@@ -57,32 +296,204 @@ def fetch_prices(ids: List[str], vs_currency: str = "usd", per_page: int = 250)
     """
     session = requests_session_with_retries()
     endpoint = f"{BASE}/coins/markets"
+    params = _markets_params(vs_currency, per_page, page=1, ids=ids)
+
+    logging.info("Requesting CoinGecko: ids=%s vs_currency=%s", ids, vs_currency)
+    return _get_json(session, endpoint, params)
+
+def iter_market_pages(
+    ids: Optional[List[str]] = None,
+    vs_currency: str = "usd",
+    per_page: int = MARKETS_MAX_PER_PAGE,
+    max_pages: Optional[int] = None,
+    workers: int = MAX_WORKERS,
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Yield /coins/markets pages in order, fetching up to `workers` of them in parallel.
+    - ids given: split into chunks of `per_page` ids, one request per chunk.
+    - ids None: walk the whole market universe (page=1,2,...) until a short page
+      comes back or `max_pages` is reached.
+    All requests share one pooled session. At most `workers` requests are in flight,
+    so wall time scales with pages / workers rather than with the page count.
+    """
+    per_page = max(1, min(per_page, MARKETS_MAX_PER_PAGE))
+    workers = max(1, workers)
+    if ids is not None:
+        chunks = [ids[i:i + per_page] for i in range(0, len(ids), per_page)]
+        param_iter: Iterable[Dict[str, Any]] = (
+            _markets_params(vs_currency, len(chunk), page=1, ids=chunk) for chunk in chunks
+        )
+    else:
+        pages = count(1) if max_pages is None else range(1, max_pages + 1)
+        param_iter = (_markets_params(vs_currency, per_page, page=p) for p in pages)
+
+    session = requests_session_with_retries(pool_maxsize=workers)
+    endpoint = f"{BASE}/coins/markets"
+    logging.info("Requesting CoinGecko pages: ids=%s vs_currency=%s per_page=%d workers=%d",
+                 "all" if ids is None else len(ids), vs_currency, per_page, workers)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="coingecko") as pool:
+        # sliding window of in-flight requests; results are consumed in submit order
+        # bind: requests made by the workers count towards the caller's run/stage
+        inflight = [pool.submit(instrument.bind(_get_json), session, endpoint, p) for p in islice(param_iter, workers)]
+        try:
+            while inflight:
+                page = inflight.pop(0).result()
+                if not isinstance(page, list):
+                    raise ValueError(f"Unexpected response shape: expected list, got {type(page)}")
+                yield page
+                if ids is None and len(page) < per_page:
+                    break  # end of the universe; later pages would be empty
+                nxt = next(param_iter, None)
+                if nxt is not None:
+                    inflight.append(pool.submit(instrument.bind(_get_json), session, endpoint, nxt))
+        finally:
+            for fut in inflight:
+                fut.cancel()
+            logging.info("Rate limiter stats: %s", get_rate_limiter().stats())
+            cache = get_response_cache()
+            if cache is not None:
+                logging.info("Response cache stats: %s", cache.stats())
+
+def fetch_prices_paginated(
+    ids: Optional[List[str]] = None,
+    vs_currency: str = "usd",
+    per_page: int = MARKETS_MAX_PER_PAGE,
+    max_pages: Optional[int] = None,
+    workers: int = MAX_WORKERS,
+) -> List[Dict[str, Any]]:
+    """
+    Concurrent, paginated version of fetch_prices. Pass ids=None to snapshot the
+    whole market universe. Returns the merged list of coin dicts in page order.
+    """
+    data: List[Dict[str, Any]] = []
+    for page in iter_market_pages(ids=ids, vs_currency=vs_currency, per_page=per_page,
+                                  max_pages=max_pages, workers=workers):
+        data.extend(page)
+    return data
+
+def fetch_prices_multi(
+    ids: Optional[List[str]] = None,
+    vs_currencies: Optional[List[str]] = None,
+    per_page: int = MARKETS_MAX_PER_PAGE,
+    max_pages: Optional[int] = None,
+    workers: int = MAX_WORKERS,
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    fetch_prices_paginated for several quote currencies at once: one thread per currency,
+    sharing the page workers between them and the process-wide rate limiter, so the
+    request budget is the same as for sequential runs but the waits overlap.
+    Returns {vs_currency: records}.
+    """
+    vs_currencies = list(dict.fromkeys(c.lower() for c in (vs_currencies or VS_CURRENCIES)))
+    if len(vs_currencies) == 1:
+        return {vs_currencies[0]: fetch_prices_paginated(ids, vs_currencies[0], per_page, max_pages, workers)}
+    per_currency = max(1, workers // len(vs_currencies))
+    with ThreadPoolExecutor(max_workers=len(vs_currencies), thread_name_prefix="coingecko-vs") as pool:
+        futures = {cur: pool.submit(instrument.bind(fetch_prices_paginated), ids, cur, per_page, max_pages, per_currency)
+                   for cur in vs_currencies}
+        return {cur: fut.result() for cur, fut in futures.items()}
+
+# -------------------------
+# Historical ranges (/coins/{id}/market_chart/range)
+# -------------------------
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def split_windows(since: datetime, until: datetime, window_days: int = CHART_WINDOW_DAYS) -> List[Tuple[datetime, datetime]]:
+    """
+    Cut [since, until) into windows of at most window_days. Window edges sit on a fixed
+    grid (multiples of window_days since the epoch), so inner windows get the same bounds
+    whatever since/until a resumed backfill is started with. A first or last window shorter
+    than CHART_MIN_WINDOW is widened to it (overlapping its neighbour; loads are idempotent)
+    so every window gets the same hourly granularity.
+    """
+    step = max(timedelta(days=max(1, window_days)), CHART_MIN_WINDOW)
+    windows = []
+    start = since
+    while start < until:
+        end = min(_EPOCH + ((start - _EPOCH) // step + 1) * step, until)
+        windows.append((start, end))
+        start = end
+    for i, (start, end) in enumerate(windows):
+        if end - start < CHART_MIN_WINDOW:
+            # the last window (usually ending now) grows backwards, the first one forwards
+            windows[i] = (end - CHART_MIN_WINDOW, end) if i == len(windows) - 1 else (start, start + CHART_MIN_WINDOW)
+    return windows
+
+def fetch_market_chart_range(coin_id: str, start: datetime, end: datetime, vs_currency: str = "usd",
+                             session: Optional[requests.Session] = None) -> Dict[str, Any]:
+    """
+    One /coins/{id}/market_chart/range call for [start, end).
+    Returns the raw payload: {"prices": [[ms, v], ...], "market_caps": [...], "total_volumes": [...]}.
+    """
+    session = session or requests_session_with_retries()
     params = {
         "vs_currency": vs_currency,
-        "ids": ",".join(ids),
-        "order": "market_cap_desc",
-        "per_page": per_page,
-        "page": 1,
-        "sparkline": "false",
-        "price_change_percentage": "24h"
+        "from": int(start.timestamp()),
+        "to": int(end.timestamp()) - 1,  # `to` is inclusive; the next window starts at `end`
     }
+    data = _get_json(session, f"{BASE}/coins/{coin_id}/market_chart/range", params)
+    if not isinstance(data, dict) or "prices" not in data:
+        raise ValueError(f"Unexpected market_chart response for {coin_id}: {str(data)[:200]}")
+    return data
 
-    logging.info("Requesting CoinGecko: ids=%s vs_currency=%s", ids, vs_currency)
-    resp = session.get(endpoint, params=params, timeout=TIMEOUT)
-    # Respect HTTP 429 (rate-limited) more politely
-    if resp.status_code == 429:
-        retry_after = int(resp.headers.get("Retry-After", "5"))
-        logging.warning("Rate limited (429). Sleeping %s seconds then retrying once.", retry_after)
-        time.sleep(retry_after)
-        resp = session.get(endpoint, params=params, timeout=TIMEOUT)
+def iter_history_windows(
+    ids: List[str],
+    since: datetime,
+    until: datetime,
+    vs_currency: str = "usd",
+    window_days: int = CHART_WINDOW_DAYS,
+    workers: int = MAX_WORKERS,
+    skip: Optional[Callable[[str, datetime, datetime], bool]] = None,
+) -> Iterator[Tuple[str, datetime, datetime, Optional[Dict[str, Any]], Optional[Exception]]]:
+    """
+    Fetch every (coin, window) of [since, until) with up to `workers` requests in flight,
+    all going through the shared rate limiter. Yields (coin_id, start, end, payload, error)
+    as windows finish (not in order); a failed window yields payload=None and the error
+    instead of stopping the others. skip(coin_id, start, end) -> True leaves a window out
+    (e.g. already checkpointed).
+    """
+    work = ((coin, start, end) for coin in ids for start, end in split_windows(since, until, window_days))
+    if skip is not None:
+        work = (w for w in work if not skip(*w))
+    workers = max(1, workers)
+    session = requests_session_with_retries(pool_maxsize=workers)
+    logging.info("Requesting CoinGecko history: %d coins, %s .. %s, window=%dd workers=%d",
+                 len(ids), since.isoformat(), until.isoformat(), window_days, workers)
 
-    resp.raise_for_status()
-    return resp.json()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="coingecko-history") as pool:
+        inflight = {pool.submit(fetch_market_chart_range, coin, start, end, vs_currency, session): (coin, start, end)
+                    for coin, start, end in islice(work, workers)}
+        try:
+            while inflight:
+                done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    coin, start, end = inflight.pop(fut)
+                    try:
+                        yield coin, start, end, fut.result(), None
+                    except (requests.RequestException, ValueError) as e:
+                        logging.warning("History window %s %s..%s failed: %s", coin, start.isoformat(), end.isoformat(), e)
+                        yield coin, start, end, None, e
+                    nxt = next(work, None)
+                    if nxt is not None:
+                        inflight[pool.submit(fetch_market_chart_range, *nxt, vs_currency, session)] = nxt
+        finally:
+            for fut in inflight:
+                fut.cancel()
+            logging.info("Rate limiter stats: %s", get_rate_limiter().stats())
 
-def save_raw(data: Any, folder: str = OUTPUT_DIR) -> str:
+def save_raw(data: Any, folder: str = OUTPUT_DIR, fmt: str = RAW_FORMAT, vs_currency: str = "usd") -> str:
+    # non-usd payloads are kept apart (own archive root / file prefix) so archive replays
+    # into crypto_price_snapshots never mistake them for usd prices
+    if fmt == "ndjson.gz":
+        root = os.path.join(folder, "archive")
+        if vs_currency != "usd":
+            root = os.path.join(root, f"vs={vs_currency}")
+        return write_archive(data, root=root)
     os.makedirs(folder, exist_ok=True)
     ts = datetime.now(tz=timezone.utc).strftime("%Y%m%dT%H%M%SZ")
-    path = os.path.join(folder, f"raw_coingecko_{ts}.json")
+    prefix = "raw_coingecko" if vs_currency == "usd" else f"raw_coingecko_{vs_currency}"
+    path = os.path.join(folder, f"{prefix}_{ts}.json")
     with open(path, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
     return path
@@ -101,10 +512,24 @@ def compact_preview(data: List[Dict[str, Any]], n: int = 2) -> None:
         print(f"[{i}] {minimal}")
     print("--- end preview ---\n")
 
-def main():
-    ids = [x.strip() for x in DEFAULT_IDS if x.strip()]
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fetch /coins/markets from CoinGecko and archive the raw payload.")
+    parser.add_argument("--ids", default=",".join(DEFAULT_IDS),
+                        help="comma-separated coin ids, or 'all' for the whole market (default: COINGECKO_IDS)")
+    parser.add_argument("--vs-currency", default=VS_CURRENCY, help="quote currency (default: COINGECKO_VS_CURRENCY)")
+    parser.add_argument("--max-pages", type=int, default=int(os.getenv("COINGECKO_MAX_PAGES", "0")) or None,
+                        help="with --ids all: stop after this many pages (default: COINGECKO_MAX_PAGES)")
+    args = parser.parse_args(argv)
+
+    ids = [x.strip() for x in args.ids.split(",") if x.strip()]
     try:
-        data = fetch_prices(ids=ids, vs_currency=VS_CURRENCY)
+        if ids == ["all"]:
+            # COINGECKO_IDS=all -> whole market universe (COINGECKO_MAX_PAGES caps it)
+            data = fetch_prices_paginated(ids=None, vs_currency=args.vs_currency, max_pages=args.max_pages)
+        elif len(ids) > MARKETS_MAX_PER_PAGE:
+            data = fetch_prices_paginated(ids=ids, vs_currency=args.vs_currency)
+        else:
+            data = fetch_prices(ids=ids, vs_currency=args.vs_currency)
         if not isinstance(data, list):
             logging.error("Unexpected response shape: expected list, got %s", type(data))
             # try printing the raw payload for inspection
@@ -112,7 +537,7 @@ def main():
             sys.exit(2)
 
         # Save raw JSON
-        saved_path = save_raw(data)
+        saved_path = save_raw(data, vs_currency=args.vs_currency)
         logging.info("Saved raw payload to %s (records=%d)", saved_path, len(data))
 
         # Print compact preview
@@ -0,0 +1,218 @@
+# http_cache.py
+"""
+On-disk HTTP response cache for the CoinGecko extractor.
+- Bodies are stored per (endpoint, params) key under COINGECKO_CACHE_DIR.
+- Inside the freshness window (Cache-Control max-age, or fresh_seconds) the body is served
+  without touching the network.
+- After that the stored ETag / Last-Modified are sent as If-None-Match / If-Modified-Since,
+  and a 304 reuses the stored body.
+- Entries stored more than ttl_seconds ago are dropped (reads do not extend that); when the
+  directory grows past max_bytes the least recently used entries (body mtime, bumped on
+  every read) are evicted. The directory scan runs every evict_every puts, not on each one.
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Mapping, Optional
+
+CACHE_DIR = os.getenv("COINGECKO_CACHE_DIR", os.path.join("data", "http_cache"))
+CACHE_TTL_SECONDS = float(os.getenv("COINGECKO_CACHE_TTL_SECONDS", "86400"))
+CACHE_FRESH_SECONDS = float(os.getenv("COINGECKO_CACHE_FRESH_SECONDS", "30"))
+CACHE_MAX_BYTES = int(os.getenv("COINGECKO_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+CACHE_EVICT_EVERY = int(os.getenv("COINGECKO_CACHE_EVICT_EVERY", "50"))  # puts between eviction scans
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+
+@dataclass
+class CacheEntry:
+    key: str
+    body: bytes
+    stored_at: float
+    fresh_for: float
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+    @property
+    def is_fresh(self) -> bool:
+        return (time.time() - self.stored_at) < self.fresh_for
+
+    def conditional_headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    def __init__(self, directory: str = CACHE_DIR, ttl_seconds: float = CACHE_TTL_SECONDS,
+                 fresh_seconds: float = CACHE_FRESH_SECONDS, max_bytes: int = CACHE_MAX_BYTES,
+                 evict_every: int = CACHE_EVICT_EVERY):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.fresh_seconds = fresh_seconds
+        self.max_bytes = max_bytes
+        self.evict_every = max(1, evict_every)
+        self._lock = threading.Lock()
+        self._puts_since_evict = 0
+        # counters
+        self.hits = 0           # served from disk without a request
+        self.revalidated = 0    # 304 Not Modified, stored body reused
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(endpoint: str, params: Optional[Mapping[str, Any]] = None) -> str:
+        canonical = json.dumps([endpoint, sorted((params or {}).items())], default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def _paths(self, key: str):
+        base = os.path.join(self.directory, key)
+        return base + ".body", base + ".meta.json"
+
+    def record(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _read_meta(self, key: str) -> Dict[str, Any]:
+        with open(self._paths(key)[1], "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        body_path, _ = self._paths(key)
+        try:
+            meta = self._read_meta(key)
+            with open(body_path, "rb") as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        if time.time() - meta["stored_at"] > self.ttl_seconds:
+            self._remove(key)
+            return None
+        # bump mtime so LRU eviction sees this entry as recently used
+        try:
+            os.utime(body_path)
+        except OSError:
+            pass
+        return CacheEntry(key=key, body=body, stored_at=meta["stored_at"], fresh_for=meta["fresh_for"],
+                          etag=meta.get("etag"), last_modified=meta.get("last_modified"))
+
+    def _fresh_for(self, headers: Mapping[str, str]) -> float:
+        m = _MAX_AGE_RE.search(headers.get("Cache-Control", "") or "")
+        return float(m.group(1)) if m else self.fresh_seconds
+
+    def put(self, key: str, body: bytes, headers: Mapping[str, str], endpoint: str = "") -> None:
+        body_path, meta_path = self._paths(key)
+        meta = {
+            "endpoint": endpoint,
+            "stored_at": time.time(),
+            "fresh_for": self._fresh_for(headers),
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "size": len(body),
+        }
+        # write to temp files then rename, so concurrent readers never see a half-written entry
+        suffix = f".tmp{os.getpid()}.{threading.get_ident()}"
+        with open(body_path + suffix, "wb") as f:
+            f.write(body)
+        with open(meta_path + suffix, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(body_path + suffix, body_path)
+        os.replace(meta_path + suffix, meta_path)
+        with self._lock:
+            self.stores += 1
+            self._puts_since_evict += 1
+            due = self._puts_since_evict >= self.evict_every
+            if due:
+                self._puts_since_evict = 0
+        if due:
+            self.evict()
+
+    def refresh(self, entry: CacheEntry, headers: Mapping[str, str]) -> None:
+        """Restart the freshness window of an entry after a 304."""
+        _, meta_path = self._paths(entry.key)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            meta["stored_at"] = time.time()
+            meta["fresh_for"] = self._fresh_for(headers)
+            meta["etag"] = headers.get("ETag") or meta.get("etag")
+            meta["last_modified"] = headers.get("Last-Modified") or meta.get("last_modified")
+            tmp = meta_path + f".tmp{os.getpid()}.{threading.get_ident()}"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            os.replace(tmp, meta_path)
+        except (OSError, ValueError):
+            pass
+
+    def _remove(self, key: str) -> None:
+        for path in self._paths(key):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def evict(self) -> int:
+        """Drop expired entries (by stored_at), then least recently used ones until under max_bytes."""
+        now = time.time()
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for de in it:
+                if not de.name.endswith(".body"):
+                    continue
+                try:
+                    st = de.stat()
+                except OSError:
+                    continue
+                key = de.name[:-len(".body")]
+                try:
+                    stored_at = self._read_meta(key)["stored_at"]
+                except (OSError, ValueError, KeyError):
+                    stored_at = None  # half-written or damaged entry
+                if stored_at is None or now - stored_at > self.ttl_seconds:
+                    self._remove(key)
+                    self.record("evictions")
+                    continue
+                entries.append((st.st_mtime, st.st_size, key))
+                total += st.st_size
+        removed = 0
+        if total > self.max_bytes:
+            for _, size, key in sorted(entries):
+                self._remove(key)
+                removed += 1
+                total -= size
+                if total <= self.max_bytes:
+                    break
+        with self._lock:
+            self.evictions += removed
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "revalidated": self.revalidated, "misses": self.misses,
+                    "stores": self.stores, "evictions": self.evictions}
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Process-wide cache, or None when disabled with COINGECKO_CACHE=0."""
+    global _cache
+    if os.getenv("COINGECKO_CACHE", "1").lower() in ("0", "false", "no", "off"):
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
@@ -0,0 +1,299 @@
+# instrument.py
+"""
+Per-stage instrumentation for ETL runs.
+
+    stages = RunStages()
+    with stages.stage("extract") as st:
+        raw = fetch_prices_paginated(ids)
+        st.add(records=len(raw))
+    ...
+    record_run_end(..., stages=stages)   # -> etl_run_stages rows + optional exporters
+
+For each stage we keep wall time, CPU time, records and bytes processed, the process peak
+RSS when the stage ended, and the HTTP requests / retries / 429s / throttle waits of the
+stage. A stage may be entered many times (one per chunk in streaming mode); the numbers add up.
+
+CPU time and HTTP counters are charged to the run, not read off process-wide totals: the
+running stage is kept in a context variable, the HTTP code reports into it (count()), and
+CPU is the thread CPU time of the stage's thread plus that of any worker started through
+bind(). Overlapping daemon cycles and concurrent orchestrator jobs do not see each other's
+numbers. Peak RSS stays process-wide.
+
+Exporters (both optional, enabled by env):
+  ETL_METRICS_DIR   - write Prometheus text-format gauges to <dir>/etl_<job>.prom
+                      (node_exporter textfile collector); graph p50/p95 with
+                      quantile_over_time(0.95, etl_stage_wall_seconds[7d])
+  ETL_METRICS_JSON  - append one JSON line per run; `python instrument.py summary <file>`
+                      prints p50/p95/p99 stage latency from it
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+METRICS_DIR = os.getenv("ETL_METRICS_DIR")
+METRICS_JSON = os.getenv("ETL_METRICS_JSON")
+
+HTTP_FIELDS = ("requests", "retries", "throttled", "throttle_waits", "throttle_seconds")
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """High-water resident set size of this process so far."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # bytes on macOS, KiB on Linux
+
+
+class StageStats:
+    """Accumulated numbers for one named stage of a run."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started_at: Optional[datetime] = None
+        self.calls = 0
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.records = 0
+        self.bytes = 0
+        self.peak_rss_bytes: Optional[int] = None
+        self.http = {k: 0 for k in HTTP_FIELDS}
+        self._lock = threading.Lock()  # worker threads report into the stage concurrently
+
+    def add(self, records: int = 0, bytes: int = 0) -> None:
+        with self._lock:
+            self.records += records
+            self.bytes += bytes
+
+    def count(self, name: str, n: float = 1) -> None:
+        with self._lock:
+            if name == "bytes":
+                self.bytes += n
+            elif name == "cpu_seconds":
+                self.cpu_seconds += n
+            else:
+                self.http[name] += n
+
+    def as_row(self) -> Dict[str, Any]:
+        return {
+            "stage": self.name,
+            "started_at": self.started_at,
+            "calls": self.calls,
+            "wall_seconds": round(self.wall_seconds, 4),
+            "cpu_seconds": round(self.cpu_seconds, 4),
+            "records": self.records,
+            "bytes": self.bytes,
+            "peak_rss_bytes": self.peak_rss_bytes,
+            "http_requests": self.http["requests"],
+            "http_retries": self.http["retries"],
+            "http_throttled": self.http["throttled"],
+            "throttle_waits": self.http["throttle_waits"],
+            "throttle_seconds": round(self.http["throttle_seconds"], 3),
+        }
+
+
+_current_stage: "contextvars.ContextVar[Optional[StageStats]]" = contextvars.ContextVar("etl_stage", default=None)
+
+
+def count(name: str, n: float = 1) -> None:
+    """
+    Charge n to the stage running in this context (no-op outside a stage). name is one of
+    HTTP_FIELDS, "bytes" (response bytes) or "cpu_seconds".
+    """
+    st = _current_stage.get()
+    if st is not None:
+        st.count(name, n)
+
+
+def bind(fn: Callable) -> Callable:
+    """
+    fn tied to the caller's stage, for running on another thread: pool.submit(bind(fn), ...).
+    Its HTTP counts and thread CPU time go to the stage that submitted it.
+    """
+    ctx = contextvars.copy_context()
+
+    def call(*args, **kwargs):
+        return ctx.copy().run(_timed_call, fn, args, kwargs)  # a Context can't be entered twice at once
+    return call
+
+
+def _timed_call(fn: Callable, args, kwargs):
+    cpu0 = time.thread_time()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        count("cpu_seconds", time.thread_time() - cpu0)
+
+
+class RunStages:
+    """Ordered collection of StageStats for one run. Thread-safe across stages."""
+
+    def __init__(self):
+        self._stages: Dict[str, StageStats] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> StageStats:
+        with self._lock:
+            if name not in self._stages:
+                self._stages[name] = StageStats(name)
+            return self._stages[name]
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageStats]:
+        st = self.get(name)
+        if st.started_at is None:
+            st.started_at = datetime.now(tz=timezone.utc)
+        # HTTP counts and response bytes (which count as bytes processed) arrive via count()
+        token = _current_stage.set(st)
+        cpu0 = time.thread_time()
+        t0 = time.perf_counter()
+        try:
+            yield st
+        finally:
+            _current_stage.reset(token)
+            st.count("cpu_seconds", time.thread_time() - cpu0)
+            st.wall_seconds += time.perf_counter() - t0
+            st.calls += 1
+            st.peak_rss_bytes = peak_rss_bytes()
+
+    def timed_iter(self, name: str, iterable: Iterable) -> Iterator:
+        """Wrap a lazy source so the time spent producing each item is charged to `name`."""
+        it = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(it)
+                except StopIteration:
+                    return
+            yield item
+
+    def rows(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [st.as_row() for st in self._stages.values()]
+
+    def summary(self) -> str:
+        return ", ".join(f"{r['stage']}={r['wall_seconds']:.2f}s/{r['records']}rec" for r in self.rows())
+
+
+# -------------------------
+# Exporters
+# -------------------------
+_PROM_GAUGES = (
+    ("wall_seconds", "Wall time of the stage in the last run"),
+    ("cpu_seconds", "CPU time of the stage's threads in the last run"),
+    ("records", "Records processed by the stage in the last run"),
+    ("bytes", "Bytes processed by the stage in the last run"),
+    ("peak_rss_bytes", "Process peak RSS at the end of the stage"),
+    ("http_requests", "HTTP requests sent during the stage"),
+    ("http_retries", "HTTP retries (5xx / connection errors) during the stage"),
+    ("http_throttled", "HTTP 429 responses during the stage"),
+    ("throttle_seconds", "Seconds spent waiting on the rate limiter during the stage"),
+)
+
+
+def _label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def write_prometheus(path: str, job_name: str, run: Dict[str, Any], rows: List[Dict[str, Any]]) -> str:
+    """Write the last run of `job_name` as Prometheus text-format gauges (atomic replace)."""
+    job = _label(job_name)
+    lines = [
+        "# HELP etl_run_duration_seconds Duration of the last run",
+        "# TYPE etl_run_duration_seconds gauge",
+        f'etl_run_duration_seconds{{job="{job}"}} {run["duration_seconds"]}',
+        "# HELP etl_run_success 1 if the last run succeeded, 0 otherwise",
+        "# TYPE etl_run_success gauge",
+        f'etl_run_success{{job="{job}"}} {1 if run["status"] == "success" else 0}',
+        "# HELP etl_run_last_timestamp_seconds Unix time the last run finished",
+        "# TYPE etl_run_last_timestamp_seconds gauge",
+        f'etl_run_last_timestamp_seconds{{job="{job}"}} {run["finished_at"].timestamp():.3f}',
+    ]
+    for field, help_text in _PROM_GAUGES:
+        lines.append(f"# HELP etl_stage_{field} {help_text}")
+        lines.append(f"# TYPE etl_stage_{field} gauge")
+        for r in rows:
+            if r.get(field) is not None:
+                lines.append(f'etl_stage_{field}{{job="{job}",stage="{_label(r["stage"])}"}} {r[field]}')
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp, path)  # the collector must never see a half-written file
+    return path
+
+
+def append_json(path: str, job_name: str, run: Dict[str, Any], rows: List[Dict[str, Any]]) -> str:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    doc = dict(run, job_name=job_name, stages=rows)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(doc, default=str) + "\n")
+    return path
+
+
+def export_run(job_name: str, run_id: str, status: str, duration: float, rows: List[Dict[str, Any]],
+               metrics_dir: Optional[str] = METRICS_DIR, metrics_json: Optional[str] = METRICS_JSON) -> None:
+    """Send one finished run to whichever exporters are configured."""
+    if not (metrics_dir or metrics_json):
+        return
+    run = {"run_id": run_id, "status": status, "duration_seconds": duration,
+           "finished_at": datetime.now(tz=timezone.utc)}
+    if metrics_dir:
+        write_prometheus(os.path.join(metrics_dir, f"etl_{job_name}.prom"), job_name, run, rows)
+    if metrics_json:
+        append_json(metrics_json, job_name, run, rows)
+
+
+def _percentile(sorted_vals: List[float], q: float) -> float:
+    # nearest-rank percentile; enough for latency summaries
+    idx = max(0, min(len(sorted_vals) - 1, math.ceil(q * len(sorted_vals)) - 1))
+    return sorted_vals[idx]
+
+
+def summarize_json(path: str, last: Optional[int] = None) -> Dict[str, Dict[str, float]]:
+    """p50/p95/p99 wall seconds per stage from an ETL_METRICS_JSON file."""
+    with open(path, "r", encoding="utf-8") as f:
+        runs = [json.loads(line) for line in f if line.strip()]
+    if last:
+        runs = runs[-last:]
+    by_stage: Dict[str, List[float]] = {}
+    for run in runs:
+        for r in run.get("stages", []):
+            by_stage.setdefault(r["stage"], []).append(float(r["wall_seconds"]))
+    out = {}
+    for stage, vals in by_stage.items():
+        vals.sort()
+        out[stage] = {"runs": len(vals), "p50": _percentile(vals, 0.50),
+                      "p95": _percentile(vals, 0.95), "p99": _percentile(vals, 0.99)}
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ETL stage metrics tools")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("summary", help="p50/p95/p99 stage latency from an ETL_METRICS_JSON file")
+    p.add_argument("path", nargs="?", default=METRICS_JSON)
+    p.add_argument("--last", type=int, help="only the last N runs")
+    args = parser.parse_args(argv)
+    if not args.path:
+        parser.error("no metrics file given and ETL_METRICS_JSON is not set")
+    for stage, s in summarize_json(args.path, args.last).items():
+        print(f"{stage:<10} runs={s['runs']:<5} p50={s['p50']:.3f}s p95={s['p95']:.3f}s p99={s['p99']:.3f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,42 @@
 # monitor.py  (create this file in project root), or paste into etl.py
+import sys
+import json
 import time
 import uuid
+import bisect
+import argparse
 import traceback
+from datetime import datetime, timedelta, timezone
 from sqlalchemy import text
-from load import get_engine   # re-use get_engine from your load.py
 import os
 import requests
-from notifiers import slack_notify 
+from notifiers import notify
+from instrument import export_run
 
-def record_run_start(job_name: str, log_path: str | None = None):
+def get_engine():
+    # re-use the engine from load.py; imported on first query because load pulls in pandas
+    # and psycopg2, which `monitor.py --help` / `cli.py report --help` do not need
+    from load import get_engine as _get_engine
+    return _get_engine()
+
+def _execute(sql, params: dict, conn=None):
+    """
+    Run one bookkeeping statement. With conn (a SQLAlchemy Connection shared with the
+    rest of the run) it is executed and committed there; otherwise a pooled connection
+    from the process-wide engine is used.
+    """
+    if conn is not None:
+        try:
+            conn.execute(sql, params)
+            conn.commit()
+        except Exception:
+            conn.rollback()  # leave the shared connection usable for the rest of the run
+            raise
+        return
+    with get_engine().begin() as c:
+        c.execute(sql, params)
+
+def record_run_start(job_name: str, log_path: str | None = None, conn=None):
     """
     Inserts a 'running' row and returns (run_id, start_ts)
     start_ts: monotonic timestamp (float) for duration measurement
@@ -16,22 +44,52 @@ def record_run_start(job_name: str, log_path: str | None = None):
     """
     run_id = str(uuid.uuid4())
     start_ts = time.time()
-    engine = get_engine()
     sql = text("""
         INSERT INTO etl_runs (run_id, job_name, run_at, status, log_path)
         VALUES (:run_id, :job_name, now(), 'running', :log_path)
     """)
-    with engine.begin() as conn:
-        conn.execute(sql, {"run_id": run_id, "job_name": job_name, "log_path": log_path})
+    _execute(sql, {"run_id": run_id, "job_name": job_name, "log_path": log_path}, conn)
     return run_id, start_ts
 
   # new import
 
+def record_run_stages(run_id: str, rows: list, conn=None):
+    """
+    Insert per-stage numbers (instrument.RunStages.rows()) into etl_run_stages.
+    Re-recording a stage for the same run overwrites it.
+    """
+    if not rows:
+        return
+    sql = text("""
+        INSERT INTO etl_run_stages (run_id, stage, started_at, calls, wall_seconds, cpu_seconds,
+                                    records, bytes, peak_rss_bytes, http_requests, http_retries,
+                                    http_throttled, throttle_waits, throttle_seconds)
+        VALUES (:run_id, :stage, :started_at, :calls, :wall_seconds, :cpu_seconds,
+                :records, :bytes, :peak_rss_bytes, :http_requests, :http_retries,
+                :http_throttled, :throttle_waits, :throttle_seconds)
+        ON CONFLICT (run_id, stage) DO UPDATE SET
+            started_at = EXCLUDED.started_at, calls = EXCLUDED.calls,
+            wall_seconds = EXCLUDED.wall_seconds, cpu_seconds = EXCLUDED.cpu_seconds,
+            records = EXCLUDED.records, bytes = EXCLUDED.bytes,
+            peak_rss_bytes = EXCLUDED.peak_rss_bytes, http_requests = EXCLUDED.http_requests,
+            http_retries = EXCLUDED.http_retries, http_throttled = EXCLUDED.http_throttled,
+            throttle_waits = EXCLUDED.throttle_waits, throttle_seconds = EXCLUDED.throttle_seconds
+    """)
+    _execute(sql, [dict(r, run_id=run_id) for r in rows], conn)
+
 def record_run_end(run_id: str, start_ts: float, status: str = "success",
-                   rows_loaded: int | None = None, error: Exception | None = None):
+                   rows_loaded: int | None = None, error: Exception | None = None, conn=None,
+                   load_counts: dict | None = None, stages=None, validation: dict | None = None,
+                   job_name: str = "coingecko_daily_snapshot"):
     """
     Updates the etl_runs row with finished_at, status, duration and optional error text/rows.
-    Also sends Slack notifications on success or failure (non-blocking).
+    job_name: the name the run was started under (record_run_start); used in alerts and metrics.
+    load_counts: {"inserted", "updated", "skipped"} as returned by load.upsert_df.
+    validation: per-rule failure counts from validate.validate_df (stored as JSONB).
+    stages: instrument.RunStages for the run; written to etl_run_stages and handed to the
+    metrics exporters (ETL_METRICS_DIR / ETL_METRICS_JSON) if configured.
+    Also queues Slack notifications on success or failure (non-blocking: failures are sent
+    right away by the background dispatcher, successes go into a periodic digest).
     """
     duration = round(time.time() - start_ts, 3)
     error_text = None
@@ -40,30 +98,54 @@ def record_run_end(run_id: str, start_ts: float, status: str = "success",
         tb = "".join(traceback.format_exception_only(type(error), error))
         error_text = tb.strip()
 
-    engine = get_engine()
     sql = text("""
         UPDATE etl_runs
         SET finished_at = now(),
             status = :status,
             duration_seconds = :duration,
             rows_loaded = :rows_loaded,
-            error_text = :error_text
+            rows_inserted = :rows_inserted,
+            rows_updated = :rows_updated,
+            rows_skipped = :rows_skipped,
+            error_text = :error_text,
+            validation = CAST(:validation AS JSONB)
         WHERE run_id = :run_id
     """)
-    with engine.begin() as conn:
-        conn.execute(sql, {
-            "status": status,
-            "duration": duration,
-            "rows_loaded": rows_loaded,
-            "error_text": error_text,
-            "run_id": run_id
-        })
+    load_counts = load_counts or {}
+    _execute(sql, {
+        "status": status,
+        "duration": duration,
+        "rows_loaded": rows_loaded,
+        "rows_inserted": load_counts.get("inserted"),
+        "rows_updated": load_counts.get("updated"),
+        "rows_skipped": load_counts.get("skipped"),
+        "error_text": error_text,
+        "validation": json.dumps(validation) if validation is not None else None,
+        "run_id": run_id
+    }, conn)
+
+    try:
+        update_rollups(run_id, duration, rows_loaded, conn)
+    except Exception as e:
+        print(f"Could not update run rollups for {run_id}: {e}")
+
+    if stages is not None:
+        stage_rows = stages.rows()
+        # bookkeeping must never fail the run it describes
+        try:
+            record_run_stages(run_id, stage_rows, conn)
+        except Exception as e:
+            print(f"Could not record stage metrics for {run_id}: {e}")
+        try:
+            export_run(job_name, run_id, status, duration, stage_rows)
+        except Exception as e:
+            print(f"Could not export stage metrics for {run_id}: {e}")
 
     # Compose Slack message
     if status == "failed":
         msg = (
             f":x: *ETL FAILED*\n"
-            f"> *Job:* coingecko_daily_snapshot\n"
+            f"> *Job:* {job_name}\n"
             f"> *Run ID:* `{run_id}`\n"
             f"> *Duration:* {duration}s\n"
             f"> *Rows loaded:* {rows_loaded if rows_loaded is not None else 'N/A'}\n"
@@ -72,19 +154,334 @@ def record_run_end(run_id: str, start_ts: float, status: str = "success",
         )
         # non-blocking best-effort
         try:
-            slack_notify(msg)
+            notify(msg, urgent=True)
         except Exception:
             pass
     else:
         msg = (
             f":white_check_mark: *ETL SUCCESS*\n"
-            f"> *Job:* coingecko_daily_snapshot\n"
+            f"> *Job:* {job_name}\n"
             f"> *Run ID:* `{run_id}`\n"
             f"> *Duration:* {duration}s\n"
             f"> *Rows loaded:* {rows_loaded if rows_loaded is not None else 0}\n"
+            + (f"> *Inserted/updated/skipped:* {load_counts.get('inserted')}/{load_counts.get('updated')}/{load_counts.get('skipped')}\n"
+               if load_counts else "")
+            + (f"> *Quarantined:* {validation['quarantined']}\n" if validation and validation.get("quarantined") else "") +
             f"> *Log:* `{os.path.basename(os.getenv('LOGFILE','unknown'))}`"
         )
         try:
-            slack_notify(msg)
+            notify(msg)
         except Exception:
             pass
+
+# -------------------------
+# Rollups + report
+# -------------------------
+# Fixed histogram bucket upper bounds. Rollup rows store one count per bucket (plus an
+# overflow bucket), so percentiles over any range are a sum of small arrays instead of a
+# scan of etl_runs. Changing these bounds requires `python monitor.py rebuild-rollups`.
+DURATION_BOUNDS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200)
+ROWS_BOUNDS = (0, 1, 10, 100, 1_000, 5_000, 10_000, 50_000, 100_000, 500_000, 1_000_000, 5_000_000)
+GRAINS = ("hour", "day")
+
+
+def _bucket_index(value, bounds) -> int:
+    # 0-based: first bucket whose upper bound is >= value; len(bounds) is the overflow bucket
+    return bisect.bisect_left(bounds, value)
+
+
+def _one_hot(value, bounds) -> list:
+    hist = [0] * (len(bounds) + 1)
+    if value is not None:
+        hist[_bucket_index(float(value), bounds)] = 1
+    return hist
+
+
+_ROLLUP_UPSERT = """
+    INSERT INTO etl_run_rollups AS r (job_name, grain, bucket_start, runs, failures,
+                                      duration_sum, duration_max, rows_sum, rows_max,
+                                      duration_hist, rows_hist)
+    SELECT e.job_name, g.grain,
+           date_trunc(g.grain, e.run_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+           1, CASE WHEN e.status = 'failed' THEN 1 ELSE 0 END,
+           COALESCE(CAST(:duration AS NUMERIC), 0), CAST(:duration AS NUMERIC),
+           COALESCE(CAST(:rows_loaded AS BIGINT), 0), CAST(:rows_loaded AS BIGINT),
+           CAST(:duration_hist AS INTEGER[]), CAST(:rows_hist AS INTEGER[])
+    FROM etl_runs e CROSS JOIN (VALUES ('hour'), ('day')) AS g (grain)
+    WHERE e.run_id = :run_id
+    ON CONFLICT (job_name, grain, bucket_start) DO UPDATE SET
+        runs = r.runs + EXCLUDED.runs,
+        failures = r.failures + EXCLUDED.failures,
+        duration_sum = r.duration_sum + EXCLUDED.duration_sum,
+        duration_max = GREATEST(r.duration_max, EXCLUDED.duration_max),
+        rows_sum = r.rows_sum + EXCLUDED.rows_sum,
+        rows_max = GREATEST(r.rows_max, EXCLUDED.rows_max),
+        duration_hist = ARRAY(SELECT a + b FROM unnest(r.duration_hist, EXCLUDED.duration_hist)
+                              WITH ORDINALITY AS t (a, b, i) ORDER BY i),
+        rows_hist = ARRAY(SELECT a + b FROM unnest(r.rows_hist, EXCLUDED.rows_hist)
+                          WITH ORDINALITY AS t (a, b, i) ORDER BY i),
+        updated_at = now()
+"""
+
+
+def update_rollups(run_id: str, duration, rows_loaded, conn=None):
+    """
+    Fold one finished run into its hourly and daily etl_run_rollups rows (bucketed by
+    run_at, UTC). Called from record_run_end, so rollups stay current without rescans.
+    """
+    _execute(text(_ROLLUP_UPSERT), {
+        "run_id": run_id,
+        "duration": duration,
+        "rows_loaded": rows_loaded,
+        "duration_hist": _one_hot(duration, DURATION_BOUNDS),
+        "rows_hist": _one_hot(rows_loaded, ROWS_BOUNDS),
+    }, conn)
+
+
+def rebuild_rollups(job_name: str | None = None):
+    """
+    Recompute etl_run_rollups from etl_runs in one pass (first install, or after
+    changing the histogram bounds). Streams etl_runs with a server-side cursor.
+    """
+    acc = {}
+    sql = "SELECT job_name, run_at, status, duration_seconds, rows_loaded FROM etl_runs WHERE status <> 'running'"
+    params = {}
+    if job_name:
+        sql += " AND job_name = :job_name"
+        params["job_name"] = job_name
+    with get_engine().begin() as conn:
+        result = conn.execution_options(stream_results=True).execute(text(sql), params)
+        for job, run_at, status, duration, rows in result:
+            run_at = run_at.astimezone(timezone.utc)
+            for grain in GRAINS:
+                start = run_at.replace(minute=0, second=0, microsecond=0)
+                if grain == "day":
+                    start = start.replace(hour=0)
+                b = acc.get((job, grain, start))
+                if b is None:
+                    b = acc[(job, grain, start)] = _empty_bucket(job, grain, start)
+                _add_run(b, status, duration, rows)
+
+        delete = "DELETE FROM etl_run_rollups" + (" WHERE job_name = :job_name" if job_name else "")
+        conn.execute(text(delete), params)
+        if acc:
+            conn.execute(text("""
+                INSERT INTO etl_run_rollups (job_name, grain, bucket_start, runs, failures, duration_sum,
+                                             duration_max, rows_sum, rows_max, duration_hist, rows_hist)
+                VALUES (:job_name, :grain, :bucket_start, :runs, :failures, :duration_sum,
+                        :duration_max, :rows_sum, :rows_max, :duration_hist, :rows_hist)
+            """), list(acc.values()))
+    print(f"Rebuilt {len(acc)} rollup rows.")
+    return len(acc)
+
+
+def _empty_bucket(job, grain, start) -> dict:
+    return {"job_name": job, "grain": grain, "bucket_start": start, "runs": 0, "failures": 0,
+            "duration_sum": 0.0, "duration_max": None, "rows_sum": 0, "rows_max": None,
+            "duration_hist": [0] * (len(DURATION_BOUNDS) + 1), "rows_hist": [0] * (len(ROWS_BOUNDS) + 1)}
+
+
+def _add_run(b: dict, status, duration, rows):
+    b["runs"] += 1
+    b["failures"] += 1 if status == "failed" else 0
+    if duration is not None:
+        duration = float(duration)
+        b["duration_sum"] += duration
+        b["duration_max"] = duration if b["duration_max"] is None else max(b["duration_max"], duration)
+        b["duration_hist"][_bucket_index(duration, DURATION_BOUNDS)] += 1
+    if rows is not None:
+        b["rows_sum"] += int(rows)
+        b["rows_max"] = int(rows) if b["rows_max"] is None else max(b["rows_max"], int(rows))
+        b["rows_hist"][_bucket_index(rows, ROWS_BOUNDS)] += 1
+
+
+def hist_percentile(hist, bounds, q: float, max_value=None):
+    """
+    Estimate the q-quantile from bucket counts, interpolating linearly inside the bucket.
+    The overflow bucket is capped by max_value (the observed max) when known.
+    """
+    total = sum(hist)
+    if total == 0:
+        return None
+    target = q * total
+    seen = 0
+    for i, n in enumerate(hist):
+        if n and seen + n >= target:
+            lo = bounds[i - 1] if i > 0 else 0.0
+            hi = bounds[i] if i < len(bounds) else (max_value if max_value is not None else bounds[-1])
+            if max_value is not None:
+                hi = min(hi, float(max_value))
+            lo = min(lo, hi)
+            return round(lo + (hi - lo) * (target - seen) / n, 3)
+        seen += n
+    return float(max_value) if max_value is not None else float(bounds[-1])
+
+
+def summarize_buckets(buckets: list) -> dict:
+    """Merge rollup rows (dicts as stored in etl_run_rollups) into one summary."""
+    merged = _empty_bucket(None, None, None)
+    for b in buckets:
+        merged["runs"] += b["runs"]
+        merged["failures"] += b["failures"]
+        merged["duration_sum"] += float(b["duration_sum"] or 0)
+        merged["rows_sum"] += int(b["rows_sum"] or 0)
+        for k in ("duration_max", "rows_max"):
+            if b[k] is not None:
+                merged[k] = b[k] if merged[k] is None else max(merged[k], b[k])
+        for k in ("duration_hist", "rows_hist"):
+            merged[k] = [a + c for a, c in zip(merged[k], b[k])]
+    timed = sum(merged["duration_hist"])
+    out = {
+        "runs": merged["runs"],
+        "failures": merged["failures"],
+        "failure_rate": round(merged["failures"] / merged["runs"], 4) if merged["runs"] else None,
+        "duration_avg": round(merged["duration_sum"] / timed, 3) if timed else None,
+        "duration_max": float(merged["duration_max"]) if merged["duration_max"] is not None else None,
+        "rows_total": merged["rows_sum"],
+    }
+    for q in (50, 95, 99):
+        out[f"duration_p{q}"] = hist_percentile(merged["duration_hist"], DURATION_BOUNDS, q / 100,
+                                                merged["duration_max"])
+        out[f"rows_p{q}"] = hist_percentile(merged["rows_hist"], ROWS_BOUNDS, q / 100, merged["rows_max"])
+    return out
+
+
+def fetch_rollups(grain: str = "day", since: datetime | None = None, job_name: str | None = None) -> list:
+    sql = """
+        SELECT job_name, grain, bucket_start, runs, failures, duration_sum, duration_max,
+               rows_sum, rows_max, duration_hist, rows_hist
+        FROM etl_run_rollups
+        WHERE grain = :grain AND bucket_start >= :since
+    """
+    params = {"grain": grain, "since": since or datetime(1970, 1, 1, tzinfo=timezone.utc)}
+    if job_name:
+        sql += " AND job_name = :job_name"
+        params["job_name"] = job_name
+    sql += " ORDER BY bucket_start, job_name"
+    with get_engine().connect() as conn:
+        return [dict(r._mapping) for r in conn.execute(text(sql), params)]
+
+
+def fetch_last_runs(limit: int = 20, job_name: str | None = None) -> list:
+    # served by idx_etl_runs_run_at: reads `limit` index entries, never the whole table
+    sql = "SELECT run_id, job_name, run_at, finished_at, status, duration_seconds, rows_loaded FROM etl_runs"
+    params = {"limit": limit}
+    if job_name:
+        sql += " WHERE job_name = :job_name"
+        params["job_name"] = job_name
+    sql += " ORDER BY run_at DESC LIMIT :limit"
+    with get_engine().connect() as conn:
+        return [dict(r._mapping) for r in conn.execute(text(sql), params)]
+
+
+def build_report(buckets: list, last_runs: list | None = None, grain: str = "day", days: float = 7,
+                 job_name: str | None = None) -> dict:
+    per_bucket = []
+    by_start = {}
+    for b in buckets:
+        by_start.setdefault(b["bucket_start"], []).append(b)
+    for start in sorted(by_start):
+        row = summarize_buckets(by_start[start])
+        row["bucket_start"] = start.isoformat()
+        per_bucket.append(row)
+    return {
+        "generated_at": datetime.now(tz=timezone.utc).isoformat(),
+        "job_name": job_name,
+        "grain": grain,
+        "days": days,
+        "summary": summarize_buckets(buckets),
+        "buckets": per_bucket,
+        "last_runs": [_run_row(r) for r in (last_runs or [])],
+    }
+
+
+def _run_row(r: dict) -> dict:
+    # etl_runs row -> JSON-friendly dict
+    out = dict(r)
+    out["run_id"] = str(out["run_id"])
+    for k in ("run_at", "finished_at"):
+        if out.get(k) is not None:
+            out[k] = out[k].isoformat()
+    if out.get("duration_seconds") is not None:
+        out["duration_seconds"] = float(out["duration_seconds"])
+    return out
+
+
+def _fmt(v, suffix=""):
+    return "-" if v is None else f"{v}{suffix}"
+
+
+def format_report(report: dict) -> str:
+    s = report["summary"]
+    lines = [
+        f"ETL MONITOR REPORT — {report['generated_at']}",
+        f"Job: {report['job_name'] or 'all'} | window: last {report['days']} day(s) | grain: {report['grain']}",
+        "",
+        "1) Summary",
+        f"  runs={s['runs']} failures={s['failures']} failure_rate={_fmt(s['failure_rate'])}",
+        f"  duration avg={_fmt(s['duration_avg'], 's')} p50={_fmt(s['duration_p50'], 's')} "
+        f"p95={_fmt(s['duration_p95'], 's')} p99={_fmt(s['duration_p99'], 's')} max={_fmt(s['duration_max'], 's')}",
+        f"  rows total={s['rows_total']} p50={_fmt(s['rows_p50'])} p95={_fmt(s['rows_p95'])} p99={_fmt(s['rows_p99'])}",
+        "",
+        f"2) Per {report['grain']}",
+        "bucket_start | runs | failures | fail_rate | p50_s | p95_s | p99_s | rows",
+        "--------------------------------------------------------------------------",
+    ]
+    for b in report["buckets"]:
+        lines.append(f"{b['bucket_start']} | {b['runs']} | {b['failures']} | {_fmt(b['failure_rate'])} | "
+                     f"{_fmt(b['duration_p50'])} | {_fmt(b['duration_p95'])} | {_fmt(b['duration_p99'])} | "
+                     f"{b['rows_total']}")
+    if report["last_runs"]:
+        lines += [
+            "",
+            f"3) Last {len(report['last_runs'])} runs (most recent first)",
+            "run_id | job_name | run_at | finished_at | status | duration_seconds | rows_loaded",
+            "--------------------------------------------------------------------------------",
+        ]
+        for r in report["last_runs"]:
+            lines.append(" | ".join(_fmt(r.get(k)) for k in
+                                    ("run_id", "job_name", "run_at", "finished_at", "status",
+                                     "duration_seconds", "rows_loaded")))
+    return "\n".join(lines)
+
+
+def report(grain: str = "day", days: float = 7, job_name: str | None = None, last: int = 20) -> dict:
+    since = datetime.now(tz=timezone.utc) - timedelta(days=days)
+    if grain == "hour":
+        since = since.replace(minute=0, second=0, microsecond=0)
+    else:
+        since = since.replace(hour=0, minute=0, second=0, microsecond=0)
+    buckets = fetch_rollups(grain, since, job_name)
+    last_runs = fetch_last_runs(last, job_name) if last else []
+    return build_report(buckets, last_runs, grain=grain, days=days, job_name=job_name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ETL run monitoring (served from etl_run_rollups)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("report", help="run counts, failure rate and duration/rows percentiles")
+    p.add_argument("--grain", choices=GRAINS, default="day")
+    p.add_argument("--days", type=float, default=7, help="report window in days")
+    p.add_argument("--job", help="only this job_name")
+    p.add_argument("--last", type=int, default=20, help="also list the last N runs (0 to skip)")
+    p.add_argument("--format", choices=("text", "json"), default="text")
+    p.add_argument("--output", help="also append the report to this file")
+    r = sub.add_parser("rebuild-rollups", help="recompute etl_run_rollups from etl_runs")
+    r.add_argument("--job", help="only this job_name")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "rebuild-rollups":
+        rebuild_rollups(args.job)
+        return 0
+    rep = report(grain=args.grain, days=args.days, job_name=args.job, last=args.last)
+    out = json.dumps(rep, indent=2, default=str) if args.format == "json" else format_report(rep)
+    print(out)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write(out + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
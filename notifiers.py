@@ -3,19 +3,33 @@
 Simple, robust Slack notifier.
 It will silently return if SLACK_WEBHOOK_URL is not configured.
 Designed to never raise during ETL (fail-safe).
+
+notify() hands messages to a background NotificationDispatcher so the ETL never waits
+on Slack: failures are posted right away, successes are merged into periodic digests.
 """
 
 import os
+import time
+import queue
+import atexit
+import threading
 import requests
 import traceback
 
-def slack_notify(text: str, blocks: dict | None = None, username: str = "ETL Bot", icon_emoji: str = ":gear:"):
+DIGEST_SECONDS = float(os.getenv("SLACK_DIGEST_SECONDS", "300"))
+QUEUE_SIZE = int(os.getenv("SLACK_QUEUE_SIZE", "100"))
+FLUSH_TIMEOUT = float(os.getenv("SLACK_FLUSH_TIMEOUT", "5"))
+DIGEST_MAX_ITEMS = 20
+
+def slack_notify(text: str, blocks: dict | None = None, username: str = "ETL Bot", icon_emoji: str = ":gear:",
+                 url: str | None = None, session: requests.Session | None = None):
     """
     Send a message to Slack via Incoming Webhook.
     - text: plain text fallback shown in clients
     - blocks: optional Slack Blocks JSON (dict or list); if provided it will be posted as 'blocks'
+    - url / session: webhook override and a keep-alive session (used by the dispatcher)
     """
-    url = os.getenv("SLACK_WEBHOOK_URL")
+    url = url or os.getenv("SLACK_WEBHOOK_URL")
     if not url:
         return False
 
@@ -25,7 +39,7 @@ def slack_notify(text: str, blocks: dict | None = None, username: str = "ETL Bot
 
     try:
         # small timeout so notifier doesn't hang ETL
-        resp = requests.post(url, json=payload, timeout=5)
+        resp = (session or requests).post(url, json=payload, timeout=5)
         resp.raise_for_status()
         return True
     except Exception as e:
@@ -35,3 +49,138 @@ def slack_notify(text: str, blocks: dict | None = None, username: str = "ETL Bot
         except Exception:
             pass
         return False
+
+
+class NotificationDispatcher:
+    """
+    Bounded queue + one worker thread posting to a Slack webhook over a reused connection.
+    - submit(text, urgent=True): posted as soon as the worker picks it up (failures)
+    - submit(text): buffered and merged into one digest every digest_interval seconds
+    - flush(timeout): post everything pending, waiting at most `timeout` seconds
+    submit() never blocks; when the queue is full the message is dropped and counted.
+    """
+
+    _FLUSH = object()
+    _STOP = object()
+
+    def __init__(self, url: str | None = None, digest_interval: float = DIGEST_SECONDS,
+                 max_queue: int = QUEUE_SIZE):
+        self.url = url or os.getenv("SLACK_WEBHOOK_URL")
+        self.digest_interval = digest_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._session = requests.Session()
+        self._pending = []
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._worker, name="slack-dispatcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, text: str, urgent: bool = False) -> bool:
+        if not self.url:
+            return False
+        try:
+            self._queue.put_nowait((text, urgent))
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+    def _post(self, text: str) -> None:
+        ok = slack_notify(text, url=self.url, session=self._session)
+        with self._lock:
+            if ok:
+                self.sent += 1
+            else:
+                self.failed += 1
+
+    def _send_digest(self) -> None:
+        if not self._pending:
+            return
+        items, self._pending = self._pending, []
+        if len(items) == 1:
+            self._post(items[0])
+            return
+        shown = items[:DIGEST_MAX_ITEMS]
+        text = f":package: *ETL digest* ({len(items)} messages)\n\n" + "\n\n".join(shown)
+        if len(items) > len(shown):
+            text += f"\n\n... and {len(items) - len(shown)} more"
+        self._post(text)
+
+    def _worker(self) -> None:
+        next_digest = None
+        while True:
+            timeout = None if next_digest is None else max(0.0, next_digest - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is self._STOP:
+                self._send_digest()
+                return
+            if isinstance(item, tuple) and item[0] is self._FLUSH:
+                self._send_digest()
+                next_digest = None
+                item[1].set()
+            elif item is not None:
+                text, urgent = item
+                if urgent:
+                    self._post(text)
+                else:
+                    self._pending.append(text)
+                    if next_digest is None:
+                        next_digest = time.monotonic() + self.digest_interval
+            if next_digest is not None and time.monotonic() >= next_digest:
+                self._send_digest()
+                next_digest = None
+
+    def flush(self, timeout: float = FLUSH_TIMEOUT) -> bool:
+        """Post queued and digested messages; returns False if the deadline passed first."""
+        if not self._thread.is_alive():
+            return True
+        done = threading.Event()
+        try:
+            self._queue.put((self._FLUSH, done), timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self, timeout: float = FLUSH_TIMEOUT) -> bool:
+        deadline = time.monotonic() + timeout
+        flushed = self.flush(timeout)
+        try:
+            self._queue.put(self._STOP, timeout=max(0.0, deadline - time.monotonic()))
+        except queue.Full:
+            return False
+        self._thread.join(max(0.0, deadline - time.monotonic()))
+        return flushed and not self._thread.is_alive()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"sent": self.sent, "failed": self.failed, "dropped": self.dropped,
+                    "queued": self._queue.qsize(), "pending_digest": len(self._pending)}
+
+
+_dispatcher: NotificationDispatcher | None = None
+_dispatcher_lock = threading.Lock()
+
+def get_dispatcher() -> NotificationDispatcher:
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = NotificationDispatcher()
+        return _dispatcher
+
+def notify(text: str, urgent: bool = False) -> bool:
+    """Queue a Slack message without blocking. urgent=True skips the success digest."""
+    if not os.getenv("SLACK_WEBHOOK_URL"):
+        return False
+    return get_dispatcher().submit(text, urgent=urgent)
+
+@atexit.register
+def _flush_at_exit():
+    # give pending notifications a bounded chance to go out before the process ends
+    if _dispatcher is not None:
+        _dispatcher.close(FLUSH_TIMEOUT)
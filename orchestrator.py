@@ -0,0 +1,323 @@
+# orchestrator.py
+"""
+Run several ETL jobs side by side.
+
+Jobs are defined in a JSON file (ETL_JOBS_FILE, default jobs.json): each names a coin
+universe, the quote currencies and how often it should run. Every due job goes to a thread
+pool and runs etl.run() under its own name, so each job gets its own etl_runs rows, alerts
+and metrics. The jobs spend most of their time waiting on the API (rate limiter) and the
+DB, so N jobs finish in about the time of the slowest one; threads (not processes) keep
+one shared rate limiter and HTTP session for all of them.
+
+Overlap protection: before a job runs it takes a Postgres session advisory lock keyed on
+the job name, on its own pooled connection. If the lock is held (a slow run of the same job
+from an earlier cron tick, another host, or this process), the job is skipped, or with
+"on_overlap": "queue" it waits up to queue_timeout for the lock and then re-checks whether
+it is still due. A killed run releases its lock when its connection drops.
+
+Job file:
+  {"jobs": [
+    {"name": "coingecko_daily_snapshot", "ids": ["bitcoin", "ethereum"], "every": "1d"},
+    {"name": "top500_hourly", "ids": "all", "max_pages": 2, "vs_currencies": ["usd", "eur"],
+     "every": "1h", "on_overlap": "queue", "queue_timeout": "10m"}
+  ]}
+  name (required), ids (list or "all"), vs_currencies (default COINGECKO_VS_CURRENCIES),
+  every ("30s", "15m", "1h", "1d" or seconds; omitted = every time the orchestrator runs),
+  max_pages, stream, engine, validate, on_overlap (skip | queue), queue_timeout, enabled.
+
+A job is due when its last successful run started at least `every` ago (minus
+ORCH_DUE_SLACK_SECONDS, so cron jitter does not push a job back a whole slot).
+
+Usage:
+  python orchestrator.py                       # run the due jobs once and exit (cron)
+  python orchestrator.py --loop --tick 30      # keep scheduling
+  python orchestrator.py --job top500_hourly --force
+  python orchestrator.py --list
+
+Stage CPU times and HTTP counters in etl_run_stages are charged per run (instrument.py),
+so concurrent jobs do not see each other's traffic; only peak RSS is process-wide. Each job holds up to two pooled DB connections (its run + its lock), so raise
+DB_POOL_SIZE / DB_MAX_OVERFLOW (load.py) together with --workers.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import signal
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+JOBS_FILE = os.getenv("ETL_JOBS_FILE", "jobs.json")
+WORKERS = int(os.getenv("ORCH_WORKERS", "4"))
+TICK_SECONDS = float(os.getenv("ORCH_TICK_SECONDS", "30"))
+DUE_SLACK_SECONDS = float(os.getenv("ORCH_DUE_SLACK_SECONDS", "60"))
+LOCK_NAMESPACE = 0x45544C  # "ETL"; first key of pg_advisory_lock(int, int), the job hash is the second
+OVERLAP_POLICIES = ("skip", "queue")
+
+_DURATION = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([smhd]?)\s*$")
+_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_duration(value) -> Optional[float]:
+    """"15m" / "1h" / "1d" / "30s" / 90 -> seconds; None stays None."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    m = _DURATION.match(str(value).lower())
+    if not m:
+        raise ValueError(f"bad duration {value!r} (use e.g. 30s, 15m, 1h, 1d)")
+    return float(m.group(1)) * _UNITS[m.group(2)]
+
+
+@dataclass
+class Job:
+    name: str
+    ids: Optional[List[str]] = None  # ["all"] = whole /coins/markets universe
+    vs_currencies: Optional[List[str]] = None
+    every: Optional[float] = None  # seconds
+    max_pages: Optional[int] = None
+    stream: bool = False
+    engine: Optional[str] = None
+    validate: Optional[bool] = None
+    on_overlap: str = "skip"
+    queue_timeout: float = 600.0
+    enabled: bool = True
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "Job":
+        unknown = set(d) - set(cls.__dataclass_fields__)
+        if unknown:
+            raise ValueError(f"job {d.get('name')!r}: unknown keys {sorted(unknown)}")
+        if not d.get("name"):
+            raise ValueError(f"job without a name: {d}")
+        d = dict(d)
+        if isinstance(d.get("ids"), str):
+            d["ids"] = [x.strip() for x in d["ids"].split(",") if x.strip()]
+        if isinstance(d.get("vs_currencies"), str):
+            d["vs_currencies"] = [c.strip() for c in d["vs_currencies"].split(",") if c.strip()]
+        if d.get("vs_currencies"):
+            d["vs_currencies"] = [c.lower() for c in d["vs_currencies"]]
+        d["every"] = parse_duration(d.get("every"))
+        if "queue_timeout" in d:
+            d["queue_timeout"] = parse_duration(d["queue_timeout"])
+        job = cls(**d)
+        if job.on_overlap not in OVERLAP_POLICIES:
+            raise ValueError(f"job {job.name!r}: on_overlap must be one of {OVERLAP_POLICIES}")
+        if job.stream and job.vs_currencies and job.vs_currencies != ["usd"]:
+            raise ValueError(f"job {job.name!r}: stream only supports vs_currencies ['usd']")
+        return job
+
+
+def load_jobs(path: str = JOBS_FILE, names: Optional[List[str]] = None) -> List[Job]:
+    """Enabled jobs from the job file (or just `names`, enabled or not)."""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    jobs = [Job.from_dict(d) for d in (data.get("jobs", []) if isinstance(data, dict) else data)]
+    seen = set()
+    for job in jobs:
+        if job.name in seen:
+            raise ValueError(f"duplicate job name {job.name!r} in {path}")
+        seen.add(job.name)
+    if names:
+        missing = set(names) - seen
+        if missing:
+            raise ValueError(f"no such job(s) in {path}: {sorted(missing)}")
+        return [j for j in jobs if j.name in names]
+    return [j for j in jobs if j.enabled]
+
+
+# -------------------------
+# Overlap protection + schedule
+# -------------------------
+def lock_key(job_name: str) -> int:
+    # stable across processes and hosts (unlike hash()); signed int4 for pg_advisory_lock(int, int)
+    k = zlib.crc32(job_name.encode("utf-8"))
+    return k - (1 << 32) if k >= (1 << 31) else k
+
+
+@contextmanager
+def job_lock(job_name: str, wait_seconds: float = 0.0):
+    """
+    Session advisory lock for one job on a dedicated pooled connection; yields True if
+    this caller holds it. wait_seconds > 0 queues behind the current holder (lock_timeout).
+    """
+    from load import get_engine
+    raw = get_engine().raw_connection()
+    got = False
+    try:
+        with raw.cursor() as cur:
+            if wait_seconds > 0:
+                cur.execute(f"SET lock_timeout = {int(wait_seconds * 1000)}")
+                try:
+                    cur.execute("SELECT pg_advisory_lock(%s, %s)", (LOCK_NAMESPACE, lock_key(job_name)))
+                    got = True
+                except Exception as e:
+                    if getattr(e, "pgcode", None) != "55P03":  # lock_not_available
+                        raise
+                    raw.rollback()
+                cur.execute("RESET lock_timeout")
+            else:
+                cur.execute("SELECT pg_try_advisory_lock(%s, %s)", (LOCK_NAMESPACE, lock_key(job_name)))
+                got = bool(cur.fetchone()[0])
+        raw.commit()  # session lock outlives the transaction; don't sit idle in one
+        yield got
+    finally:
+        try:
+            if got:
+                with raw.cursor() as cur:
+                    cur.execute("SELECT pg_advisory_unlock(%s, %s)", (LOCK_NAMESPACE, lock_key(job_name)))
+                raw.commit()
+        except Exception:
+            # never hand a connection that may still hold the lock back to the pool
+            logging.exception("Could not release lock for job %s; dropping the connection", job_name)
+            raw.invalidate()
+        raw.close()
+
+
+def last_success(job_name: str) -> Optional[datetime]:
+    """run_at of the job's latest successful etl_runs row (None if it never succeeded)."""
+    from sqlalchemy import text
+    from load import get_engine
+    with get_engine().connect() as conn:
+        return conn.execute(text("SELECT max(run_at) FROM etl_runs WHERE job_name = :job AND status = 'success'"),
+                            {"job": job_name}).scalar()
+
+
+def is_due(job: Job, now: Optional[datetime] = None) -> bool:
+    if not job.every:
+        return True
+    last = last_success(job.name)
+    if last is None:
+        return True
+    now = now or datetime.now(tz=timezone.utc)
+    return (now - last).total_seconds() >= job.every - DUE_SLACK_SECONDS
+
+
+# -------------------------
+# Running jobs
+# -------------------------
+def _run_etl(job: Job) -> int:
+    import etl
+    return etl.run(ids=job.ids, stream=job.stream, engine=job.engine, vs_currencies=job.vs_currencies,
+                   validate=job.validate, job_name=job.name, max_pages=job.max_pages)
+
+
+def run_job(job: Job, force: bool = False) -> dict:
+    """
+    One job under its advisory lock. Returns {"job", "status", "seconds", "detail"} with
+    status success | failed | skipped (lock held) | not_due | error (orchestrator-side problem).
+    """
+    threading.current_thread().name = job.name  # log lines carry the job name (etl.setup_logging(threads=True))
+    t0 = time.monotonic()
+
+    def result(status, detail=""):
+        return {"job": job.name, "status": status, "seconds": round(time.monotonic() - t0, 3), "detail": detail}
+
+    try:
+        wait = job.queue_timeout if job.on_overlap == "queue" else 0.0
+        with job_lock(job.name, wait) as got:
+            if not got:
+                logging.warning("Job %s skipped: a run of it is still in progress", job.name)
+                return result("skipped", "already running")
+            # checked under the lock: a queued job may find the run it waited for made it current
+            if not force and not is_due(job):
+                return result("not_due")
+            logging.info("Job %s starting", job.name)
+            rc = _run_etl(job)
+            return result("success" if rc == 0 else "failed", f"exit code {rc}" if rc else "")
+    except Exception as e:
+        logging.exception("Job %s could not be run: %s", job.name, e)
+        return result("error", str(e))
+
+
+def run_once(jobs: List[Job], workers: int = WORKERS, force: bool = False) -> List[dict]:
+    """Run every job once (those not due are skipped unless force); all in parallel up to workers."""
+    if not jobs:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(jobs))), thread_name_prefix="job") as pool:
+        return list(pool.map(lambda j: run_job(j, force), jobs))
+
+
+def run_loop(jobs: List[Job], workers: int = WORKERS, tick: float = TICK_SECONDS,
+             max_ticks: Optional[int] = None) -> int:
+    """
+    Long-running scheduler: every tick, submit each job that is not already in flight in
+    this process (run_job decides whether it is due). SIGTERM/SIGINT stop scheduling and
+    wait for running jobs.
+    """
+    stop = threading.Event()
+
+    def _on_signal(signum, frame):
+        logging.info("Received signal %s, waiting for running jobs", signum)
+        stop.set()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, _on_signal)
+
+    in_flight: Dict[str, object] = {}
+    ticks = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="job") as pool:
+        while not stop.is_set() and (max_ticks is None or ticks < max_ticks):
+            for job in jobs:
+                fut = in_flight.get(job.name)
+                if fut is not None and not fut.done():
+                    continue
+                if fut is not None:
+                    _log_result(fut.result())
+                in_flight[job.name] = pool.submit(run_job, job)
+            ticks += 1
+            stop.wait(tick)
+    for fut in in_flight.values():
+        _log_result(fut.result())
+    return 0
+
+
+def _log_result(r: dict) -> None:
+    if r["status"] != "not_due":
+        logging.info("Job %s: %s in %.1fs %s", r["job"], r["status"], r["seconds"], r["detail"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the ETL jobs from a job file concurrently")
+    parser.add_argument("--jobs-file", default=JOBS_FILE, help="job definitions (default: %(default)s)")
+    parser.add_argument("--job", action="append", help="only this job (repeatable; runs it even if disabled)")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="jobs run at the same time")
+    parser.add_argument("--force", action="store_true", help="run the selected jobs even if not due")
+    parser.add_argument("--loop", action="store_true", help="keep scheduling instead of one pass")
+    parser.add_argument("--tick", type=float, default=TICK_SECONDS, help="loop: seconds between schedule checks")
+    parser.add_argument("--list", action="store_true", help="print the jobs and exit")
+    args = parser.parse_args(argv)
+
+    try:
+        jobs = load_jobs(args.jobs_file, args.job)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if args.list:
+        for j in jobs:
+            print(f"{j.name:<32} every={j.every or '-'} ids={','.join(j.ids) if j.ids else 'default'} "
+                  f"vs={','.join(j.vs_currencies) if j.vs_currencies else 'default'} on_overlap={j.on_overlap}")
+        return 0
+
+    import etl
+    etl.setup_logging(threads=True)
+    if args.loop:
+        return run_loop(jobs, workers=args.workers, tick=args.tick)
+
+    t0 = time.monotonic()
+    results = run_once(jobs, workers=args.workers, force=args.force)
+    for r in results:
+        print(f"{r['job']:<32} {r['status']:<8} {r['seconds']:8.1f}s {r['detail']}")
+    print(f"{len(results)} job(s) in {time.monotonic() - t0:.1f}s")
+    return 1 if any(r["status"] in ("failed", "error") for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
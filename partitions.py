@@ -0,0 +1,303 @@
+# partitions.py
+"""
+Partition management for the monthly-partitioned crypto_price_snapshots (db_partitioned.sql).
+
+- maintain: create partitions for the current month and MONTHS_AHEAD months after it
+  (moving any matching rows out of the default partition first), then apply retention
+  to partitions older than RETAIN_MONTHS: detach them, or archive them to
+  data/archive/partitions/<name>.csv.gz and drop them
+- migrate:  convert an existing single-table install in place. The old table is renamed to
+  crypto_price_snapshots_legacy, the partitioned table takes its name (so upsert_df keeps
+  working from the first second), and history is copied over one month per transaction.
+  It is resumable: re-running continues with the months not copied yet.
+- list:     show partitions with row estimates and sizes
+
+Usage (e.g. daily from cron, next to run_etl.sh):
+  python partitions.py maintain [--ahead 3] [--retain 24 --retention detach|archive|none]
+  python partitions.py migrate [--drop-legacy]
+  python partitions.py list
+"""
+
+import os
+import re
+import sys
+import gzip
+import argparse
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+PARENT = "crypto_price_snapshots"
+DEFAULT_PARTITION = f"{PARENT}_default"
+LEGACY = f"{PARENT}_legacy"
+DDL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "db_partitioned.sql")
+ARCHIVE_DIR = os.path.join("data", "archive", "partitions")
+
+MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+RETAIN_MONTHS = int(os.getenv("PARTITION_RETAIN_MONTHS", "0"))  # 0 = keep everything
+RETENTION = os.getenv("PARTITION_RETENTION", "detach")  # detach | archive | none
+
+COLUMNS = [
+    "id", "symbol", "name", "snapshot_time", "price_usd", "price_change_24h", "price_change_percentage_24h",
+    "market_cap_usd", "market_cap_rank", "total_volume", "circulating_supply", "fetched_at", "raw_json",
+    "created_at", "updated_at",
+]
+
+_PART_NAME = re.compile(rf"^{PARENT}_p(\d{{4}})(\d{{2}})$")
+
+
+def month_start(dt: datetime) -> datetime:
+    return dt.astimezone(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(dt: datetime, n: int) -> datetime:
+    y, m = divmod(dt.month - 1 + n, 12)
+    return dt.replace(year=dt.year + y, month=m + 1)
+
+
+def partition_name(start: datetime) -> str:
+    return f"{PARENT}_p{start:%Y%m}"
+
+
+def _connect():
+    from load import get_engine
+    return get_engine().raw_connection()
+
+
+def is_partitioned(cur, table: str = PARENT) -> bool:
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+    row = cur.fetchone()
+    return bool(row) and row[0] == "p"
+
+
+def list_partitions(cur) -> List[Tuple[str, Optional[datetime]]]:
+    """(name, month start) for every monthly partition; the default partition is skipped."""
+    cur.execute("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s) ORDER BY c.relname
+    """, (PARENT,))
+    out = []
+    for (name,) in cur.fetchall():
+        m = _PART_NAME.match(name)
+        if m:
+            out.append((name, datetime(int(m.group(1)), int(m.group(2)), 1, tzinfo=timezone.utc)))
+    return out
+
+
+def create_month(cur, start: datetime) -> bool:
+    """
+    Create the partition for the month starting at `start` if it is missing. Rows already
+    sitting in the default partition for that month are moved into it first (Postgres
+    refuses to add a partition whose range the default partition still holds rows for).
+    Returns True if a partition was created.
+    """
+    name = partition_name(start)
+    end = add_months(start, 1)
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (name,))
+    if cur.fetchone()[0]:
+        return False
+    cur.execute(f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE snapshot_time >= %s AND snapshot_time < %s)",
+                (start, end))
+    if cur.fetchone()[0]:
+        cols = ", ".join(COLUMNS)
+        cur.execute(f"CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        cur.execute(f"""
+            WITH moved AS (
+                DELETE FROM {DEFAULT_PARTITION} WHERE snapshot_time >= %s AND snapshot_time < %s RETURNING {cols}
+            )
+            INSERT INTO {name} ({cols}) SELECT {cols} FROM moved
+        """, (start, end))
+        moved = cur.rowcount
+        cur.execute(f"ALTER TABLE {PARENT} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", (start, end))
+        print(f"Created {name} ({moved} rows moved out of {DEFAULT_PARTITION})")
+    else:
+        cur.execute(f"CREATE TABLE {name} PARTITION OF {PARENT} FOR VALUES FROM (%s) TO (%s)", (start, end))
+        print(f"Created {name}")
+    return True
+
+
+def ensure_partitions(cur, months_ahead: int = MONTHS_AHEAD, since: Optional[datetime] = None,
+                      now: Optional[datetime] = None) -> int:
+    """Create monthly partitions from `since` (default: this month) to now + months_ahead."""
+    first = month_start(since or now or datetime.now(tz=timezone.utc))
+    last = add_months(month_start(now or datetime.now(tz=timezone.utc)), months_ahead)
+    created = 0
+    start = first
+    while start <= last:
+        created += create_month(cur, start)
+        start = add_months(start, 1)
+    return created
+
+
+def archive_partition(cur, name: str, folder: str = ARCHIVE_DIR) -> str:
+    """Dump a (detached) partition to <folder>/<name>.csv.gz with a header row."""
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"{name}.csv.gz")
+    tmp = path + ".tmp"
+    with gzip.open(tmp, "wb") as f:
+        cur.copy_expert(f"COPY {name} ({', '.join(COLUMNS)}) TO STDOUT WITH (FORMAT csv, HEADER)", f)
+    os.replace(tmp, path)
+    return path
+
+
+def apply_retention(raw, retain_months: int = RETAIN_MONTHS, action: str = RETENTION,
+                    now: Optional[datetime] = None) -> List[str]:
+    """
+    Detach (and with action="archive", dump + drop) partitions that ended more than
+    `retain_months` months before the current month. The DETACH (which locks the parent
+    table) is committed on its own; the slow dump and the DROP run afterwards on the
+    standalone table, in a second transaction, so ETL loads are not held up by the dump.
+    """
+    if retain_months <= 0 or action == "none":
+        return []
+    cutoff = add_months(month_start(now or datetime.now(tz=timezone.utc)), -retain_months)
+    with raw.cursor() as cur:
+        old = [name for name, start in list_partitions(cur) if add_months(start, 1) <= cutoff]
+    done = []
+    for name in old:
+        with raw.cursor() as cur:
+            cur.execute(f"ALTER TABLE {PARENT} DETACH PARTITION {name}")
+        raw.commit()
+        if action == "archive":
+            with raw.cursor() as cur:
+                path = archive_partition(cur, name)
+                cur.execute(f"DROP TABLE {name}")
+            raw.commit()
+            print(f"Archived {name} to {path} and dropped it")
+        else:
+            print(f"Detached {name} (now a standalone table)")
+        done.append(name)
+    return done
+
+
+def maintain(months_ahead: int = MONTHS_AHEAD, retain_months: int = RETAIN_MONTHS, action: str = RETENTION) -> int:
+    raw = _connect()
+    try:
+        with raw.cursor() as cur:
+            if not is_partitioned(cur):
+                print(f"{PARENT} is not partitioned; run `python partitions.py migrate` first.")
+                return 1
+            created = ensure_partitions(cur, months_ahead)
+        raw.commit()
+        retired = apply_retention(raw, retain_months, action)
+        print(f"Partition maintenance done: {created} created, {len(retired)} retired.")
+        return 0
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+
+
+def migrate(drop_legacy: bool = False, months_ahead: int = MONTHS_AHEAD) -> int:
+    """
+    Single table -> partitioned table, without stopping the ETL for the whole copy:
+    1. one short transaction: rename the old table (and its indexes/sequence) to *_legacy,
+       create the partitioned table from db_partitioned.sql under the original name,
+       create partitions covering the legacy history, continue the id sequence
+    2. copy the legacy rows one month per transaction; rows the ETL already wrote into the
+       new table win (ON CONFLICT DO NOTHING), so a re-run just resumes
+    3. with drop_legacy, drop the old table once every month has been copied
+    Readers see the older months appear as they are copied.
+    """
+    raw = _connect()
+    try:
+        with raw.cursor() as cur:
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL", (LEGACY,))
+            has_legacy = cur.fetchone()[0]
+            if not is_partitioned(cur):
+                if has_legacy:
+                    raise RuntimeError(f"{LEGACY} already exists but {PARENT} is not partitioned; fix by hand")
+                cur.execute(f"LOCK TABLE {PARENT} IN ACCESS EXCLUSIVE MODE")
+                cur.execute(f"ALTER TABLE {PARENT} RENAME TO {LEGACY}")
+                # index and sequence names are schema-wide; free them for the new table
+                cur.execute("SELECT indexname FROM pg_indexes WHERE tablename = %s", (LEGACY,))
+                for (idx,) in cur.fetchall():
+                    cur.execute(f'ALTER INDEX "{idx}" RENAME TO "{idx[:50]}_legacy"')
+                cur.execute("SELECT pg_get_serial_sequence(%s, 'id')", (LEGACY,))
+                seq = cur.fetchone()[0]
+                if seq:
+                    cur.execute(f"ALTER SEQUENCE {seq} RENAME TO {LEGACY}_id_seq")
+                with open(DDL_PATH, "r", encoding="utf-8") as f:
+                    cur.execute(f.read())
+                cur.execute(f"SELECT min(snapshot_time), max(id) FROM {LEGACY}")
+                lo, max_id = cur.fetchone()
+                ensure_partitions(cur, months_ahead, since=lo)
+                if max_id is not None:
+                    cur.execute("SELECT setval(pg_get_serial_sequence(%s, 'id'), %s)", (PARENT, max_id))
+                raw.commit()
+                print(f"Swapped in partitioned {PARENT}; old table is now {LEGACY}.")
+                has_legacy = True
+            if not has_legacy:
+                print(f"{PARENT} is already partitioned and there is no {LEGACY} to copy.")
+                return 0
+
+            cur.execute(f"""
+                SELECT DISTINCT date_trunc('month', snapshot_time AT TIME ZONE 'UTC') AT TIME ZONE 'UTC'
+                FROM {LEGACY} ORDER BY 1
+            """)
+            months = [r[0] for r in cur.fetchall()]
+        cols = ", ".join(COLUMNS)
+        for start in months:
+            end = add_months(start, 1)
+            with raw.cursor() as cur:
+                create_month(cur, start)
+                cur.execute(f"""
+                    INSERT INTO {PARENT} ({cols})
+                    SELECT {cols} FROM {LEGACY}
+                    WHERE snapshot_time >= %s AND snapshot_time < %s
+                    ON CONFLICT (symbol, snapshot_time) DO NOTHING
+                """, (start, end))
+                print(f"Copied {start:%Y-%m}: {cur.rowcount} rows")
+            raw.commit()
+        if drop_legacy:
+            with raw.cursor() as cur:
+                cur.execute(f"DROP TABLE {LEGACY}")
+            raw.commit()
+            print(f"Dropped {LEGACY}.")
+        return 0
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+
+
+def show() -> int:
+    raw = _connect()
+    try:
+        with raw.cursor() as cur:
+            cur.execute("""
+                SELECT c.relname, c.reltuples::bigint, pg_size_pretty(pg_total_relation_size(c.oid)),
+                       pg_get_expr(c.relpartbound, c.oid)
+                FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = to_regclass(%s) ORDER BY c.relname
+            """, (PARENT,))
+            for name, rows, size, bound in cur.fetchall():
+                print(f"{name:<36} ~{max(rows, 0):>12,} rows  {size:>10}  {bound}")
+        return 0
+    finally:
+        raw.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Monthly partitions for crypto_price_snapshots")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    m = sub.add_parser("maintain", help="create upcoming partitions and retire old ones")
+    m.add_argument("--ahead", type=int, default=MONTHS_AHEAD, help="months to create ahead of the current one")
+    m.add_argument("--retain", type=int, default=RETAIN_MONTHS, help="months to keep attached (0 = all)")
+    m.add_argument("--retention", choices=("detach", "archive", "none"), default=RETENTION)
+    g = sub.add_parser("migrate", help="convert the single-table layout to the partitioned one")
+    g.add_argument("--drop-legacy", action="store_true", help="drop the old table after copying")
+    g.add_argument("--ahead", type=int, default=MONTHS_AHEAD)
+    sub.add_parser("list", help="show partitions")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "maintain":
+        return maintain(args.ahead, args.retain, args.retention)
+    if args.cmd == "migrate":
+        return migrate(args.drop_legacy, args.ahead)
+    return show()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,275 @@
+# prices.py
+"""
+Latest-price read path.
+
+- latest_prices table: one row per symbol, kept current by load.upsert_df (update_latest),
+  which only writes when a newer snapshot_time arrives (or the same snapshot was corrected)
+- get_latest(symbols): batched lookups through an in-process TTL + LRU cache; all misses of
+  one call are fetched with a single `symbol = ANY(...)` primary-key query
+- optional local HTTP endpoint:
+    python prices.py serve --port 8081
+    curl 'http://127.0.0.1:8081/latest?symbols=bitcoin,ethereum'
+  (symbols are CoinGecko ids, as in crypto_price_snapshots.symbol, not tickers)
+
+Usage:
+  python prices.py get bitcoin ethereum
+  python prices.py rebuild     # seed latest_prices from crypto_price_snapshots
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+LATEST_TABLE = "latest_prices"
+# column order of latest_prices inserts: the leading columns of load.UPSERT_COLUMNS
+LATEST_COLUMNS = [
+    "symbol", "name", "snapshot_time", "price_usd", "price_change_24h", "price_change_percentage_24h",
+    "market_cap_usd", "market_cap_rank", "total_volume", "circulating_supply", "fetched_at",
+]
+CACHE_TTL = float(os.getenv("PRICE_CACHE_TTL_SECONDS", "5"))
+CACHE_SIZE = int(os.getenv("PRICE_CACHE_SIZE", "10000"))
+
+# newer snapshot, or the same snapshot with corrected values; anything else writes nothing
+_LATEST_UPSERT = f"""
+INSERT INTO {LATEST_TABLE} AS l ({", ".join(LATEST_COLUMNS)})
+VALUES %s
+ON CONFLICT (symbol) DO UPDATE SET
+    {", ".join(f"{c} = EXCLUDED.{c}" for c in LATEST_COLUMNS[1:])},
+    updated_at = NOW()
+WHERE EXCLUDED.snapshot_time > l.snapshot_time
+   OR (EXCLUDED.snapshot_time = l.snapshot_time
+       AND ({", ".join("l." + c for c in LATEST_COLUMNS[3:10])})
+           IS DISTINCT FROM ({", ".join("EXCLUDED." + c for c in LATEST_COLUMNS[3:10])}))
+"""
+
+
+# -------------------------
+# Write path (called by load.upsert_df)
+# -------------------------
+def update_latest(cur, df: pd.DataFrame) -> int:
+    """
+    Fold the newest row per symbol of df into latest_prices on the caller's cursor (same
+    transaction as the upsert). Returns the number of symbols offered.
+    """
+    from psycopg2.extras import execute_values
+    from load import df_to_rows
+
+    if df is None or df.shape[0] == 0:
+        return 0
+    newest = df.dropna(subset=["symbol", "snapshot_time"]).sort_values("snapshot_time", kind="stable")
+    newest = newest.drop_duplicates("symbol", keep="last")
+    rows = [r[:len(LATEST_COLUMNS)] for r in df_to_rows(newest)]
+    if rows:
+        execute_values(cur, _LATEST_UPSERT, rows, page_size=1000)
+    return len(rows)
+
+
+def rebuild_latest() -> int:
+    """Seed/repair latest_prices from the snapshot table (one DISTINCT ON pass)."""
+    from load import get_engine, TABLE_NAME
+    cols = ", ".join(LATEST_COLUMNS)
+    raw = get_engine().raw_connection()
+    try:
+        with raw.cursor() as cur:
+            cur.execute(f"""
+                INSERT INTO {LATEST_TABLE} ({cols})
+                SELECT DISTINCT ON (symbol) {cols} FROM {TABLE_NAME}
+                ORDER BY symbol, snapshot_time DESC
+                ON CONFLICT (symbol) DO UPDATE SET
+                    {", ".join(f"{c} = EXCLUDED.{c}" for c in LATEST_COLUMNS[1:])}, updated_at = NOW()
+            """)
+            n = cur.rowcount
+        raw.commit()
+        print(f"latest_prices rebuilt: {n} symbols.")
+        return n
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+
+
+# -------------------------
+# Read path
+# -------------------------
+def _jsonable(v):
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, datetime):
+        return v.isoformat()
+    return v
+
+
+def fetch_latest(symbols: List[str]) -> Dict[str, dict]:
+    """One primary-key lookup for all symbols; symbols without a row are left out."""
+    from load import get_engine
+    if not symbols:
+        return {}
+    raw = get_engine().raw_connection()
+    try:
+        with raw.cursor() as cur:
+            cur.execute(f"SELECT {', '.join(LATEST_COLUMNS)} FROM {LATEST_TABLE} WHERE symbol = ANY(%s)",
+                        (list(symbols),))
+            out = {r[0]: {c: _jsonable(v) for c, v in zip(LATEST_COLUMNS, r)} for r in cur.fetchall()}
+        raw.commit()  # end the read transaction before the connection goes back to the pool
+        return out
+    finally:
+        raw.close()
+
+
+class LatestPriceCache:
+    """
+    Thread-safe TTL + LRU cache in front of fetch(symbols) -> {symbol: row}.
+    Unknown symbols are cached too (as None) so repeated misses do not hit the DB.
+    """
+
+    def __init__(self, ttl: float = CACHE_TTL, maxsize: int = CACHE_SIZE,
+                 fetch: Optional[Callable[[List[str]], Dict[str, dict]]] = None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.fetch = fetch or fetch_latest
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()  # symbol -> (expires_at, row | None)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.queries = 0
+
+    def get_many(self, symbols: Iterable[str]) -> Dict[str, Optional[dict]]:
+        symbols = list(dict.fromkeys(symbols))  # de-dup, keep order
+        now = time.monotonic()
+        out: Dict[str, Optional[dict]] = {}
+        missing = []
+        with self._lock:
+            for s in symbols:
+                item = self._data.get(s)
+                if item is not None and item[0] > now:
+                    self._data.move_to_end(s)
+                    out[s] = item[1]
+                else:
+                    missing.append(s)
+            self.hits += len(symbols) - len(missing)
+            self.misses += len(missing)
+        if missing:
+            fetched = self.fetch(missing)
+            expires = time.monotonic() + self.ttl
+            with self._lock:
+                self.queries += 1
+                for s in missing:
+                    row = fetched.get(s)
+                    out[s] = row
+                    self._data[s] = (expires, row)
+                    self._data.move_to_end(s)
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+        return {s: out[s] for s in symbols}
+
+    def invalidate(self, symbols: Optional[Iterable[str]] = None) -> None:
+        with self._lock:
+            if symbols is None:
+                self._data.clear()
+            else:
+                for s in symbols:
+                    self._data.pop(s, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._data), "hits": self.hits, "misses": self.misses, "queries": self.queries}
+
+
+_cache: Optional[LatestPriceCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> LatestPriceCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LatestPriceCache()
+        return _cache
+
+
+def get_latest(symbols: Iterable[str]) -> Dict[str, Optional[dict]]:
+    """Latest row per symbol (None if unknown), served from the process-wide cache."""
+    return get_cache().get_many(symbols)
+
+
+# -------------------------
+# Local HTTP endpoint
+# -------------------------
+class _Handler(BaseHTTPRequestHandler):
+    cache: LatestPriceCache = None  # set by serve()
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, payload) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/latest":
+            raw = ",".join(parse_qs(url.query).get("symbols", []))
+            symbols = [s.strip() for s in raw.split(",") if s.strip()]
+            if not symbols:
+                return self._send(400, {"error": "pass ?symbols=bitcoin,ethereum"})
+            try:
+                return self._send(200, self.cache.get_many(symbols))
+            except Exception as e:
+                return self._send(503, {"error": str(e)})
+        if url.path == "/stats":
+            return self._send(200, self.cache.stats())
+        if url.path == "/healthz":
+            return self._send(200, {"ok": True})
+        return self._send(404, {"error": "not found"})
+
+
+def serve(host: str = "127.0.0.1", port: int = 8081, cache: Optional[LatestPriceCache] = None):
+    handler = type("Handler", (_Handler,), {"cache": cache or get_cache()})
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f"Serving latest prices on http://{host}:{server.server_port}/latest?symbols=...")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Latest price lookups")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    g = sub.add_parser("get", help="print the latest rows for some symbols")
+    g.add_argument("symbols", nargs="+", help="CoinGecko ids, e.g. bitcoin ethereum")
+    s = sub.add_parser("serve", help="local HTTP endpoint")
+    s.add_argument("--host", default="127.0.0.1")
+    s.add_argument("--port", type=int, default=8081)
+    sub.add_parser("rebuild", help="seed latest_prices from the snapshot table")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "get":
+        print(json.dumps(get_latest(args.symbols), indent=2))
+    elif args.cmd == "serve":
+        serve(args.host, args.port)
+    else:
+        rebuild_latest()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
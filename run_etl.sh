@@ -8,5 +8,5 @@ source venv_wsl/bin/activate
 # rotate logs (keep last 30)
 LOGDIR=logs
 mkdir -p "$LOGDIR"
-python etl.py 2>&1 | tee "$LOGDIR/etl_last.log"
+python cli.py run "$@" 2>&1 | tee "$LOGDIR/etl_last.log"
 
@@ -0,0 +1,20 @@
+import os
+
+import pytest
+
+from archive import ArchiveWriter, iter_manifest, latest_entry, read_records
+
+
+def test_failed_write_leaves_no_file_and_no_manifest_entry(tmp_path):
+    root = str(tmp_path)
+    with ArchiveWriter(root=root) as w:
+        w.write({"id": "bitcoin", "last_updated": "2025-11-13T08:00:00.000Z"})
+    good = latest_entry(root)
+    assert good["records"] == 1 and read_records(w.path)[0]["id"] == "bitcoin"
+
+    with pytest.raises(RuntimeError):
+        with ArchiveWriter(root=root) as failed:
+            failed.write({"id": "ethereum", "last_updated": "2025-11-13T09:00:00.000Z"})
+            raise RuntimeError("page 2 failed")
+    assert not os.path.exists(failed.path)
+    assert latest_entry(root) == good and len(list(iter_manifest(root))) == 1
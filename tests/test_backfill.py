@@ -0,0 +1,109 @@
+from datetime import datetime, timedelta, timezone
+
+import extract_coingecko
+import backfill
+from extract_coingecko import split_windows
+from transform import OUTPUT_COLUMNS, transform_market_chart
+
+
+def _utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def test_split_windows_on_fixed_grid():
+    since, until = _utc(2025, 1, 15), _utc(2025, 9, 1)
+    windows = split_windows(since, until, 90)
+    assert windows[0][0] == since and windows[-1][1] == until
+    assert all(a[1] == b[0] for a, b in zip(windows, windows[1:]))
+    assert all(e - s <= timedelta(days=90) for s, e in windows)
+    # a later start keeps the same inner windows (stable checkpoint keys)
+    assert split_windows(_utc(2025, 2, 1), until, 90)[1:] == windows[1:]
+
+
+def test_split_windows_widens_short_edge_windows():
+    # grid edges at multiples of 30 days since the epoch; 2025-01-12 is one
+    edge = _utc(2025, 1, 12)
+    since, until = edge - timedelta(hours=3), edge + timedelta(days=30, hours=5)
+    windows = split_windows(since, until, 30)
+    assert windows[0] == (since, since + timedelta(days=2))
+    assert windows[1] == (edge, edge + timedelta(days=30))
+    assert windows[-1] == (until - timedelta(days=2), until)  # not a 5-hour (5-minutely) window
+    assert split_windows(since, since + timedelta(hours=1), 30) == [(since - timedelta(hours=47), since + timedelta(hours=1))]
+
+
+def test_transform_market_chart_columns():
+    payload = {
+        "prices": [[1735689600000, 94000.5], [1735693200000, 94100.0]],
+        "market_caps": [[1735689600000, 1.86e12]],
+        "total_volumes": [[1735689600000, 3.1e10], [1735693200000, None]],
+    }
+    df = transform_market_chart("bitcoin", payload)
+    assert list(df.columns) == OUTPUT_COLUMNS
+    assert df["snapshot_time"].tolist() == [_utc(2025, 1, 1, 0), _utc(2025, 1, 1, 1)]
+    assert df["market_cap_usd"].isna().tolist() == [False, True]
+    assert df["price_usd"].tolist() == [94000.5, 94100.0]
+    assert transform_market_chart("bitcoin", {"prices": []}).empty
+
+
+def test_history_backfill_resumes_from_checkpoint(tmp_path, monkeypatch):
+    calls = []
+
+    def fake_fetch(coin, start, end, vs_currency="usd", session=None):
+        calls.append((coin, start))
+        if coin == "broken":
+            raise ValueError("boom")
+        return {"prices": [[int(start.timestamp() * 1000), 1.0]]}
+
+    loaded = []
+
+    def fake_load(df, method, **kwargs):
+        # history points have no name/rank/24h fields: never into latest_prices, never blank a snapshot
+        assert kwargs == {"update_latest": False, "partial": True}
+        loaded.append(len(df))
+        return {"inserted": len(df), "updated": 0, "skipped": 0}, 0.0
+
+    monkeypatch.setattr(extract_coingecko, "fetch_market_chart_range", fake_fetch)
+    monkeypatch.setattr(backfill, "_load_frame", fake_load)
+    checkpoint = backfill.Checkpoint(str(tmp_path / "ckpt.json"))
+    since, until = _utc(2025, 1, 1), _utc(2025, 6, 1)
+
+    totals = backfill.backfill_history(["bitcoin", "broken"], since, until, window_days=30, workers=3,
+                                       checkpoint=checkpoint)
+    n = len(split_windows(since, until, 30))
+    assert totals["windows"] == n and totals["failed"] == n and sum(loaded) == n
+
+    calls.clear()
+    totals = backfill.backfill_history(["bitcoin", "broken"], since, until, window_days=30,
+                                       checkpoint=backfill.Checkpoint(str(tmp_path / "ckpt.json")))
+    assert totals["windows"] == 0
+    assert {c for c, _ in calls} == {"broken"}  # only the failed windows are fetched again
+
+
+def test_file_backfill_skips_bad_files_and_resumes(tmp_path, monkeypatch):
+    import json
+    paths = []
+    for i, hour in enumerate((8, 9, 10)):
+        path = tmp_path / f"raw_coingecko_20251113T{hour:02d}0000Z.json"
+        if i == 1:
+            path.write_text("{not json")  # corrupt file in the middle of the range
+        else:
+            path.write_text(json.dumps([{"id": "bitcoin", "current_price": 1.0 + i,
+                                         "last_updated": f"2025-11-13T{hour:02d}:00:00Z"}]))
+        paths.append(str(path))
+
+    loaded = []
+
+    def fake_load(df, method, **kwargs):
+        loaded.append(len(df))
+        return {"inserted": len(df), "updated": 0, "skipped": 0}, 0.0
+
+    monkeypatch.setattr(backfill, "_load_frame", fake_load)
+    ckpt = str(tmp_path / "ckpt.json")
+    totals = backfill.backfill(paths, workers=2, db_workers=1, checkpoint=backfill.Checkpoint(ckpt))
+    assert totals["files"] == 2 and totals["failed"] == 1 and totals["rows"] == 2
+
+    checkpoint = backfill.Checkpoint(ckpt)
+    assert [checkpoint.is_done(p) for p in paths] == [True, False, True]
+    loaded.clear()
+    totals = backfill.backfill(paths, workers=2, db_workers=1, checkpoint=checkpoint)
+    assert totals["files"] == 0 and totals["failed"] == 1 and loaded == []  # only the bad file is retried
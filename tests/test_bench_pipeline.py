@@ -0,0 +1,42 @@
+import json
+
+from benchmarks.bench_pipeline import compare, make_payload, over_budget
+from transform import transform_market_response
+
+
+def test_payload_has_dirty_records_and_transforms():
+    payload = make_payload(2000)
+    assert len(payload) == 2000
+    assert any(r.get("current_price") is None for r in payload)
+    assert any(isinstance(r.get("market_cap"), str) for r in payload)
+    assert any("circulating_supply" not in r for r in payload)
+    df = transform_market_response(payload)
+    # duplicates of (symbol, snapshot_time) are dropped, nothing else is
+    assert 0 < len(df) < 2000
+    assert df["total_volume"].dtype.kind == "f"  # "N/A" coerced to NaN
+
+
+def test_compare_flags_only_slowdowns_past_threshold(tmp_path):
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text(json.dumps({"results": [
+        {"stage": "transform", "size": 1000, "records_per_s": 1000.0},
+        {"stage": "extract_parse", "size": 1000, "records_per_s": 1000.0},
+    ]}))
+    current = [
+        {"stage": "transform", "size": 1000, "records_per_s": 600.0},
+        {"stage": "extract_parse", "size": 1000, "records_per_s": 900.0},
+        {"stage": "load_copy", "size": 1000, "records_per_s": 10.0},
+    ]
+    regressions = compare(current, str(baseline), threshold=0.25)
+    assert [(r[0], r[1]) for r in regressions] == [("transform", 1000)]
+
+
+def test_over_budget_compares_stage_time_to_its_reference():
+    results = [
+        {"stage": "transform", "size": 1000, "seconds": 1.0},
+        {"stage": "validate", "size": 1000, "seconds": 0.1},
+        {"stage": "transform", "size": 10000, "seconds": 2.0},
+        {"stage": "validate", "size": 10000, "seconds": 0.5},
+        {"stage": "validate", "size": 99, "seconds": 9.0},  # no transform row to compare with
+    ]
+    assert [(s, n, ref) for s, n, ref, _, _ in over_budget(results)] == [("validate", 10000, "transform")]
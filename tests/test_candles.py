@@ -0,0 +1,100 @@
+import os
+
+import pandas as pd
+import pytest
+
+import candles
+from candles import touched_buckets, update_candles
+
+
+def test_touched_buckets_are_distinct_utc_hours_and_days():
+    df = pd.DataFrame({
+        "symbol": ["btc", "btc", "eth", "btc", "btc"],
+        "snapshot_time": pd.to_datetime([
+            "2025-11-13T08:27:11Z", "2025-11-13T08:59:59Z", "2025-11-13T09:00:00Z",
+            "2025-11-14T01:30:00+02:00", None,  # 23:30 UTC on the 13th
+        ], utc=True),
+    })
+    symbols, starts = touched_buckets(df, "h")
+    # sorted, so concurrent loads write candle rows in the same order
+    assert list(zip(symbols, [s.isoformat() for s in starts])) == [
+        ("btc", "2025-11-13T08:00:00+00:00"),
+        ("btc", "2025-11-13T23:00:00+00:00"),
+        ("eth", "2025-11-13T09:00:00+00:00"),
+    ]
+    symbols, starts = touched_buckets(df, "D")
+    assert sorted(zip(symbols, [s.isoformat() for s in starts])) == [
+        ("btc", "2025-11-13T00:00:00+00:00"), ("eth", "2025-11-13T00:00:00+00:00"),
+    ]
+
+
+class RecordingCursor:
+    def __init__(self):
+        self.calls = []
+
+    def execute(self, sql, params=None):
+        self.calls.append((sql, params))
+
+
+def test_update_candles_locks_symbols_before_reading_snapshots():
+    df = pd.DataFrame({"symbol": ["eth", "btc", "eth"],
+                       "snapshot_time": pd.to_datetime(["2025-11-13T09:00Z", "2025-11-13T08:00Z",
+                                                        "2025-11-13T08:30Z"], utc=True)})
+    cur = RecordingCursor()
+    update_candles(cur, df)
+    (lock_sql, lock_params), (hourly_sql, hourly_params), (daily_sql, _) = cur.calls
+    assert "pg_advisory_xact_lock" in lock_sql and lock_params["keys"] == candles.lock_stripes(["btc", "eth"])
+    assert candles.SNAPSHOT_TABLE in hourly_sql and hourly_params["symbols"] == ["btc", "eth", "eth"]
+    assert "crypto_candles_1d" in daily_sql
+
+
+def test_lock_count_is_bounded_for_a_full_universe_load():
+    symbols = [f"coin-{i}" for i in range(17000)]
+    keys = candles.lock_stripes(symbols)
+    assert keys == sorted(set(keys)) and len(keys) <= candles.LOCK_STRIPES
+    assert all(0 <= k < candles.LOCK_STRIPES for k in keys)
+    df = pd.DataFrame({"symbol": symbols, "snapshot_time": pd.Timestamp("2025-11-13T08:00Z")})
+    cur = RecordingCursor()
+    update_candles(cur, df)
+    assert len(cur.calls[0][1]["keys"]) <= candles.LOCK_STRIPES
+
+
+# the aggregation is SQL; run it against a real Postgres when one is configured (temp tables
+# shadow the real ones, and the transaction is rolled back)
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason="set TEST_DATABASE_URL to run against Postgres")
+def test_candle_aggregation_in_postgres():
+    import psycopg2
+    conn = psycopg2.connect(TEST_DATABASE_URL.replace("+psycopg2", ""))
+    rows = [
+        ("btc", "2025-11-13T08:05:00Z", 100, 1.0), ("btc", "2025-11-13T08:20:00Z", None, 2.0),
+        ("btc", "2025-11-13T08:30:00Z", 120, None), ("btc", "2025-11-13T08:50:00Z", 90, 4.0),
+        ("btc", "2025-11-13T08:55:00Z", 110, 5.0), ("btc", "2025-11-13T09:10:00Z", 200, 6.0),
+    ]
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE TEMP TABLE crypto_price_snapshots (symbol TEXT, snapshot_time TIMESTAMPTZ,
+                    price_usd NUMERIC, total_volume NUMERIC, market_cap_usd NUMERIC);
+                CREATE TEMP TABLE crypto_candles_1h (symbol TEXT, bucket_start TIMESTAMPTZ, open NUMERIC,
+                    high NUMERIC, low NUMERIC, close NUMERIC, volume NUMERIC, market_cap NUMERIC,
+                    samples INTEGER NOT NULL, first_time TIMESTAMPTZ, last_time TIMESTAMPTZ,
+                    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(), PRIMARY KEY (symbol, bucket_start));
+                CREATE TEMP TABLE crypto_candles_1d (LIKE crypto_candles_1h INCLUDING ALL);
+            """)
+            cur.executemany("INSERT INTO crypto_price_snapshots VALUES (%s, %s, %s, %s, NULL)", rows)
+            df = pd.DataFrame({"symbol": [r[0] for r in rows],
+                               "snapshot_time": pd.to_datetime([r[1] for r in rows], utc=True)})
+            assert update_candles(cur, df) == {"1h": 2, "1d": 1}
+            cur.execute("SELECT open, high, low, close, volume, samples FROM crypto_candles_1h ORDER BY bucket_start")
+            hourly = [tuple(float(v) for v in r) for r in cur.fetchall()]
+            cur.execute("SELECT open, high, low, close, volume, samples FROM crypto_candles_1d")
+            daily = [tuple(float(v) for v in r) for r in cur.fetchall()]
+    finally:
+        conn.rollback()
+        conn.close()
+    # open/close skip the null price, volume is the last non-null value, samples count every snapshot
+    assert hourly == [(100, 120, 90, 110, 5, 5), (200, 200, 200, 200, 6, 1)]
+    assert daily == [(100, 200, 90, 200, 6, 6)]
@@ -0,0 +1,40 @@
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ("pandas", "numpy", "sqlalchemy", "psycopg2")
+
+# generous: a bare interpreter starts in ~50 ms, importing pandas alone takes ~500 ms
+STARTUP_BUDGET_S = 0.35
+
+
+def _run_cli(*argv, env=None):
+    """Run cli.main(argv) in a fresh interpreter; returns (seconds, exit code, heavy modules imported)."""
+    code = (
+        "import sys, cli\n"
+        f"try:\n    rc = cli.main({list(argv)!r})\n"
+        "except SystemExit as e:\n    rc = e.code\n"
+        f"print(rc, ','.join(m for m in {HEAVY!r} if m in sys.modules))\n"
+    )
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, env=env)
+    elapsed = time.perf_counter() - t0
+    rc, _, heavy = proc.stdout.strip().splitlines()[-1].partition(" ")
+    return elapsed, rc, heavy
+
+
+def test_help_and_noop_commands_skip_heavy_imports():
+    env = {k: v for k, v in os.environ.items() if k != "DATABASE_URL"}
+    for argv in (["--help"], ["run", "--help"], ["backfill", "--help"], ["orchestrate", "--list"]):
+        runs = [_run_cli(*argv, env=env) for _ in range(3)]
+        assert all(rc == "0" for _, rc, _ in runs), argv
+        assert all(heavy == "" for _, _, heavy in runs), f"{argv} imported {runs[0][2]}"
+        best = min(elapsed for elapsed, _, _ in runs)  # best of 3 irons out a busy runner
+        assert best < STARTUP_BUDGET_S, f"{argv} took {best:.3f}s"
+
+
+def test_unknown_command_fails_fast():
+    elapsed, rc, heavy = _run_cli("nope")
+    assert rc == "2" and heavy == ""
@@ -0,0 +1,160 @@
+import json
+import threading
+
+import pytest
+import requests
+
+import extract_coingecko
+from extract_coingecko import RateLimiter, fetch_prices_paginated, iter_market_pages
+
+
+class FakeResponse:
+    def __init__(self, payload, status_code=200, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = json.dumps(payload).encode("utf-8")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} error")
+
+
+class PagedSession:
+    """/coins/markets stub: `sizes[page]` records on each page (0 past the end)."""
+
+    def __init__(self, sizes, hooks=None):
+        self.sizes = sizes
+        self.hooks = hooks or {}  # page -> callable run before answering
+        self.requested = []
+        self._lock = threading.Lock()
+
+    def get(self, endpoint, params=None, headers=None, timeout=None):
+        page = params["page"]
+        with self._lock:
+            self.requested.append(page)
+        if page in self.hooks:
+            self.hooks[page]()
+        return FakeResponse([{"id": f"coin-{page}-{i}"} for i in range(self.sizes.get(page, 0))])
+
+
+@pytest.fixture
+def stub_http(monkeypatch):
+    monkeypatch.setenv("COINGECKO_CACHE", "0")
+    monkeypatch.setattr(extract_coingecko, "_rate_limiter", RateLimiter(rate_per_min=1e6, burst=100))
+
+    def install(session):
+        monkeypatch.setattr(extract_coingecko, "requests_session_with_retries", lambda **kw: session)
+        return session
+    return install
+
+
+def pool_threads():
+    return [t for t in threading.enumerate() if t.name.startswith("coingecko")]
+
+
+def test_pages_come_back_in_order_when_they_finish_out_of_order(stub_http):
+    page2_done = threading.Event()
+    session = stub_http(PagedSession({1: 2, 2: 2, 3: 1}, hooks={
+        1: lambda: page2_done.wait(5),  # page 1 only answers once page 2 has
+        2: page2_done.set,
+    }))
+    data = fetch_prices_paginated(ids=None, per_page=2, workers=3)
+    assert page2_done.is_set()
+    assert [r["id"] for r in data] == ["coin-1-0", "coin-1-1", "coin-2-0", "coin-2-1", "coin-3-0"]
+    assert sorted(session.requested)[:3] == [1, 2, 3]
+
+
+def test_pagination_stops_at_short_page_and_max_pages(stub_http):
+    session = stub_http(PagedSession({p: 2 for p in range(1, 100)} | {4: 0}))
+    pages = list(iter_market_pages(ids=None, per_page=2, workers=2))
+    assert [len(p) for p in pages] == [2, 2, 2, 0]  # empty page 4 ends the walk
+    assert max(session.requested) <= 4 + 2  # nothing beyond the window in flight at the end
+
+    session = stub_http(PagedSession({p: 2 for p in range(1, 100)}))
+    assert len(fetch_prices_paginated(ids=None, per_page=2, max_pages=3, workers=2)) == 6
+    assert sorted(session.requested) == [1, 2, 3]
+
+    # explicit ids: one request per per_page chunk
+    session = stub_http(PagedSession({1: 2}))
+    assert len(list(iter_market_pages(ids=["a", "b", "c", "d", "e"], per_page=2, workers=2))) == 3
+
+
+def test_page_error_propagates_and_stops_the_workers(stub_http):
+    def fail():
+        raise requests.ConnectionError("page 2 down")
+    session = stub_http(PagedSession({p: 2 for p in range(1, 100)}, hooks={2: fail}))
+    with pytest.raises(requests.ConnectionError, match="page 2 down"):
+        fetch_prices_paginated(ids=None, per_page=2, workers=3)
+    assert not pool_threads()  # pool shut down, queued pages cancelled
+    assert len(session.requested) <= 1 + 3  # page 1 plus one sliding window
+
+
+class FakeClock:
+    """Deterministic time for RateLimiter: sleep() advances now() instead of blocking."""
+
+    def __init__(self):
+        self.t = 0.0
+        self.sleeps = []
+
+    def now(self):
+        return self.t
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.t += seconds
+
+
+def fake_limiter(rate_per_min, burst):
+    clock = FakeClock()
+    return RateLimiter(rate_per_min, burst, clock=clock.now, sleep=clock.sleep), clock
+
+
+def test_rate_limiter_refills_tokens_up_to_the_burst():
+    lim, clock = fake_limiter(60, burst=3)  # one token per second
+    assert [lim.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert lim.acquire() == pytest.approx(1.0)
+    clock.t += 100  # a long idle period refills the bucket to the burst, not to 100
+    assert [lim.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert lim.acquire() == pytest.approx(1.0)
+    stats = lim.stats()
+    assert stats["acquired"] == 8 and stats["delayed"] == 2 and stats["throttled_seconds"] == pytest.approx(2.0)
+
+
+class RateLimitedSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def get(self, endpoint, params=None, headers=None, timeout=None):
+        self.calls += 1
+        return self.responses.pop(0)
+
+
+def in_thread(fn):
+    out = {}
+    t = threading.Thread(target=lambda: out.setdefault("result", fn()))
+    t.start()
+    t.join()
+    return out["result"]
+
+
+def test_429_backs_off_for_retry_after_and_slows_every_thread(monkeypatch):
+    monkeypatch.setenv("COINGECKO_CACHE", "0")
+    lim, clock = fake_limiter(60, burst=1)
+    session = RateLimitedSession([FakeResponse([], 429, {"Retry-After": "5"}), FakeResponse([{"id": "bitcoin"}])])
+    # a worker thread hits the 429 ...
+    data = in_thread(lambda: extract_coingecko._get_json(session, "http://x/coins/markets", {}, limiter=lim))
+    assert data == [{"id": "bitcoin"}] and session.calls == 2
+    assert clock.sleeps == [pytest.approx(5.0)]  # the retry waited for Retry-After
+    assert lim.stats()["rejected"] == 1 and lim.rate * 60 < 60
+    # ... and the caller's thread now runs at the reduced rate
+    assert lim.acquire() == pytest.approx(1 / lim.rate) and 1 / lim.rate > 1.0
+
+    # a Retry-After seen by one thread closes the bucket for all of them
+    lim, clock = fake_limiter(60, burst=5)
+    in_thread(lambda: lim.backoff(retry_after=3.0, rejected=False))
+    assert lim.acquire() == pytest.approx(3.0)
+    assert lim.stats()["backoffs"] == 1 and lim.stats()["rejected"] == 0
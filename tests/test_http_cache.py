@@ -0,0 +1,95 @@
+import json
+import os
+import types
+
+import pytest
+
+import extract_coingecko
+import http_cache
+from http_cache import ResponseCache
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=b"", headers=None):
+        self.status_code = status_code
+        self.content = body
+        self.headers = headers or {}
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        pass
+
+
+class RecordingSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.sent_headers = []
+
+    def get(self, endpoint, params=None, headers=None, timeout=None):
+        self.sent_headers.append(dict(headers or {}))
+        return self.responses.pop(0)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """http_cache's view of time.time(), moved by hand."""
+    now = types.SimpleNamespace(t=1_000_000.0)
+    monkeypatch.setattr(http_cache, "time", types.SimpleNamespace(time=lambda: now.t))
+    return now
+
+
+def get_json(session, cache):
+    limiter = extract_coingecko.RateLimiter(rate_per_min=1e6, burst=100)
+    return extract_coingecko._get_json(session, "http://x/coins/markets", {"page": 1}, limiter=limiter, cache=cache)
+
+
+def test_fresh_hit_then_conditional_request_and_304(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path), ttl_seconds=3600, fresh_seconds=30)
+    headers = {"ETag": '"v1"', "Last-Modified": "Thu, 13 Nov 2025 08:00:00 GMT", "Cache-Control": "max-age=60"}
+    session = RecordingSession([
+        FakeResponse(200, b'[{"id": "bitcoin"}]', headers),
+        FakeResponse(304, headers={"Cache-Control": "max-age=60"}),
+    ])
+    assert get_json(session, cache) == [{"id": "bitcoin"}]
+    clock.t += 59  # inside max-age: served from disk, no request
+    assert get_json(session, cache) == [{"id": "bitcoin"}] and len(session.sent_headers) == 1
+    clock.t += 2  # stale: revalidate with the stored validators, 304 reuses the body
+    assert get_json(session, cache) == [{"id": "bitcoin"}]
+    assert session.sent_headers[1] == {"If-None-Match": '"v1"', "If-Modified-Since": "Thu, 13 Nov 2025 08:00:00 GMT"}
+    assert cache.stats() == {"hits": 1, "revalidated": 1, "misses": 1, "stores": 1, "evictions": 0}
+    clock.t += 30  # the 304 restarted the freshness window
+    assert get_json(session, cache) == [{"id": "bitcoin"}] and cache.stats()["hits"] == 2
+
+
+def test_ttl_counts_from_stored_at_even_for_entries_read_often(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path), ttl_seconds=100, fresh_seconds=0)
+    cache.put("a", b"body-a", {})
+    for _ in range(3):
+        clock.t += 30
+        assert cache.get("a") is not None  # reads bump the body mtime (LRU) only
+    clock.t += 30
+    assert cache.get("a") is None  # 120s after it was stored
+    cache.put("b", b"body-b", {})
+    clock.t += 101
+    os.utime(cache._paths("b")[0])  # as a read would; a fresh mtime does not keep it alive in evict()
+    assert cache.evict() == 0 and not os.listdir(tmp_path)
+
+
+def test_lru_eviction_runs_every_n_puts(tmp_path, clock, monkeypatch):
+    cache = ResponseCache(str(tmp_path), ttl_seconds=3600, max_bytes=25, evict_every=3)
+    scans = []
+    real_evict = cache.evict
+    monkeypatch.setattr(cache, "evict", lambda: scans.append(1) or real_evict())
+    cache.put("a", b"x" * 10, {})
+    cache.put("b", b"x" * 10, {})
+    body = lambda key: cache._paths(key)[0]
+    os.utime(body("a"), (1000, 1000))
+    os.utime(body("b"), (2000, 2000))
+    assert cache.get("a") is not None  # a is now the most recently used
+    cache.put("c", b"x" * 10, {})  # third put: one scan, 30 > 25 bytes, LRU b goes
+    assert scans == [1]
+    assert cache.get("b") is None and cache.get("a") is not None and cache.get("c") is not None
+    cache.put("d", b"x" * 10, {})
+    assert scans == [1]  # over max_bytes again, but the next scan is two puts away
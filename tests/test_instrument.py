@@ -0,0 +1,67 @@
+import json
+import time
+
+from instrument import RunStages, export_run, summarize_json
+
+
+def test_stage_numbers_accumulate_across_calls():
+    stages = RunStages()
+    for _ in range(3):
+        with stages.stage("transform") as st:
+            time.sleep(0.01)
+            st.add(records=10, bytes=100)
+    produced = list(stages.timed_iter("extract", iter([1, 2])))
+    rows = {r["stage"]: r for r in stages.rows()}
+    assert produced == [1, 2]
+    assert rows["transform"]["calls"] == 3
+    assert rows["transform"]["records"] == 30 and rows["transform"]["bytes"] == 300
+    assert rows["transform"]["wall_seconds"] >= 0.03
+    assert rows["transform"]["peak_rss_bytes"] > 0
+    assert rows["extract"]["calls"] == 3  # two items + the exhausted next()
+
+
+def test_exporters_write_prometheus_and_json(tmp_path):
+    stages = RunStages()
+    with stages.stage("load") as st:
+        st.add(records=5)
+    for i in range(4):
+        export_run("job", f"run{i}", "success", 1.0, stages.rows(),
+                   metrics_dir=str(tmp_path), metrics_json=str(tmp_path / "runs.jsonl"))
+    prom = (tmp_path / "etl_job.prom").read_text()
+    assert 'etl_stage_records{job="job",stage="load"} 5' in prom
+    assert 'etl_run_success{job="job"} 1' in prom
+    lines = (tmp_path / "runs.jsonl").read_text().splitlines()
+    assert len(lines) == 4 and json.loads(lines[0])["stages"][0]["stage"] == "load"
+    assert summarize_json(str(tmp_path / "runs.jsonl"))["load"]["runs"] == 4
+
+
+def test_counts_and_cpu_are_charged_to_their_own_run():
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from instrument import bind, count
+
+    def fake_request(n):
+        count("requests")
+        count("bytes", n)
+        sum(i * i for i in range(200_000))  # some CPU on the worker thread
+        return n
+
+    def run(stages, n_requests, ready):
+        with stages.stage("extract"):
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                list(pool.map(bind(fake_request), [10] * n_requests))
+            ready.wait()  # both runs' stages are open at the same time
+
+    a, b = RunStages(), RunStages()
+    ready = threading.Barrier(2)
+    threads = [threading.Thread(target=run, args=(a, 3, ready)), threading.Thread(target=run, args=(b, 5, ready))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    count("requests")  # outside any stage: charged to nobody
+
+    ra, rb = a.rows()[0], b.rows()[0]
+    assert (ra["http_requests"], ra["bytes"]) == (3, 30)
+    assert (rb["http_requests"], rb["bytes"]) == (5, 50)
+    assert 0 < ra["cpu_seconds"] < rb["cpu_seconds"]  # worker CPU counted, per run
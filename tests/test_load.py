@@ -0,0 +1,163 @@
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from psycopg2.extras import Json
+from load import df_to_rows
+
+
+def legacy_rows(df):
+    # the original per-row conversion from upsert_df (df.iterrows), kept as the reference
+    rows = []
+    for _, r in df.iterrows():
+        snapshot_time = r.get("snapshot_time").to_pydatetime() if hasattr(r.get("snapshot_time"), "to_pydatetime") else r.get("snapshot_time")
+        fetched_at = r.get("fetched_at").to_pydatetime() if hasattr(r.get("fetched_at"), "to_pydatetime") else r.get("fetched_at")
+        raw = r.get("raw_json")
+        if isinstance(raw, str):
+            try:
+                raw = json.loads(raw)
+            except Exception:
+                pass
+        rows.append((
+            r.get("symbol"), r.get("name"), snapshot_time,
+            float(r["price_usd"]) if pd.notna(r.get("price_usd")) else None,
+            float(r["price_change_24h"]) if pd.notna(r.get("price_change_24h")) else None,
+            float(r["price_change_percentage_24h"]) if pd.notna(r.get("price_change_percentage_24h")) else None,
+            float(r["market_cap_usd"]) if pd.notna(r.get("market_cap_usd")) else None,
+            int(r["market_cap_rank"]) if pd.notna(r.get("market_cap_rank")) else None,
+            float(r["total_volume"]) if pd.notna(r.get("total_volume")) else None,
+            float(r["circulating_supply"]) if pd.notna(r.get("circulating_supply")) else None,
+            fetched_at, Json(raw),
+        ))
+    return rows
+
+
+def make_df(n, seed=0):
+    rng = np.random.default_rng(seed)
+    price = rng.uniform(0, 1e5, n)
+    price[::7] = np.nan
+    rank = pd.Series(np.arange(1, n + 1), dtype="float64")
+    rank[::5] = np.nan
+    base = pd.Timestamp("2025-11-13T08:27:11.083Z")
+    return pd.DataFrame({
+        "symbol": [f"coin{i}" for i in range(n)],
+        "name": [f"Coin {i}" for i in range(n)],
+        "snapshot_time": base + pd.to_timedelta(rng.integers(0, 10**6, n), unit="ms"),
+        "price_usd": price,
+        "price_change_24h": rng.normal(size=n),
+        "price_change_percentage_24h": rng.normal(size=n),
+        "market_cap_usd": rng.integers(0, 10**12, n).astype("int64"),
+        "market_cap_rank": rank,
+        "total_volume": rng.uniform(0, 1e9, n),
+        "circulating_supply": np.where(np.arange(n) % 3 == 0, np.nan, rng.uniform(0, 1e9, n)),
+        "fetched_at": pd.Timestamp.now(tz="UTC"),
+        "raw_json": [json.dumps({"id": f"coin{i}", "roi": None}) for i in range(n)],
+    })
+
+
+def as_comparable(rows):
+    out = []
+    for row in rows:
+        *vals, raw = row
+        # the old path wrapped a parsed dict in Json; the new one passes the JSON text through
+        raw = raw.adapted if isinstance(raw, Json) else json.loads(raw)
+        out.append((tuple((type(v), v) for v in vals), raw))
+    return out
+
+
+def test_df_to_rows_matches_iterrows():
+    df = make_df(500)
+    assert as_comparable(df_to_rows(df)) == as_comparable(legacy_rows(df))
+
+
+def test_df_to_rows_passes_raw_json_text_through():
+    df = make_df(3)
+    df["raw_json"] = ['{"id": "a"}', {"id": "b"}, None]
+    assert [r[-1] for r in df_to_rows(df)] == ['{"id": "a"}', '{"id": "b"}', None]
+
+
+class CopyCursor:
+    def __init__(self):
+        self.sql = []
+
+    def execute(self, sql, params=None):
+        self.sql.append(sql)
+
+    def copy_expert(self, sql, f, size=8192):
+        self.sql.append(sql)
+        f.read()
+
+    def fetchone(self):
+        return (0, 0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def test_copy_stage_table_for_schema_qualified_target():
+    from load import _load_copy
+    cur = CopyCursor()
+    _load_copy(cur, make_df(3), "market.crypto_price_snapshots", 1000, incremental=False)
+    assert cur.sql[0] == "DROP TABLE IF EXISTS pg_temp._stage_crypto_price_snapshots;"
+    assert cur.sql[1].startswith("CREATE TEMP TABLE _stage_crypto_price_snapshots ON COMMIT DROP")
+    assert "FROM market.crypto_price_snapshots WITH NO DATA" in cur.sql[1]
+
+
+class FakeTransaction:
+    def __init__(self, log, kind):
+        self.log, self.kind = log, kind
+
+    def __enter__(self):
+        self.log.append(self.kind)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.log.append("rollback" if exc_type else "commit")
+        return False
+
+
+class FakeDBAPIConnection:
+    def cursor(self):
+        return CopyCursor()
+
+    def commit(self):
+        raise AssertionError("commit must go through the SQLAlchemy Connection")
+
+    rollback = commit
+
+
+class FakeSAConnection:
+    """The parts of a SQLAlchemy Connection upsert_df uses."""
+
+    def __init__(self, in_transaction=False):
+        self.log = []
+        self._in_transaction = in_transaction
+        self.connection = FakeDBAPIConnection()
+
+    def in_transaction(self):
+        return self._in_transaction
+
+    def begin(self):
+        return FakeTransaction(self.log, "begin")
+
+    def begin_nested(self):
+        return FakeTransaction(self.log, "savepoint")
+
+
+def test_upsert_on_shared_connection_uses_its_transactions(monkeypatch):
+    import load
+    monkeypatch.setattr(load, "_load_values", lambda cur, df, *a: (len(df), 0))
+    conn = FakeSAConnection()
+    counts = load.upsert_df(make_df(3), conn=conn, update_candles=False, update_latest=False)
+    assert counts == {"inserted": 3, "updated": 0, "skipped": 0} and conn.log == ["begin", "commit"]
+
+    def boom(*a):
+        raise RuntimeError("load failed")
+    monkeypatch.setattr(load, "_load_values", boom)
+    conn = FakeSAConnection(in_transaction=True)
+    with pytest.raises(RuntimeError):
+        load.upsert_df(make_df(3), conn=conn, update_candles=False, update_latest=False)
+    assert conn.log == ["savepoint", "rollback"]
@@ -0,0 +1,35 @@
+import random
+from datetime import datetime, timezone
+
+from monitor import (DURATION_BOUNDS, ROWS_BOUNDS, _add_run, _empty_bucket, build_report,
+                     format_report, hist_percentile, summarize_buckets)
+
+
+def test_hist_percentile_close_to_exact():
+    rng = random.Random(0)
+    durations = [rng.lognormvariate(2, 0.6) for _ in range(5000)]
+    b = _empty_bucket("job", "day", None)
+    for d in durations:
+        _add_run(b, "success", d, 100)
+    exact = sorted(durations)
+    for q in (0.5, 0.95, 0.99):
+        est = hist_percentile(b["duration_hist"], DURATION_BOUNDS, q, b["duration_max"])
+        true = exact[int(q * len(exact)) - 1]
+        # bucket interpolation: within the width of the bucket holding the true value
+        assert abs(est - true) / true < 0.5
+    assert hist_percentile([0] * (len(ROWS_BOUNDS) + 1), ROWS_BOUNDS, 0.5) is None
+
+
+def test_report_merges_buckets():
+    day1 = _empty_bucket("job", "day", datetime(2026, 1, 1, tzinfo=timezone.utc))
+    day2 = _empty_bucket("job", "day", datetime(2026, 1, 2, tzinfo=timezone.utc))
+    for _ in range(9):
+        _add_run(day1, "success", 3.0, 1000)
+    _add_run(day2, "failed", 100.0, None)
+    summary = summarize_buckets([day1, day2])
+    assert summary["runs"] == 10 and summary["failures"] == 1 and summary["failure_rate"] == 0.1
+    assert summary["rows_total"] == 9000
+    assert 2 <= summary["duration_p50"] <= 5 and summary["duration_p99"] <= 100
+    report = build_report([day1, day2], grain="day", days=7)
+    assert [b["runs"] for b in report["buckets"]] == [9, 1]
+    assert "failure_rate=0.1" in format_report(report)
@@ -0,0 +1,74 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from notifiers import NotificationDispatcher
+
+
+@pytest.fixture
+def webhook():
+    """Local stand-in for a Slack incoming webhook; records posted payloads, answers slowly."""
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            time.sleep(0.2)
+            received.append(json.loads(body)["text"])
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"ok")
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/hook", received
+    server.shutdown()
+
+
+def test_submit_does_not_wait_on_webhook(webhook):
+    url, received = webhook
+    d = NotificationDispatcher(url=url, digest_interval=60)
+    t0 = time.perf_counter()
+    for i in range(5):
+        d.submit(f"ok {i}")
+    d.submit("boom", urgent=True)
+    assert time.perf_counter() - t0 < 0.1
+    assert d.close(timeout=5)
+    assert received[0] == "boom"
+
+
+def test_successes_are_merged_into_one_digest(webhook):
+    url, received = webhook
+    d = NotificationDispatcher(url=url, digest_interval=60)
+    for i in range(3):
+        d.submit(f"ok {i}")
+    assert d.flush(timeout=5)
+    assert len(received) == 1
+    assert "3 messages" in received[0] and "ok 0" in received[0] and "ok 2" in received[0]
+    d.close(timeout=5)
+
+
+def test_digest_is_sent_after_interval(webhook):
+    url, received = webhook
+    d = NotificationDispatcher(url=url, digest_interval=0.3)
+    d.submit("ok")
+    deadline = time.time() + 3
+    while not received and time.time() < deadline:
+        time.sleep(0.05)
+    assert received == ["ok"]
+    d.close(timeout=5)
+
+
+def test_full_queue_drops_instead_of_blocking(webhook):
+    url, _ = webhook
+    d = NotificationDispatcher(url=url, digest_interval=60, max_queue=1)
+    results = [d.submit("fail", urgent=True) for _ in range(10)]
+    assert not all(results)
+    assert d.stats()["dropped"] >= 1
+    d.close(timeout=5)
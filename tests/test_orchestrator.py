@@ -0,0 +1,187 @@
+import json
+import os
+import signal
+import threading
+import types
+from contextlib import contextmanager
+
+import pytest
+
+import orchestrator
+from orchestrator import Job, load_jobs, lock_key, parse_duration
+
+
+def test_load_jobs(tmp_path):
+    path = tmp_path / "jobs.json"
+    path.write_text(json.dumps({"jobs": [
+        {"name": "a", "ids": "bitcoin, ethereum", "vs_currencies": ["USD", "eur"], "every": "15m"},
+        {"name": "b", "ids": "all", "max_pages": 2, "queue_timeout": "5m", "on_overlap": "queue"},
+        {"name": "c", "enabled": False},
+    ]}))
+    jobs = load_jobs(str(path))
+    assert [j.name for j in jobs] == ["a", "b"]
+    assert jobs[0].ids == ["bitcoin", "ethereum"] and jobs[0].vs_currencies == ["usd", "eur"]
+    assert jobs[0].every == 900 and jobs[1].every is None and jobs[1].queue_timeout == 300
+    assert [j.name for j in load_jobs(str(path), ["c"])] == ["c"]  # named jobs run even if disabled
+    assert parse_duration("1d") == 86400 and parse_duration(90) == 90
+
+    path.write_text(json.dumps({"jobs": [{"name": "a"}, {"name": "a"}]}))
+    with pytest.raises(ValueError, match="duplicate"):
+        load_jobs(str(path))
+    with pytest.raises(ValueError, match="stream"):
+        Job.from_dict({"name": "x", "stream": True, "vs_currencies": ["eur"]})
+    assert -(1 << 31) <= lock_key("coingecko_daily_snapshot") < (1 << 31)
+
+
+def test_jobs_run_concurrently_and_held_lock_skips(monkeypatch):
+    held = {"busy"}  # a run of "busy" is already going (another cron tick / host)
+    guard = threading.Lock()
+    ran = []
+    # the three runnable jobs only get past the barrier if they are all running at once
+    together = threading.Barrier(3, timeout=5)
+    running = {"now": 0, "max": 0}
+
+    @contextmanager
+    def fake_lock(name, wait_seconds=0.0):
+        with guard:
+            got = name not in held
+            held.add(name)
+        try:
+            yield got
+        finally:
+            if got:
+                with guard:
+                    held.discard(name)
+
+    def fake_run(job):
+        with guard:
+            running["now"] += 1
+            running["max"] = max(running["max"], running["now"])
+        together.wait()
+        with guard:
+            running["now"] -= 1
+            ran.append(job.name)
+        return 0 if job.name != "broken" else 2
+
+    monkeypatch.setattr(orchestrator, "job_lock", fake_lock)
+    monkeypatch.setattr(orchestrator, "is_due", lambda job: True)
+    monkeypatch.setattr(orchestrator, "_run_etl", fake_run)
+
+    jobs = [Job(name=n) for n in ("fast", "slow", "broken", "busy")]
+    results = {r["job"]: r["status"] for r in orchestrator.run_once(jobs, workers=4)}
+
+    assert results == {"fast": "success", "slow": "success", "broken": "failed", "busy": "skipped"}
+    assert sorted(ran) == ["broken", "fast", "slow"]
+    assert running["max"] == 3
+    assert held == {"busy"}  # our locks were released
+
+
+@pytest.fixture
+def restore_signals():
+    saved = {sig: signal.getsignal(sig) for sig in (signal.SIGTERM, signal.SIGINT)}
+    yield
+    for sig, handler in saved.items():
+        signal.signal(sig, handler)
+
+
+def test_run_loop_never_runs_a_job_twice_at_once(monkeypatch, restore_signals):
+    guard = threading.Lock()
+    calls = {"short": 0, "long": 0}
+    running = {"short": 0, "long": 0}
+    overlapped = []
+    release = threading.Event()
+    logged = []
+
+    def fake_run_job(job, force=False):
+        with guard:
+            calls[job.name] += 1
+            running[job.name] += 1
+            if running[job.name] > 1:
+                overlapped.append(job.name)
+            if calls["short"] >= 3:
+                release.set()  # "long" has sat in flight through several ticks by now
+        if job.name == "long":
+            release.wait(5)
+        with guard:
+            running[job.name] -= 1
+        return {"job": job.name, "status": "success", "seconds": 0.0, "detail": ""}
+
+    monkeypatch.setattr(orchestrator, "run_job", fake_run_job)
+    monkeypatch.setattr(orchestrator, "_log_result", logged.append)
+    assert orchestrator.run_loop([Job(name="short"), Job(name="long")], workers=2, tick=0.01, max_ticks=30) == 0
+    assert release.is_set() and not overlapped
+    assert calls["short"] >= 3 and calls["long"] >= 1
+    assert len(logged) == calls["short"] + calls["long"]  # every submitted run is collected
+
+
+def test_run_loop_stops_on_sigterm_and_waits_for_running_jobs(monkeypatch, restore_signals):
+    finished = []
+
+    def fake_run_job(job, force=False):
+        os.kill(os.getpid(), signal.SIGTERM)
+        finished.append(job.name)
+        return {"job": job.name, "status": "success", "seconds": 0.0, "detail": ""}
+
+    monkeypatch.setattr(orchestrator, "run_job", fake_run_job)
+    assert orchestrator.run_loop([Job(name="a")], workers=1, tick=5) == 0  # no max_ticks: only the signal ends it
+    assert finished == ["a"]
+
+
+class LockCursor:
+    def __init__(self, log, lock_error=None):
+        self.log, self.lock_error = log, lock_error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.log.append(sql.split("(")[0])
+        if sql.startswith("SELECT pg_advisory_lock") and self.lock_error is not None:
+            raise self.lock_error
+
+
+class LockConnection:
+    def __init__(self, lock_error=None):
+        self.log = []
+        self.lock_error = lock_error
+
+    def cursor(self):
+        return LockCursor(self.log, self.lock_error)
+
+    def commit(self):
+        self.log.append("commit")
+
+    def rollback(self):
+        self.log.append("rollback")
+
+    def close(self):
+        self.log.append("close")
+
+
+class LockTimeout(Exception):
+    pgcode = "55P03"
+
+
+def test_queued_job_lock_times_out_cleanly(monkeypatch):
+    import load
+    conn = LockConnection(lock_error=LockTimeout("canceling statement due to lock timeout"))
+    monkeypatch.setattr(load, "get_engine", lambda: types.SimpleNamespace(raw_connection=lambda: conn))
+    with orchestrator.job_lock("daily", wait_seconds=1.5) as got:
+        assert got is False
+    assert conn.log == ["SET lock_timeout = 1500", "SELECT pg_advisory_lock", "rollback",
+                        "RESET lock_timeout", "commit", "close"]
+
+    conn = LockConnection()
+    with orchestrator.job_lock("daily", wait_seconds=1.5) as got:
+        assert got is True
+    assert conn.log == ["SET lock_timeout = 1500", "SELECT pg_advisory_lock", "RESET lock_timeout", "commit",
+                        "SELECT pg_advisory_unlock", "commit", "close"]
+
+    conn = LockConnection(lock_error=RuntimeError("connection lost"))
+    with pytest.raises(RuntimeError):
+        with orchestrator.job_lock("daily", wait_seconds=1.5):
+            pass
+    assert conn.log[-1] == "close" and "SELECT pg_advisory_unlock" not in conn.log
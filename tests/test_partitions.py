@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta, timezone
+
+import partitions
+from partitions import add_months, ensure_partitions, month_start, partition_name
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def test_month_ranges_and_names():
+    # month boundaries are UTC, whatever the offset of the input
+    assert month_start(datetime(2025, 12, 1, 0, 30, tzinfo=timezone(timedelta(hours=2)))) == utc(2025, 11, 1)
+    assert month_start(utc(2025, 11, 30, 23, 59, 59, 999999)) == utc(2025, 11, 1)
+    assert add_months(utc(2025, 11, 1), 1) == utc(2025, 12, 1)
+    assert add_months(utc(2025, 11, 1), 2) == utc(2026, 1, 1)
+    assert add_months(utc(2025, 1, 1), -1) == utc(2024, 12, 1)
+    assert add_months(utc(2025, 1, 1), -24) == utc(2023, 1, 1)
+    assert partition_name(utc(2025, 1, 1)) == "crypto_price_snapshots_p202501"
+    assert partitions._PART_NAME.match(partition_name(utc(2025, 1, 1))).groups() == ("2025", "01")
+    assert not partitions._PART_NAME.match(partitions.DEFAULT_PARTITION)
+
+
+class PartitionCursor:
+    """Answers create_month's queries: `existing` partitions exist, the default partition is empty."""
+
+    def __init__(self, existing=()):
+        self.existing = set(existing)
+        self.created = []
+        self._row = None
+
+    def execute(self, sql, params=None):
+        if "to_regclass" in sql:
+            self._row = (params[0] in self.existing,)
+        elif "EXISTS" in sql:
+            self._row = (False,)
+        elif "PARTITION OF" in sql:
+            self.created.append((sql.split()[2], params))
+
+    def fetchone(self):
+        return self._row
+
+
+def test_ensure_partitions_covers_since_to_months_ahead():
+    cur = PartitionCursor(existing={"crypto_price_snapshots_p202512"})
+    created = ensure_partitions(cur, months_ahead=2, since=utc(2025, 11, 17, 5), now=utc(2025, 12, 31, 23))
+    assert created == 3
+    assert cur.created == [
+        ("crypto_price_snapshots_p202511", (utc(2025, 11, 1), utc(2025, 12, 1))),
+        ("crypto_price_snapshots_p202601", (utc(2026, 1, 1), utc(2026, 2, 1))),
+        ("crypto_price_snapshots_p202602", (utc(2026, 2, 1), utc(2026, 3, 1))),
+    ]
+
+
+class RetentionConn:
+    def __init__(self, names):
+        self.names = names
+        self.executed = []
+        self.commits = 0
+        self.log = []  # statements and commits, in order
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.executed.append(sql.strip())
+        self.log.append(sql.strip().split()[0])
+
+    def copy_expert(self, sql, f):
+        self.log.append("COPY")
+        f.write(b"id\n")
+
+    def fetchall(self):
+        return [(n,) for n in self.names]
+
+    def commit(self):
+        self.commits += 1
+        self.log.append("COMMIT")
+
+
+def test_retention_detaches_only_months_ended_before_cutoff():
+    conn = RetentionConn(["crypto_price_snapshots_default", "crypto_price_snapshots_p202410",
+                          "crypto_price_snapshots_p202411", "crypto_price_snapshots_p202412"])
+    # keep 12 months back from 2025-11: cutoff 2024-11-01, so only October 2024 has ended before it
+    done = partitions.apply_retention(conn, retain_months=12, action="detach", now=utc(2025, 11, 17))
+    assert done == ["crypto_price_snapshots_p202410"]
+    assert conn.executed[-1] == "ALTER TABLE crypto_price_snapshots DETACH PARTITION crypto_price_snapshots_p202410"
+    assert conn.commits == 1
+    assert partitions.apply_retention(conn, retain_months=0, now=utc(2025, 11, 17)) == []
+
+
+def test_archive_retention_commits_detach_before_the_dump(tmp_path, monkeypatch):
+    monkeypatch.setattr(partitions.archive_partition, "__defaults__", (str(tmp_path),))
+    conn = RetentionConn(["crypto_price_snapshots_p202410"])
+    assert partitions.apply_retention(conn, retain_months=12, action="archive", now=utc(2025, 11, 17))
+    # the parent's lock is released (COMMIT) before the slow COPY starts
+    assert conn.log == ["SELECT", "ALTER", "COMMIT", "COPY", "DROP", "COMMIT"]
+    assert (tmp_path / "crypto_price_snapshots_p202410.csv.gz").exists()
@@ -0,0 +1,59 @@
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer
+from urllib.request import urlopen
+
+import prices
+from prices import LatestPriceCache
+
+
+class FakeDB:
+    def __init__(self, known):
+        self.known = set(known)
+        self.calls = []
+
+    def __call__(self, symbols):
+        self.calls.append(list(symbols))
+        return {s: {"symbol": s, "price_usd": 1.0} for s in symbols if s in self.known}
+
+
+def test_misses_are_one_batched_query_and_hits_are_cached():
+    db = FakeDB([f"c{i}" for i in range(300)])
+    cache = LatestPriceCache(ttl=60, fetch=db)
+    symbols = [f"c{i}" for i in range(300)] + ["nope"]
+    first = cache.get_many(symbols)
+    assert len(db.calls) == 1 and len(db.calls[0]) == 301
+    assert first["c7"]["price_usd"] == 1.0 and first["nope"] is None
+
+    for _ in range(100):
+        again = cache.get_many(symbols)
+    assert again == first and len(db.calls) == 1  # unknown symbols are cached too
+    assert cache.stats()["queries"] == 1 and cache.stats()["hits"] == 100 * 301
+
+
+def test_ttl_expiry_and_lru_eviction():
+    db = FakeDB(["a", "b", "c"])
+    cache = LatestPriceCache(ttl=0.05, maxsize=2, fetch=db)
+    cache.get_many(["a", "b"])
+    cache.get_many(["a"])  # a is now most recently used
+    cache.get_many(["c"])  # evicts b
+    assert cache.stats()["size"] == 2
+    cache.get_many(["a", "b"])
+    assert db.calls[-1] == ["b"]
+    time.sleep(0.06)
+    cache.get_many(["a"])
+    assert db.calls[-1] == ["a"]
+
+
+def test_http_endpoint():
+    cache = LatestPriceCache(ttl=60, fetch=FakeDB(["bitcoin"]))
+    handler = type("H", (prices._Handler,), {"cache": cache})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        url = f"http://127.0.0.1:{server.server_port}/latest?symbols=bitcoin,ethereum"
+        body = json.loads(urlopen(url).read())
+        assert body == {"bitcoin": {"symbol": "bitcoin", "price_usd": 1.0}, "ethereum": None}
+    finally:
+        server.shutdown()
@@ -1,3 +1,4 @@
+import json
 import pandas as pd
 from transform import transform_market_response
 
@@ -19,3 +20,67 @@ def test_transform_basic():
     assert len(df) == 1
     assert "symbol" in df.columns
     assert "price_usd" in df.columns
+
+def test_transform_raw_json_is_encoded_once_and_trimmable():
+    rec = dict(SAMPLE_JSON[0], image="https://example.com/btc.png", roi=None)
+    full = transform_market_response([rec])
+    assert json.loads(full["raw_json"].iloc[0]) == rec
+
+    trimmed = transform_market_response([rec], trim_raw=True)
+    # the ticker is only stored in raw_json (the symbol column holds the id), so it survives trimming
+    assert json.loads(trimmed["raw_json"].iloc[0]) == {"id": "bitcoin", "symbol": rec["symbol"]}
+
+
+def test_chunked_transform_dedups_across_chunk_boundaries():
+    from transform import ChunkDeduplicator, iter_record_chunks
+    eth = dict(SAMPLE_JSON[0], id="ethereum")
+    records = [SAMPLE_JSON[0], eth, SAMPLE_JSON[0], eth, dict(eth, last_updated="2025-11-13T09:00:00.000Z")]
+    dedup = ChunkDeduplicator()
+    frames = [dedup.filter(transform_market_response(chunk)) for chunk in iter_record_chunks(records, 2)]
+
+    streamed = pd.concat(frames)
+    whole = transform_market_response(records)
+    assert [len(f) for f in frames] == [2, 0, 1]
+    assert streamed[["symbol", "snapshot_time"]].values.tolist() == whole[["symbol", "snapshot_time"]].values.tolist()
+
+
+def test_chunk_dedup_memory_is_bounded_by_coins():
+    from transform import ChunkDeduplicator
+    dedup = ChunkDeduplicator()
+    for hour in range(48):  # e.g. two days of replayed hourly files, 3 coins each
+        ts = (pd.Timestamp("2025-11-13", tz="UTC") + pd.Timedelta(hours=hour)).isoformat()
+        chunk = [dict(SAMPLE_JSON[0], id=c, last_updated=ts) for c in ("bitcoin", "ethereum", "solana")]
+        assert len(dedup.filter(transform_market_response(chunk))) == 3
+        assert len(dedup.filter(transform_market_response(chunk))) == 0  # same file again
+    assert len(dedup.latest) == 3
+
+
+def test_fast_engine_matches_pandas_engine():
+    import pytest
+    from benchmarks.bench_pipeline import make_payload
+    records = make_payload(500, template=[dict(SAMPLE_JSON[0], image="x", roi=None)])
+    records[3]["circulating_supply"] = {"nested": 1}  # json_normalize flattens this away
+    for recs in (records, []):
+        slow = transform_market_response(recs, engine="pandas").drop(columns="fetched_at")
+        fast = transform_market_response(recs, engine="fast").drop(columns="fetched_at")
+        pd.testing.assert_frame_equal(slow, fast)
+    with pytest.raises(ValueError):
+        transform_market_response(records, engine="numba")
+
+
+def test_transform_quotes_one_batch_for_all_currencies():
+    from transform import QUOTE_COLUMNS, transform_quotes
+    eth = dict(SAMPLE_JSON[0], id="ethereum", current_price=3000)
+    payloads = {
+        "usd": [SAMPLE_JSON[0], eth],
+        "EUR": [dict(SAMPLE_JSON[0], current_price=92000), dict(eth, current_price=2750)],
+        "btc": [dict(SAMPLE_JSON[0], current_price=1), dict(eth, current_price="0.03")],
+    }
+    q = transform_quotes(payloads)
+    assert list(q.columns) == QUOTE_COLUMNS
+    assert len(q) == 6
+    assert q.set_index(["symbol", "vs_currency"])["price"].to_dict() == {
+        ("bitcoin", "usd"): 100000, ("ethereum", "usd"): 3000,
+        ("bitcoin", "eur"): 92000, ("ethereum", "eur"): 2750,
+        ("bitcoin", "btc"): 1, ("ethereum", "btc"): 0.03,
+    }
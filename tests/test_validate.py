@@ -0,0 +1,78 @@
+import pandas as pd
+
+from transform import transform_market_response
+from validate import validate_df
+
+NOW = pd.Timestamp("2025-11-13T12:00:00Z")
+
+
+def _rec(i, **kw):
+    rec = {"id": f"coin-{i}", "name": f"Coin {i}", "current_price": 10.0, "market_cap": 1e9,
+           "total_volume": 1e6, "circulating_supply": 1e8, "market_cap_rank": i + 1,
+           "last_updated": "2025-11-13T11:59:00.000Z"}
+    rec.update(kw)
+    return rec
+
+
+def test_rules_split_good_and_bad_rows():
+    records = [
+        _rec(0),
+        _rec(1, current_price="N/A"),                        # coerced to null
+        _rec(2, current_price=-1, market_cap=-5),            # two rules at once
+        _rec(3, market_cap_rank=0),
+        _rec(4, last_updated="2025-11-10T00:00:00.000Z"),    # stale
+        _rec(5, last_updated="2025-11-14T00:00:00.000Z"),    # future
+        _rec(6, current_price=31.0),                         # +210% vs last price
+        _rec(7, current_price=12.0),                         # +20%, fine
+    ]
+    df = transform_market_response(records)
+    good, bad, counts = validate_df(df, last_prices={"coin-6": 10.0, "coin-7": 10.0}, now=NOW)
+
+    assert good["symbol"].tolist() == ["coin-0", "coin-7"]
+    assert dict(zip(bad["symbol"], bad["failed_rules"])) == {
+        "coin-1": "missing_price",
+        "coin-2": "negative_price,negative_market_cap",
+        "coin-3": "rank_out_of_range",
+        "coin-4": "stale_snapshot",
+        "coin-5": "future_snapshot",
+        "coin-6": "price_jump",
+    }
+    assert counts["checked"] == 8 and counts["quarantined"] == 6
+    assert counts["negative_volume"] == 0 and counts["price_jump"] == 1
+
+
+# the validate-vs-transform cost budget is checked by benchmarks/bench_pipeline.py (STAGE_BUDGETS)
+def test_price_jump_on_a_large_batch():
+    records = [_rec(i, current_price=float(i % 97)) for i in range(5_000)]
+    df = transform_market_response(records)
+    last = dict(zip(df["symbol"], df["price_usd"] * 3))  # every non-zero price "dropped" 67%
+    good, bad, counts = validate_df(df, last_prices=last, now=NOW)
+    assert counts["quarantined"] == len(bad) == counts["price_jump"] > 0
+    assert len(good) + len(bad) == len(df) and (good["price_usd"] == 0).all()
+
+
+def test_price_jump_baseline_follows_a_real_move():
+    def run(price, last, recent, minute):
+        df = transform_market_response([_rec(0, current_price=price,
+                                             last_updated=f"2025-11-13T11:{minute:02d}:00.000Z")])
+        good, bad, _ = validate_df(df, last_prices=last, recent_prices=recent, now=NOW)
+        return len(good) == 1
+
+    # latest_prices still at 10 (the jump rows were never loaded)
+    assert not run(30.0, {"coin-0": 10.0}, {}, 1)                    # first run at the new level
+    assert run(31.0, {"coin-0": 10.0}, {"coin-0": 30.0}, 2)          # confirmed by the quarantined 30
+    assert run(30.5, {"coin-0": 31.0}, {"coin-0": 30.0}, 3)          # and from then on vs the loaded 31
+    # a one-off spike does not become the baseline: back to normal passes against the loaded price
+    assert run(10.2, {"coin-0": 10.0}, {"coin-0": 30.0}, 4)
+
+
+def test_quarantined_coins_are_dropped_from_quotes():
+    from transform import transform_quotes
+    from validate import drop_quarantined
+    usd = [_rec(0), _rec(1, current_price=-1)]
+    # the eur request came back a few seconds later: different last_updated, same coins
+    eur = [_rec(0, current_price=9.0, last_updated="2025-11-13T11:59:05.000Z"),
+           _rec(1, current_price=-0.9, last_updated="2025-11-13T11:59:05.000Z")]
+    good, bad, _ = validate_df(transform_market_response(usd), now=NOW)
+    quotes = drop_quarantined(transform_quotes({"usd": usd, "eur": eur}), bad)
+    assert sorted(zip(quotes["symbol"], quotes["vs_currency"])) == [("coin-0", "eur"), ("coin-0", "usd")]
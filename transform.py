@@ -1,97 +1,270 @@
 # transform.py
 """
 Robust transform script for CoinGecko ETL.
-- Accepts a JSON file path as argument
-- If no path is given, picks the latest raw_coingecko_*.json file automatically
+- Accepts a raw file path as argument (archive .ndjson.gz or legacy .json)
+- If no path is given, picks the latest archived file from the archive manifest
+- --since/--until select every archived file overlapping a time range
 - Produces data/preview_coingecko_snapshot.csv
 """
 
 import sys
 import os
 import json
+import argparse
 from glob import glob
 import pandas as pd
 from datetime import timezone
 
+import archive
+
 
 # -------------------------
 # Transform logic
 # -------------------------
-def transform_market_response(json_list):
+# raw fields dropped from raw_json when trimming: bulky ones we never read, plus those
+# already stored in their own columns. "id" is kept so the payload stays identifiable, and
+# "symbol" (the ticker, e.g. "btc") because our symbol column holds the CoinGecko id
+RAW_TRIM_FIELDS = {
+    "image", "roi", "name", "current_price", "market_cap", "total_volume",
+    "circulating_supply", "last_updated", "market_cap_rank", "price_change_24h",
+    "price_change_percentage_24h",
+}
+RAW_JSON_TRIM = os.getenv("RAW_JSON_TRIM", "0").lower() in ("1", "true", "yes")
+
+_json_encode = json.JSONEncoder(ensure_ascii=False).encode
+
+# "pandas": json_normalize the whole payload, then pick columns
+# "fast": pull only the kept keys into columns (same output frame, less work)
+TRANSFORM_ENGINE = os.getenv("TRANSFORM_ENGINE", "pandas")
+TRANSFORM_ENGINES = ("pandas", "fast")
+
+# raw key -> output column
+KEEP_FIELDS = {
+    "id": "symbol",
+    "name": "name",
+    "current_price": "price_usd",
+    "market_cap": "market_cap_usd",
+    "total_volume": "total_volume",
+    "circulating_supply": "circulating_supply",
+    "last_updated": "snapshot_time",
+    "market_cap_rank": "market_cap_rank",
+    "price_change_24h": "price_change_24h",
+    "price_change_percentage_24h": "price_change_percentage_24h",
+}
+NUMERIC_COLUMNS = [
+    "price_usd", "market_cap_usd", "total_volume",
+    "circulating_supply", "market_cap_rank",
+    "price_change_24h", "price_change_percentage_24h"
+]
+OUTPUT_COLUMNS = [
+    "symbol", "name", "snapshot_time", "price_usd",
+    "price_change_24h", "price_change_percentage_24h",
+    "market_cap_usd", "market_cap_rank",
+    "total_volume", "circulating_supply",
+    "fetched_at", "raw_json"
+]
+# crypto_price_quotes: one row per (symbol, vs_currency, snapshot_time); the *_usd columns
+# of the snapshot table become currency-neutral names
+QUOTE_RENAMES = {"price_usd": "price", "market_cap_usd": "market_cap"}
+QUOTE_COLUMNS = [
+    "symbol", "vs_currency", "snapshot_time", "price",
+    "price_change_24h", "price_change_percentage_24h",
+    "market_cap", "market_cap_rank", "total_volume", "fetched_at"
+]
+_MISSING = float("nan")  # what json_normalize puts in for an absent key
+
+
+def encode_raw_json(json_list, trim: bool = False):
+    """
+    Serialize each raw record once. The JSON text goes to load as-is and is cast to
+    JSONB by Postgres, so there is no parse/re-serialize step downstream.
+    """
+    if trim:
+        return [_json_encode({k: v for k, v in rec.items() if k not in RAW_TRIM_FIELDS}) for rec in json_list]
+    return [_json_encode(rec) for rec in json_list]
+
+
+def _columns_normalize(json_list) -> pd.DataFrame:
     df = pd.json_normalize(json_list)
+    # reindex (not df[...]) so a key missing from every record becomes a NaN column
+    return df.reindex(columns=list(KEEP_FIELDS.keys())).rename(columns=KEEP_FIELDS)
 
-    keep = {
-        "id": "symbol",
-        "name": "name",
-        "current_price": "price_usd",
-        "market_cap": "market_cap_usd",
-        "total_volume": "total_volume",
-        "circulating_supply": "circulating_supply",
-        "last_updated": "snapshot_time",
-        "market_cap_rank": "market_cap_rank",
-        "price_change_24h": "price_change_24h",
-        "price_change_percentage_24h": "price_change_percentage_24h",
-    }
-
-    df = df[list(keep.keys())].rename(columns=keep)
-
-    numeric_cols = [
-        "price_usd", "market_cap_usd", "total_volume",
-        "circulating_supply", "market_cap_rank",
-        "price_change_24h", "price_change_percentage_24h"
-    ]
-    for c in numeric_cols:
+
+def _fast_column(json_list, key: str) -> pd.Series:
+    vals = [rec.get(key, _MISSING) for rec in json_list]
+    col = pd.Series(vals)
+    if col.dtype == object:
+        # json_normalize flattens a nested dict into "key.sub" columns and leaves `key`
+        # itself missing; do the same so both engines agree
+        nested = [type(v) is dict for v in vals]
+        if any(nested):
+            col = pd.Series([_MISSING if n else v for v, n in zip(vals, nested)])
+    return col
+
+
+def _columns_fast(json_list) -> pd.DataFrame:
+    # one list comprehension per kept key; nested fields (roi.*, image, ...) are never touched
+    return pd.DataFrame({out: _fast_column(json_list, key) for key, out in KEEP_FIELDS.items()})
+
+
+def _market_frame(json_list, engine: str | None = None) -> pd.DataFrame:
+    # kept fields as typed columns; shared by the snapshot and the quote transforms
+    engine = (engine or TRANSFORM_ENGINE).lower()
+    if engine not in TRANSFORM_ENGINES:
+        raise ValueError(f"Unknown transform engine {engine!r}; expected one of {TRANSFORM_ENGINES}")
+    # empty input goes through json_normalize so the (all-NaN) column dtypes match
+    df = _columns_fast(json_list) if engine == "fast" and json_list else _columns_normalize(json_list)
+
+    for c in NUMERIC_COLUMNS:
         df[c] = pd.to_numeric(df[c], errors="coerce")
 
     df["snapshot_time"] = pd.to_datetime(df["snapshot_time"], utc=True)
     df["fetched_at"] = pd.Timestamp.now(tz=timezone.utc)
-    df["raw_json"] = [json.dumps(rec) for rec in json_list]
+    return df
+
+
+def transform_market_response(json_list, trim_raw: bool | None = None, engine: str | None = None):
+    df = _market_frame(json_list, engine)
+    df["raw_json"] = encode_raw_json(json_list, trim=RAW_JSON_TRIM if trim_raw is None else trim_raw)
 
     df = df.drop_duplicates(subset=["symbol", "snapshot_time"])
 
-    cols = [
-        "symbol", "name", "snapshot_time", "price_usd",
-        "price_change_24h", "price_change_percentage_24h",
-        "market_cap_usd", "market_cap_rank",
-        "total_volume", "circulating_supply",
-        "fetched_at", "raw_json"
+    return df[OUTPUT_COLUMNS]
+
+
+def transform_quotes(payloads: dict, engine: str | None = None) -> pd.DataFrame:
+    """
+    {vs_currency: /coins/markets records} -> one crypto_price_quotes frame. All currencies
+    go through a single column extraction (the payloads are concatenated), so the cost
+    follows the number of records, not the number of currencies. No raw_json: the raw
+    payloads are archived per currency by the extractor.
+    """
+    records, currencies = [], []
+    for cur, recs in payloads.items():
+        records.extend(recs)
+        currencies.extend([cur.lower()] * len(recs))
+    df = _market_frame(records, engine).rename(columns=QUOTE_RENAMES)
+    df["vs_currency"] = pd.Series(currencies, index=df.index, dtype=object)
+    df = df.drop_duplicates(subset=["symbol", "vs_currency", "snapshot_time"])
+
+    return df[QUOTE_COLUMNS]
+
+
+def transform_market_chart(coin_id: str, payload: dict, name: str | None = None) -> pd.DataFrame:
+    """
+    Normalize one /coins/{id}/market_chart/range payload into the transform_market_response
+    columns: one row per timestamp, with price/market cap/volume filled in and the other
+    market fields left empty (the history endpoint does not return them).
+    """
+    points: dict = {}
+    for key, col in (("prices", "price_usd"), ("market_caps", "market_cap_usd"), ("total_volumes", "total_volume")):
+        # the three series usually share timestamps, but not always
+        for ts_ms, value in payload.get(key) or []:
+            points.setdefault(ts_ms, {})[col] = value
+    stamps = sorted(points)
+
+    df = pd.DataFrame({
+        "symbol": [coin_id] * len(stamps),
+        "name": [name] * len(stamps),
+        "snapshot_time": pd.to_datetime(pd.Series(stamps, dtype="int64"), unit="ms", utc=True),
+    })
+    for c in NUMERIC_COLUMNS:
+        df[c] = pd.to_numeric(pd.Series([points[t].get(c) for t in stamps], dtype=object), errors="coerce")
+    df["fetched_at"] = pd.Timestamp.now(tz=timezone.utc)
+    df["raw_json"] = [
+        _json_encode({"id": coin_id, "source": "market_chart", "timestamp": t, **points[t]}) for t in stamps
     ]
+    df = df.drop_duplicates(subset=["symbol", "snapshot_time"])
 
-    return df[cols]
+    return df[OUTPUT_COLUMNS]
+
+
+# -------------------------
+# Streaming helpers
+# -------------------------
+def iter_record_chunks(records, chunk_size: int):
+    """Group any iterable of raw records into lists of at most chunk_size records."""
+    chunk = []
+    for rec in records:
+        chunk.append(rec)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class ChunkDeduplicator:
+    """
+    Drops rows whose (symbol, snapshot_time) repeats across chunk boundaries, e.g. a coin
+    that moved from one /coins/markets page to the next between requests. Only the newest
+    snapshot_time per symbol is remembered, so memory is bounded by the number of coins,
+    not by the length of the stream. A row older than that (out-of-order raw files) is let
+    through: the upsert is idempotent, so at worst a key is written twice.
+    """
+
+    def __init__(self):
+        self.latest: dict = {}  # symbol -> newest snapshot_time seen
+
+    def filter(self, df: pd.DataFrame) -> pd.DataFrame:
+        if len(df) == 0:
+            return df
+        dup = (df["symbol"].map(self.latest) == df["snapshot_time"]).to_numpy()
+        for symbol, ts in df.groupby("symbol")["snapshot_time"].max().dropna().items():
+            prev = self.latest.get(symbol)
+            if prev is None or ts > prev:
+                self.latest[symbol] = ts
+        return df[~dup] if dup.any() else df
 
 
 # -------------------------
 # CLI execution
 # -------------------------
-def main():
-    # 1) Determine which file to load
-    if len(sys.argv) > 1:
-        raw_path = sys.argv[1]
-    else:
-        files = sorted(glob("data/raw_coingecko_*.json"))
-        if not files:
-            print("❌ No raw_coingecko_*.json files found in data/. Run extractor first.")
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Transform raw CoinGecko payloads into the snapshot CSV.")
+    parser.add_argument("raw_path", nargs="?", help="raw file (.ndjson.gz or .json); default: latest archived file")
+    parser.add_argument("--since", help="ISO time; transform every archived file overlapping [since, until]")
+    parser.add_argument("--until", help="ISO time; see --since")
+    parser.add_argument("--engine", choices=TRANSFORM_ENGINES, default=TRANSFORM_ENGINE,
+                        help="pandas (json_normalize) or fast (columnar key extraction)")
+    args = parser.parse_args(argv)
+
+    # 1) Determine which file(s) to load
+    if args.raw_path:
+        raw_paths = [args.raw_path]
+    elif args.since or args.until:
+        raw_paths = [archive.entry_path(e) for e in archive.find_entries(args.since, args.until)]
+        if not raw_paths:
+            print("❌ No archived files overlap the requested time range.")
             sys.exit(1)
-        raw_path = files[-1]  # latest file
+    else:
+        entry = archive.latest_entry()
+        if entry is not None:
+            raw_paths = [archive.entry_path(entry)]  # latest file, from the manifest
+        else:
+            # pre-archive layout: flat data/raw_coingecko_<ts>.json files. The digit keeps out
+            # other currencies' raw_coingecko_<cur>_<ts>.json, which would sort last
+            files = sorted(glob("data/raw_coingecko_[0-9]*.json"))
+            if not files:
+                print("❌ No archived or raw_coingecko_*.json files found in data/. Run extractor first.")
+                sys.exit(1)
+            raw_paths = [files[-1]]  # latest file
 
-    if not os.path.exists(raw_path):
-        print(f"❌ File does not exist: {raw_path}")
-        sys.exit(1)
+    json_list = []
+    for raw_path in raw_paths:
+        if not os.path.exists(raw_path):
+            print(f"❌ File does not exist: {raw_path}")
+            sys.exit(1)
 
-    # 2) Load JSON
-    with open(raw_path, "r", encoding="utf-8") as f:
+        # 2) Load JSON
         try:
-            json_list = json.load(f)
+            json_list.extend(archive.iter_records(raw_path))
         except Exception as e:
             print(f"❌ Failed to parse JSON from {raw_path}: {e}")
             sys.exit(1)
 
-    if not isinstance(json_list, list):
-        print("❌ Expected JSON list (array). Got:", type(json_list))
-        sys.exit(1)
-
     # 3) Transform
-    df = transform_market_response(json_list)
+    df = transform_market_response(json_list, engine=args.engine)
 
     # 4) Output
     os.makedirs("data", exist_ok=True)
@@ -99,7 +272,7 @@ def main():
     df.to_csv(out_path, index=False)
 
     print("\n✅ Transform completed.")
-    print("Input JSON :", raw_path)
+    print("Input      :", raw_paths[0] if len(raw_paths) == 1 else f"{len(raw_paths)} archived files")
     print("Output CSV :", out_path)
     print(f"Rows       : {len(df)}")
     print("\nPreview:")
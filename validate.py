@@ -0,0 +1,256 @@
+# validate.py
+"""
+Data-quality checks between transform and load.
+
+Every rule is a vectorized check over whole columns (numpy/pandas masks, no per-row
+Python), so validating a batch costs a few array passes. A row that fails any rule is
+held back from the load and written to crypto_price_quarantine, tagged with the rules it
+failed and the run_id; the per-rule counts go on the run's etl_runs row (validation JSONB).
+
+Rules:
+  missing_key         symbol or snapshot_time is empty (would violate NOT NULL anyway)
+  missing_price       price_usd is empty (null from the API, or coerced from junk like "N/A")
+  negative_price      price_usd < 0
+  negative_market_cap market_cap_usd < 0
+  negative_volume     total_volume < 0
+  negative_supply     circulating_supply < 0
+  rank_out_of_range   market_cap_rank outside [1, VALIDATE_MAX_RANK]
+  stale_snapshot      snapshot_time older than VALIDATE_MAX_AGE_HOURS
+  future_snapshot     snapshot_time more than VALIDATE_FUTURE_SECONDS ahead of now
+  price_jump          price moved more than VALIDATE_MAX_JUMP (fraction) from the last loaded
+                      price in latest_prices AND from the last price quarantined for price_jump
+                      alone (so after a real move the second run at the new level gets through,
+                      while a one-off spike does not become the baseline). Baselines older than
+                      VALIDATE_JUMP_BASELINE_HOURS are ignored (e.g. after a day of downtime).
+
+Usage:
+  python validate.py data/archive/dt=2025-11-13/raw_coingecko_20251113T135826Z.ndjson.gz [--max-age-hours 0]
+"""
+
+import os
+import sys
+import json
+import logging
+import argparse
+from datetime import timedelta, timezone
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+QUARANTINE_TABLE = "crypto_price_quarantine"
+VALIDATE = os.getenv("ETL_VALIDATE", "1").lower() not in ("0", "false", "no")
+MAX_AGE_HOURS = float(os.getenv("VALIDATE_MAX_AGE_HOURS", "24"))  # 0 disables stale_snapshot
+FUTURE_SECONDS = float(os.getenv("VALIDATE_FUTURE_SECONDS", "300"))
+MAX_JUMP = float(os.getenv("VALIDATE_MAX_JUMP", "0.5"))  # 0.5 = +/-50% vs last price; 0 disables
+MAX_RANK = int(os.getenv("VALIDATE_MAX_RANK", "100000"))
+# expressions of the uq_quarantine_row unique index (db_init.sql)
+_QUARANTINE_KEY = "COALESCE(symbol, ''), COALESCE(snapshot_time, '-infinity'), failed_rules"
+JUMP_BASELINE_HOURS = float(os.getenv("VALIDATE_JUMP_BASELINE_HOURS", "24"))  # 0 = any age
+
+
+def _floats(df: pd.DataFrame, col: str) -> np.ndarray:
+    return df[col].to_numpy(dtype="float64", na_value=np.nan)
+
+
+# rule name -> mask of failing rows; ctx carries "now", the thresholds and "last_prices"
+def _missing_key(df, ctx):
+    return (df["symbol"].isna() | df["snapshot_time"].isna()).to_numpy()
+
+
+def _missing_price(df, ctx):
+    return np.isnan(_floats(df, "price_usd"))
+
+
+def _negative(col):
+    def rule(df, ctx):
+        return _floats(df, col) < 0  # NaN compares False
+    return rule
+
+
+def _rank_out_of_range(df, ctx):
+    rank = _floats(df, "market_cap_rank")
+    return (rank < 1) | (rank > ctx["max_rank"])
+
+
+def _stale_snapshot(df, ctx):
+    if not ctx["max_age_hours"]:
+        return np.zeros(len(df), dtype=bool)
+    return (df["snapshot_time"] < ctx["now"] - timedelta(hours=ctx["max_age_hours"])).to_numpy()
+
+
+def _future_snapshot(df, ctx):
+    return (df["snapshot_time"] > ctx["now"] + timedelta(seconds=ctx["future_seconds"])).to_numpy()
+
+
+def _jumped(df, baseline, max_jump):
+    # (has a baseline, moved more than max_jump from it)
+    base = df["symbol"].map(baseline).to_numpy(dtype="float64", na_value=np.nan)
+    price = _floats(df, "price_usd")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        change = np.abs(price / base - 1)
+    return base > 0, change > max_jump
+
+
+def _price_jump(df, ctx):
+    last_prices = ctx["last_prices"]
+    if not last_prices or not ctx["max_jump"]:
+        return np.zeros(len(df), dtype=bool)
+    has_last, jumped = _jumped(df, last_prices, ctx["max_jump"])
+    failed = has_last & jumped
+    if ctx["recent_prices"]:
+        # confirmed by the previous (quarantined) observation -> the move is real
+        has_recent, jumped_recent = _jumped(df, ctx["recent_prices"], ctx["max_jump"])
+        failed &= ~(has_recent & ~jumped_recent)
+    return failed
+
+
+RULES: Dict[str, Callable[[pd.DataFrame, dict], np.ndarray]] = {
+    "missing_key": _missing_key,
+    "missing_price": _missing_price,
+    "negative_price": _negative("price_usd"),
+    "negative_market_cap": _negative("market_cap_usd"),
+    "negative_volume": _negative("total_volume"),
+    "negative_supply": _negative("circulating_supply"),
+    "rank_out_of_range": _rank_out_of_range,
+    "stale_snapshot": _stale_snapshot,
+    "future_snapshot": _future_snapshot,
+    "price_jump": _price_jump,
+}
+
+
+def validate_df(df: pd.DataFrame, last_prices: Optional[Dict[str, float]] = None, now=None,
+                max_age_hours: float = MAX_AGE_HOURS, future_seconds: float = FUTURE_SECONDS,
+                max_jump: float = MAX_JUMP, max_rank: int = MAX_RANK,
+                rules: Optional[Iterable[str]] = None,
+                recent_prices: Optional[Dict[str, float]] = None) -> Tuple[pd.DataFrame, pd.DataFrame, Dict[str, int]]:
+    """
+    Split a transform_market_response frame into (good, bad, counts).
+    bad carries an extra failed_rules column (comma-joined rule names, e.g.
+    "negative_price,negative_market_cap"); counts has one entry per rule plus "checked" and
+    "quarantined". last_prices: {symbol: last loaded price_usd} and recent_prices: {symbol:
+    last price quarantined by price_jump alone}, the price_jump baselines (see jump_baselines).
+    """
+    ctx = {
+        "now": pd.Timestamp(now) if now is not None else pd.Timestamp.now(tz=timezone.utc),
+        "max_age_hours": max_age_hours, "future_seconds": future_seconds,
+        "max_jump": max_jump, "max_rank": max_rank, "last_prices": last_prices,
+        "recent_prices": recent_prices,
+    }
+    names = list(rules) if rules is not None else list(RULES)
+    masks = {name: RULES[name](df, ctx) for name in names}
+    failed = np.zeros(len(df), dtype=bool)
+    for m in masks.values():
+        failed |= m
+
+    counts = {name: int(m.sum()) for name, m in masks.items()}
+    counts["checked"] = len(df)
+    counts["quarantined"] = int(failed.sum())
+    if not failed.any():
+        return df, df.iloc[:0].assign(failed_rules=pd.Series([], dtype=object)), counts
+
+    # labels are built one rule at a time over the failing rows (array concatenation, no row loop)
+    bad = df[failed].copy()
+    labels = np.full(len(bad), "", dtype=object)
+    for name, m in masks.items():
+        if counts[name]:
+            m = m[failed]
+            labels[m] = labels[m] + ("," + name)
+    bad["failed_rules"] = pd.Series(labels, index=bad.index, dtype=object).str[1:]
+    return df[~failed], bad, counts
+
+
+def drop_quarantined(quotes: Optional[pd.DataFrame], bad: pd.DataFrame) -> Optional[pd.DataFrame]:
+    """
+    Leave the coins quarantined from the usd snapshot out of a transform_quotes batch too
+    (its usd rows are the same records). Matched on symbol, not (symbol, snapshot_time):
+    each currency is a separate request and may carry a slightly different last_updated.
+    """
+    if quotes is None or bad is None or len(bad) == 0:
+        return quotes
+    return quotes[~quotes["symbol"].isin(bad["symbol"])]
+
+
+def merge_counts(total: Dict[str, int], counts: Dict[str, int]) -> Dict[str, int]:
+    """Add one batch's counts into a running total (streaming mode: one batch per chunk)."""
+    for k, v in counts.items():
+        total[k] = total.get(k, 0) + v
+    return total
+
+
+def jump_baselines(symbols, conn=None, max_age_hours: float = JUMP_BASELINE_HOURS
+                   ) -> Tuple[Dict[str, float], Dict[str, float]]:
+    """
+    price_jump baselines for the symbols in a batch, as (last_prices, recent_prices):
+    price_usd from latest_prices, and the newest price quarantined for price_jump alone (a
+    real observation the rule held back). Snapshots older than max_age_hours are left out.
+    ({}, {}) if unavailable.
+    """
+    from load import dbapi_cursor
+    from prices import LATEST_TABLE
+    symbols = [s for s in pd.unique(pd.Series(symbols, dtype=object)) if isinstance(s, str)]
+    if not symbols:
+        return {}, {}
+    cutoff = (pd.Timestamp.now(tz=timezone.utc) - timedelta(hours=max_age_hours) if max_age_hours
+              else pd.Timestamp(0, tz=timezone.utc)).to_pydatetime()
+    try:
+        with dbapi_cursor(conn) as cur:
+            cur.execute(f"SELECT symbol, price_usd FROM {LATEST_TABLE} "
+                        f"WHERE symbol = ANY(%s) AND price_usd IS NOT NULL AND snapshot_time >= %s",
+                        (symbols, cutoff))
+            last = {s: float(p) for s, p in cur.fetchall()}
+            cur.execute(f"SELECT DISTINCT ON (symbol) symbol, price_usd FROM {QUARANTINE_TABLE} "
+                        f"WHERE symbol = ANY(%s) AND failed_rules = ARRAY['price_jump'] "
+                        f"AND price_usd IS NOT NULL AND snapshot_time >= %s "
+                        f"ORDER BY symbol, snapshot_time DESC", (symbols, cutoff))
+            recent = {s: float(p) for s, p in cur.fetchall()}
+        return last, recent
+    except Exception as e:
+        # no baseline (e.g. tables not created yet): price_jump just has nothing to compare to
+        logging.warning("price_jump check skipped, could not read baselines: %s", e)
+        return {}, {}
+
+
+def quarantine(bad: pd.DataFrame, run_id: Optional[str] = None, conn=None, page_size: int = 1000) -> int:
+    """
+    Bulk-insert failing rows (snapshot columns + failed_rules + run_id) into
+    crypto_price_quarantine. A row already quarantined for the same rules (same symbol and
+    snapshot_time) is not stored again. Returns the number of rows offered.
+    """
+    from psycopg2.extras import execute_values
+    from load import UPSERT_COLUMNS, dbapi_cursor, df_to_rows
+    if bad is None or bad.shape[0] == 0:
+        return 0
+    cols = UPSERT_COLUMNS + ["failed_rules", "run_id"]
+    template = ("(" + ", ".join("%s::jsonb" if c == "raw_json" else "%s" for c in UPSERT_COLUMNS)
+                + ", string_to_array(%s, ','), %s::uuid)")
+    rows = (row + (rules, run_id) for row, rules in zip(df_to_rows(bad), bad["failed_rules"].tolist()))
+    with dbapi_cursor(conn) as cur:
+        execute_values(cur, f"INSERT INTO {QUARANTINE_TABLE} ({', '.join(cols)}) VALUES %s "
+                            f"ON CONFLICT ({_QUARANTINE_KEY}) DO NOTHING",
+                       rows, template=template, page_size=page_size)
+    return len(bad)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the validation rules over a raw payload file (no DB writes).")
+    parser.add_argument("raw_path", help="raw file (.ndjson.gz or .json)")
+    parser.add_argument("--max-age-hours", type=float, default=MAX_AGE_HOURS,
+                        help="stale_snapshot threshold (0 disables; useful for old files)")
+    parser.add_argument("--last-prices", action="store_true", help="price_jump against latest_prices and recent quarantined prices (needs DATABASE_URL)")
+    parser.add_argument("--show", type=int, default=10, help="print this many failing rows")
+    args = parser.parse_args(argv)
+
+    import archive
+    from transform import transform_market_response
+    df = transform_market_response(archive.read_records(args.raw_path))
+    last, recent = jump_baselines(df["symbol"]) if args.last_prices else (None, None)
+    good, bad, counts = validate_df(df, last_prices=last, recent_prices=recent, max_age_hours=args.max_age_hours)
+    print(json.dumps(counts, indent=2))
+    if len(bad):
+        print(bad[["symbol", "snapshot_time", "price_usd", "failed_rules"]].head(args.show).to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())